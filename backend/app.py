@@ -1,13 +1,26 @@
-from flask import Flask, request, jsonify, session, redirect, url_for, render_template
+from flask import Flask, request, jsonify, redirect, url_for, render_template, send_file
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
 import os
-from pyngrok import ngrok
+import io
 from supabase import create_client, Client
 import secrets  
+from concurrent.futures import ThreadPoolExecutor
 from utils.supabase_handler import *
 
 # LOCAL IMPORTS
 from utils.main_functions import *
+from utils.cache_handler import content_cache
+from utils.response_encoding import install_json_provider, compress_response, shape_search_result
+from utils.metrics import render_metrics, start_breakdown
+from utils.profiler import profile_request, list_profiles, artifact_path
+from contextlib import nullcontext
+from utils.admission import search_admission, search_identity, may_force_full_fanout, Rejected, TRUSTED_PROXY_HOPS
+from utils.proxy_scheduler import proxy_scheduler
+from utils.product_catalog import product_catalog
+from utils.platform_router import platform_router
+from utils.basket_optimizer import optimize_basket, basket_lines, BASKET_MAX_LINES
+from utils.auth_tokens import issue_token, revoke_token, current_claims, admin_required, ADMIN_TOKEN_COOKIE, ADMIN_TOKEN_TTL
 
 load_dotenv()
 
@@ -16,7 +29,86 @@ key: str = os.environ.get("SUPABASE_KEY")
 supabase: Client = create_client(url, key)
 
 app = Flask(__name__)
+if TRUSTED_PROXY_HOPS:
+    # Client addresses (rate-limit keys) come from X-Forwarded-For set by the proxies in front.
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", secrets.token_hex(16))
+install_json_provider(app)
+
+@app.after_request
+def compress_json_response(response):
+    return compress_response(response, request.headers.get('Accept-Encoding'))
+
+# --- Home content cache ---
+# Offers, background images, daily needs and trending rows change only through
+# the admin routes below, which invalidate the matching key after each write.
+
+def load_offers():
+    return supabase.table('offers').select("id, image_url, price, created_at").order('created_at', desc=False).execute().data or []
+
+def load_bg_images():
+    return supabase.table('bgimage').select("id, image_url").order('created_at', desc=False).execute().data or []
+
+def load_daily_needs():
+    return supabase.table('daily_needs').select("id, image_url, price, created_at").order('created_at', desc=False).execute().data or []
+
+def load_trending_and_daily_needs():
+    return select_data("trending_and_daily_needs")
+
+CONTENT_LOADERS = {
+    "offers": load_offers,
+    "bg_image": load_bg_images,
+    "daily_needs": load_daily_needs,
+    "trending_and_daily_needs": load_trending_and_daily_needs,
+}
+
+HOME_FEED_SOURCES = ("trending_and_daily_needs", "offers", "bg_image", "daily_needs")
+
+def load_home_feed():
+    # Fetch the uncached pieces concurrently; each one is also cached on its own.
+    with ThreadPoolExecutor(max_workers=len(HOME_FEED_SOURCES)) as executor:
+        futures = {key: executor.submit(content_cache.get, key, CONTENT_LOADERS[key]) for key in HOME_FEED_SOURCES}
+        rows = {key: future.result()[0] for key, future in futures.items()}
+    tanddn_data = format_tanddn(rows["trending_and_daily_needs"])
+    # Only the fields the home screen renders
+    return {
+        "trending": tanddn_data["trending"],
+        "daily_needs_products": tanddn_data["daily_needs"],
+        "offers": [{"image_url": i["image_url"], "price": i["price"]} for i in rows["offers"]],
+        "bg_images": [i["image_url"] for i in rows["bg_image"]],
+        "daily_needs": [{"image_url": i["image_url"], "price": i["price"]} for i in rows["daily_needs"]],
+    }
+
+CONTENT_LOADERS["home_feed"] = load_home_feed
+content_cache.add_dependency("home_feed", *HOME_FEED_SOURCES)
+
+def cached_content_response(key, shape=None, variant=""):
+    """JSON response for cached content, or 304 when the client's ETag still matches."""
+    data, etag = content_cache.get(key, CONTENT_LOADERS[key])
+    if shape is not None:
+        data = shape(data)
+    if variant:
+        etag = f"{etag}-{variant}"
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(data)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route("/healthz", methods=["GET"])
+def liveness():
+    return jsonify({"status": "alive"})
+
+@app.route("/readyz", methods=["GET"])
+def readiness():
+    ready, components = get_readiness()
+    return jsonify({"status": "ready" if ready else "warming_up", "components": components}), 200 if ready else 503
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return app.response_class(render_metrics(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/send-otp", methods=["POST"])
 def send_otp():
@@ -30,10 +122,25 @@ def confirm_otp():
 def autocomplete():
     data = request.get_json()
     query = data.get("query")
+    mode = data.get("mode", "prefix")
     if not query:
         return jsonify({"status": "error", "message": "Query parameter is required", "data": []}), 400
+    elif mode not in ("prefix", "fuzzy", "semantic"):
+        return jsonify({"status": "error", "message": "mode must be 'prefix', 'fuzzy' or 'semantic'", "data": []}), 400
     else:
-        return jsonify({"status": "success", "data": get_suggestions(query)})
+        return jsonify({"status": "success", "data": get_suggestions(query, mode=mode)})
+
+@app.route("/price-history", methods=["POST"])
+def price_history_route():
+    data = request.get_json()
+    product_key = data.get("product_key") or (canonical_product_key(data["name"], data.get("quantity")) if data.get("name") else None)
+    if not product_key:
+        return jsonify({"status": "error", "message": "name or product_key is required"}), 400
+    try:
+        days = min(int(data.get("days", 30)), 365)
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "days must be a number"}), 400
+    return jsonify({"status": "success", "data": get_price_history(product_key, data.get("platform"), data.get("lat"), data.get("lon"), days)})
 
 @app.route("/login", methods=["POST"])
 def login_to_supabase():
@@ -46,7 +153,10 @@ def login_to_supabase():
     try:
         response = login(number=username, password=password)
         if response['status'] == "success":
-            return jsonify({"status": "success", "message": "Login successful"}), 200
+            user = response['user']
+            # The app sends this as a Bearer token; verifying it needs no database lookup.
+            token, claims = issue_token(user['id'], "user", mobile=user['mobile'], premium=bool(user.get('is_premium')))
+            return jsonify({"status": "success", "message": "Login successful", "token": token, "expires_at": claims["exp"]}), 200
         else:
             return jsonify({"status": "error", "message": "Invalid credentials"}), 401
     except Exception as e:
@@ -71,9 +181,19 @@ def signup_to_supabase():
 
 @app.route("/trending", methods=["POST"])
 def get_trending_and_daily_needs():
-    return jsonify(tanddn())    
+    try:
+        return cached_content_response("trending_and_daily_needs", shape=tanddn, variant="app")
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)})
     
 
+@app.route("/home-feed", methods=["GET"])
+def get_home_feed():
+    try:
+        return cached_content_response("home_feed")
+    except Exception as e:
+        return jsonify({"status": "error", "message": "Failed to fetch home feed"}), 500
+
 @app.route("/get-search-results", methods=["POST"])
 def get_search_results():
     data = request.get_json()
@@ -81,14 +201,87 @@ def get_search_results():
     lat = data.get("lat")
     lon = data.get("lon")
     credentials = data.get("credentials", {})
+    compact = bool(data.get("compact") or request.args.get("compact"))
+    fields = data.get("fields") or request.args.get("fields")
+    # Per-stage seconds (geocode, platform.*, credentials.*, embedding, grouping) for debugging
+    breakdown = start_breakdown() if data.get("timings") or request.args.get("timings") else None
+    profile = request.headers.get("X-Profile") or request.args.get("profile")
+    if profile and current_claims("admin") is None:
+        return jsonify({"status": "error", "message": "Profiling requires an admin session"}), 403
 
     print("credentials",credentials)
 
-    # data = get_compared_results(item_name, lat, lon, credentials)
-    data = open("compared.json", "r").read()
-    data = json.loads(data)
-
-    return jsonify({"status": "success", "data": data})
+    key, premium = search_identity(current_claims(), request.remote_addr)
+    try:
+        with search_admission.admit(key, premium), profile_request(f"search {item_name}") if profile else nullcontext() as profiler:
+            # data = get_compared_results(item_name, lat, lon, credentials)
+            data = open("compared.json", "r").read()
+            data = json.loads(data)
+            data = shape_search_result(data, compact=compact, fields=fields)
+    except Rejected as e:
+        response = jsonify({"status": "error", "message": "Too many searches, try again shortly", "reason": e.reason, "retry_after": e.retry_after})
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response, 429
+
+    response = {"status": "success", "data": data}
+    if breakdown is not None:
+        response["timings"] = breakdown
+    if profiler is not None:
+        response["profile"] = profiler.artifact_id
+    return jsonify(response)
+
+@app.route("/get-list-results", methods=["POST"])
+def get_list_results():
+    data = request.get_json()
+    items = data.get("items")
+    lat = data.get("lat")
+    lon = data.get("lon")
+    if not isinstance(items, list) or not items or lat is None or lon is None:
+        return jsonify({"status": "error", "message": "items (a list), lat and lon are required"}), 400
+    if len(items) > LIST_SEARCH_MAX_ITEMS:
+        return jsonify({"status": "error", "message": f"At most {LIST_SEARCH_MAX_ITEMS} items per list"}), 400
+    compact = bool(data.get("compact") or request.args.get("compact"))
+    fields = data.get("fields") or request.args.get("fields")
+    breakdown = start_breakdown() if data.get("timings") or request.args.get("timings") else None
+    full_fanout = bool(data.get("full_fanout"))
+    claims = current_claims()
+    if full_fanout and not may_force_full_fanout(claims):
+        return jsonify({"status": "error", "message": "Full fan-out requires an admin or premium session"}), 403
+
+    # The whole list holds one search slot and spends a rate-limit token per item it searches.
+    key, premium = search_identity(claims, request.remote_addr)
+    try:
+        with search_admission.admit(key, premium, list_search_cost(items, lat, lon, full_fanout)):
+            result = get_compared_list(items, lat, lon, data.get("credentials", {}), full_fanout)
+    except Rejected as e:
+        response = jsonify({"status": "error", "message": "Too many searches, try again shortly", "reason": e.reason, "retry_after": e.retry_after})
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response, 429
+
+    for entry in result["data"]:
+        entry["data"] = shape_search_result(entry["data"], compact=compact, fields=fields)
+    response = {"status": "success", "data": result}
+    if breakdown is not None:
+        response["timings"] = breakdown
+    return jsonify(response)
+
+@app.route("/optimize-basket", methods=["POST"])
+def optimize_basket_route():
+    # basket: one compared group per list item (as /get-list-results returns them), each with an optional count
+    data = request.get_json()
+    basket = data.get("basket")
+    if not isinstance(basket, list) or not basket or not all(isinstance(group, dict) for group in basket):
+        return jsonify({"status": "error", "message": "basket must be a list of compared groups"}), 400
+    if len(basket) > BASKET_MAX_LINES:
+        return jsonify({"status": "error", "message": f"At most {BASKET_MAX_LINES} items per basket"}), 400
+    fees = data.get("fees")
+    if fees is not None and not isinstance(fees, dict):
+        return jsonify({"status": "error", "message": "fees must map stores to their terms"}), 400
+    try:
+        plan = optimize_basket(basket_lines(basket), fees)
+    except (TypeError, ValueError) as e:
+        return jsonify({"status": "error", "message": f"Invalid basket: {e}"}), 400
+    return jsonify({"status": "success", "data": plan})
 
 @app.route("/get-api-key", methods=["POST"])
 def get_api_key_route():
@@ -99,9 +292,17 @@ def get_api_key_route():
 
 @app.route("/admin")
 def admin_panel():
-    if 'admin_username' not in session:
+    claims = current_claims("admin")
+    if claims is None:
         return redirect(url_for('admin_login'))
-    return render_template('admin_panel.html', username=session['admin_username'])
+    return render_template('admin_panel.html', username=claims['username'])
+
+def admin_token_response(username, payload):
+    token, claims = issue_token(username, "admin", username=username)
+    response = jsonify({**payload, "token": token, "expires_at": claims["exp"]})
+    # The panel's page loads and fetches authenticate with this cookie.
+    response.set_cookie(ADMIN_TOKEN_COOKIE, token, max_age=ADMIN_TOKEN_TTL, httponly=True, samesite="Lax", secure=request.is_secure)
+    return response
 
 @app.route("/admin/login", methods=["GET", "POST"])
 def admin_login():
@@ -114,17 +315,30 @@ def admin_login():
             response = supabase.table('admin_users').select("id, username").eq('username', username).eq('password', password).execute()
             if response.data:
                 user = response.data[0]
-                session['admin_username'] = user['username']
-                return jsonify({"status": "success", "message": "Login successful", "username": user['username']})
+                return admin_token_response(user['username'], {"status": "success", "message": "Login successful", "username": user['username']})
             else:
                 return jsonify({"status": "error", "message": "Invalid username or password"}), 401
         except Exception as e:
             return render_template('admin_login.html', error="An error occurred during login. Please try again later."), 500
     return render_template('admin_login.html')
 
+@app.route("/logout", methods=["POST"])
+def logout():
+    """Revoke the presented token (app Bearer token or admin panel cookie)."""
+    claims = current_claims()
+    if claims is not None:
+        revoke_token(claims)
+    response = jsonify({"status": "success", "message": "Logged out"})
+    response.delete_cookie(ADMIN_TOKEN_COOKIE)
+    return response
+
 @app.route("/admin/verify-session", methods=["POST"])
 def verify_admin_session():
-    data = request.get_json()
+    # A valid token settles it without touching the database.
+    claims = current_claims("admin")
+    if claims is not None:
+        return jsonify({"valid": True, "username": claims["username"]})
+    data = request.get_json(silent=True) or {}
     username = data.get("username")
     password = data.get("password")
     if not username or not password:
@@ -132,8 +346,7 @@ def verify_admin_session():
     try:
         response = supabase.table('admin_users').select("id").eq('username', username).eq('password', password).execute()
         if response.data:
-            session['admin_username'] = username 
-            return jsonify({"valid": True})
+            return admin_token_response(username, {"valid": True, "username": username})
         else:
             return jsonify({"valid": False, "message": "Invalid credentials"}), 401 
     except Exception as e:
@@ -142,18 +355,13 @@ def verify_admin_session():
 @app.route('/api/offers', methods=['GET'])
 def get_offers():
     try:
-        response = supabase.table('offers').select("id, image_url, price, created_at").order('created_at', desc=False).execute()
-        if response.data:
-            return jsonify(response.data)
-        else:
-            return jsonify([])
+        return cached_content_response("offers")
     except Exception as e:
         return jsonify({"status": "error", "message": "Failed to fetch offers"}), 500
 
 @app.route('/api/offers', methods=['POST'])
+@admin_required
 def add_offer():
-    if 'admin_username' not in session:
-        return jsonify({"status": "error", "message": "Unauthorized"}), 401
     data = request.get_json()
     if not data or 'image_url' not in data or 'price' not in data:
         return jsonify({"status": "error", "message": "Missing image_url or price"}), 400
@@ -167,6 +375,7 @@ def add_offer():
             "price": price
         }
         response = supabase.table('offers').insert(new_offer_data).execute()
+        content_cache.invalidate("offers")
         if response.data:
             inserted_offer = response.data[0]
             return jsonify({"status": "success", "message": "Offer added", "offer": inserted_offer}), 201
@@ -178,9 +387,8 @@ def add_offer():
         return jsonify({"status": "error", "message": "Failed to save offer"}), 500
     
 @app.route('/api/offers/<int:offer_id>', methods=['PUT'])
+@admin_required
 def update_offer(offer_id):
-    if 'admin_username' not in session:
-        return jsonify({"status": "error", "message": "Unauthorized"}), 401
     data = request.get_json()
     if not data or 'image_url' not in data or 'price' not in data:
         return jsonify({"status": "error", "message": "Missing image_url or price"}), 400
@@ -194,6 +402,7 @@ def update_offer(offer_id):
             "price": price
         }
         response = supabase.table('offers').update(updated_offer_data).eq('id', offer_id).execute()
+        content_cache.invalidate("offers")
         if response.data:
             updated_offer = response.data[0] # Get the updated offer data
             return jsonify({"status": "success", "message": f"Offer {offer_id} updated", "offer": updated_offer})
@@ -210,11 +419,11 @@ def update_offer(offer_id):
         return jsonify({"status": "error", "message": "Failed to update offer"}), 500
 
 @app.route('/api/offers/<int:offer_id>', methods=['DELETE'])
+@admin_required
 def delete_offer(offer_id):
-    if 'admin_username' not in session:
-        return jsonify({"status": "error", "message": "Unauthorized"}), 401
     try:
         response = supabase.table('offers').delete().eq('id', offer_id).execute()
+        content_cache.invalidate("offers")
         if response.data:
             deleted_offer_details = response.data[0] # Supabase returns the deleted record
             return jsonify({"status": "success", "message": f"Offer {offer_id} deleted", "deleted_offer": deleted_offer_details})
@@ -230,17 +439,12 @@ def delete_offer(offer_id):
 @app.route('/api/bg_image', methods=['GET'])
 def get_bg_image():
     try:
-        response = supabase.table('bgimage').select("id, image_url").order('created_at', desc=False).execute()
-        if response.data:
-            return jsonify(response.data)
-        else:
-            return jsonify([])
+        return cached_content_response("bg_image")
     except Exception as e:
         return jsonify({"status": "error", "message": "Failed to fetch slideshow items"}), 500
 @app.route('/api/bg_image/<int:bg_id>', methods=['PUT'])
+@admin_required
 def update_bg_image(bg_id):
-    if 'admin_username' not in session:
-        return jsonify({"status": "error", "message": "Unauthorized"}), 401
     data = request.get_json()
     if not data or 'image_url' not in data:
         return jsonify({"status": "error", "message": "Missing image_url"}), 400
@@ -249,6 +453,7 @@ def update_bg_image(bg_id):
         if not image_url:
             return jsonify({"status": "error", "message": "Image URL cannot be empty"}), 400
         updated = supabase.table('bgimage').update({"image_url": image_url}).eq('id', bg_id).execute()
+        content_cache.invalidate("bg_image")
         if updated.data:
             return jsonify({"status": "success", "message": "Background image updated", "item": updated.data[0]})
         else:
@@ -266,18 +471,13 @@ def update_bg_image(bg_id):
 @app.route('/api/daily_needs', methods=['GET'])
 def get_daily_needs_items():
     try:
-        response = supabase.table('daily_needs').select("id, image_url, price, created_at").order('created_at', desc=False).execute()
-        if response.data:
-            return jsonify(response.data)
-        else:
-            return jsonify([])
+        return cached_content_response("daily_needs")
     except Exception as e:
         return jsonify({"status": "error", "message": "Failed to fetch Daily Needs items"}), 500
 
 @app.route('/api/daily_needs', methods=['POST'])
+@admin_required
 def add_daily_needs_item():
-    if 'admin_username' not in session:
-        return jsonify({"status": "error", "message": "Unauthorized"}), 401
     data = request.get_json()
     if not data or 'image_url' not in data or 'price' not in data:
         return jsonify({"status": "error", "message": "Missing image_url or price"}), 400
@@ -291,6 +491,7 @@ def add_daily_needs_item():
             "price": price
         }
         response = supabase.table('daily_needs').insert(new_item_data).execute()
+        content_cache.invalidate("daily_needs")
 
         if response.data:
             inserted_item = response.data[0]
@@ -304,9 +505,8 @@ def add_daily_needs_item():
         return jsonify({"status": "error", "message": "Failed to save Daily Needs item"}), 500
 
 @app.route('/api/daily_needs/<int:item_id>', methods=['PUT'])
+@admin_required
 def update_daily_needs_item(item_id):
-    if 'admin_username' not in session:
-        return jsonify({"status": "error", "message": "Unauthorized"}), 401
     data = request.get_json()
     if not data or 'image_url' not in data or 'price' not in data:
          return jsonify({"status": "error", "message": "Missing image_url or price"}), 400
@@ -320,6 +520,7 @@ def update_daily_needs_item(item_id):
             "price": price
         }
         response = supabase.table('daily_needs').update(updated_item_data).eq('id', item_id).execute()
+        content_cache.invalidate("daily_needs")
 
         if response.data:
             updated_item = response.data[0]
@@ -336,11 +537,11 @@ def update_daily_needs_item(item_id):
         return jsonify({"status": "error", "message": "Failed to update Daily Needs item"}), 500
     
 @app.route('/api/daily_needs/<int:item_id>', methods=['DELETE'])
+@admin_required
 def delete_daily_needs_item(item_id):
-    if 'admin_username' not in session:
-        return jsonify({"status": "error", "message": "Unauthorized"}), 401
     try:
         response = supabase.table('daily_needs').delete().eq('id', item_id).execute()
+        content_cache.invalidate("daily_needs")
         if response.data:
             deleted_item_details = response.data[0]
             return jsonify({"status": "success", "message": f"Daily Needs item {item_id} deleted", "deleted_item": deleted_item_details})
@@ -356,23 +557,21 @@ def delete_daily_needs_item(item_id):
 # =================== NEW TRENDING PRODUCTS & DAILY NEEDS (UNIFIED TABLE) ===================
 
 @app.route('/api/trending_products', methods=['GET'])
+@admin_required
 def get_trending_products():
-    if 'admin_username' not in session:
-        return jsonify({"status": "error", "message": "Unauthorized"}), 401
     try:
-        filters = {"column_type": "trending"}
-        print("Fetching trending products with filters:", filters)
-        data = select_data("trending_and_daily_needs", filters)
-        print("Trending products fetched from DB:", data)
-        return jsonify(data)
+        return cached_content_response(
+            "trending_and_daily_needs",
+            shape=lambda rows: [i for i in rows if i['column_type'] == "trending"],
+            variant="trending"
+        )
     except Exception as e:
         print("Error fetching trending products:", e)
         return jsonify({"status": "error", "message": "Failed to fetch trending products"}), 500
 
 @app.route('/api/trending_products', methods=['POST'])
+@admin_required
 def add_trending_product():
-    if 'admin_username' not in session:
-        return jsonify({"status": "error", "message": "Unauthorized"}), 401
     data = request.get_json()
     print("Add trending product request data:", data)
     if not data or 'image_url' not in data or 'name' not in data:
@@ -384,15 +583,15 @@ def add_trending_product():
             "column_type": "trending"
         }
         inserted = insert_data("trending_and_daily_needs", new_data)
+        content_cache.invalidate("trending_and_daily_needs")
         return jsonify({"status": "success", "message": "Trending product added", "item": inserted}), 201
     except Exception as e:
         print("Error adding trending product:", e)
         return jsonify({"status": "error", "message": "Failed to add trending product"}), 500
 
 @app.route('/api/trending_products/<int:item_id>', methods=['PUT'])
+@admin_required
 def update_trending_product(item_id):
-    if 'admin_username' not in session:
-        return jsonify({"status": "error", "message": "Unauthorized"}), 401
     data = request.get_json()
     print(f"Update trending product {item_id} data:", data)
     if not data or 'image_url' not in data or 'name' not in data:
@@ -403,21 +602,22 @@ def update_trending_product(item_id):
             {"id": item_id, "column_type": "trending"},
             {"image_url": data['image_url'].strip(), "name": data['name'].strip()}
         )
+        content_cache.invalidate("trending_and_daily_needs")
         return jsonify({"status": "success", "message": "Trending product updated", "item": updated})
     except Exception as e:
         print(f"Error updating trending product {item_id}:", e)
         return jsonify({"status": "error", "message": "Failed to update trending product"}), 500
 
 @app.route('/api/trending_products/<int:item_id>', methods=['DELETE'])
+@admin_required
 def delete_trending_product(item_id):
     print(f"Delete trending product {item_id} request")
-    if 'admin_username' not in session:
-        return jsonify({"status": "error", "message": "Unauthorized"}), 401
     try:
         deleted = delete_data(
             "trending_and_daily_needs",
             {"id": item_id, "column_type": "trending"}
         )
+        content_cache.invalidate("trending_and_daily_needs")
         return jsonify({"status": "success", "message": "Trending product deleted", "item": deleted})
     except Exception as e:
         print(f"Error deleting trending product {item_id}:", e)
@@ -426,22 +626,21 @@ def delete_trending_product(item_id):
 # ------------------- DAILY NEEDS (from unified table) -------------------
 
 @app.route('/api/daily_needs_items', methods=['GET'])
+@admin_required
 def get_daily_needs_items_new():
-    if 'admin_username' not in session:
-        return jsonify({"status": "error", "message": "Unauthorized"}), 401
     try:
-        filters = {"column_type": "daily needs"}
-        print("Fetching daily needs with filters:", filters)
-        data = select_data("trending_and_daily_needs", filters)
-        return jsonify(data)
+        return cached_content_response(
+            "trending_and_daily_needs",
+            shape=lambda rows: [i for i in rows if i['column_type'] == "daily needs"],
+            variant="daily-needs"
+        )
     except Exception as e:
         print("Error fetching daily needs:", e)
         return jsonify({"status": "error", "message": "Failed to fetch daily needs"}), 500
 
 @app.route('/api/daily_needs_items', methods=['POST'])
+@admin_required
 def add_daily_needs_item_new():
-    if 'admin_username' not in session:
-        return jsonify({"status": "error", "message": "Unauthorized"}), 401
     data = request.get_json()
     print("Add daily needs item request data:", data)
     if not data or 'image_url' not in data or 'name' not in data:
@@ -453,15 +652,15 @@ def add_daily_needs_item_new():
             "column_type": "daily needs"
         }
         inserted = insert_data("trending_and_daily_needs", new_data)
+        content_cache.invalidate("trending_and_daily_needs")
         return jsonify({"status": "success", "message": "Daily needs item added", "item": inserted}), 201
     except Exception as e:
         print("Error adding daily needs item:", e)
         return jsonify({"status": "error", "message": "Failed to add daily needs item"}), 500
 
 @app.route('/api/daily_needs_items/<int:item_id>', methods=['PUT'])
+@admin_required
 def update_daily_needs_item_new(item_id):
-    if 'admin_username' not in session:
-        return jsonify({"status": "error", "message": "Unauthorized"}), 401
     data = request.get_json()
     print(f"Update daily needs item {item_id} data:", data)
     if not data or 'image_url' not in data or 'name' not in data:
@@ -472,83 +671,92 @@ def update_daily_needs_item_new(item_id):
             {"id": item_id, "column_type": "daily needs"},
             {"image_url": data['image_url'].strip(), "name": data['name'].strip()}
         )
+        content_cache.invalidate("trending_and_daily_needs")
         return jsonify({"status": "success", "message": "Daily needs item updated", "item": updated})
     except Exception as e:
         print(f"Error updating daily needs item {item_id}:", e)
         return jsonify({"status": "error", "message": "Failed to update daily needs item"}), 500
 
 @app.route('/api/daily_needs_items/<int:item_id>', methods=['DELETE'])
+@admin_required
 def delete_daily_needs_item_new(item_id):
-    if 'admin_username' not in session:
-        return jsonify({"status": "error", "message": "Unauthorized"}), 401
     try:
         deleted = delete_data(
             "trending_and_daily_needs",
             {"id": item_id, "column_type": "daily needs"}
         )
+        content_cache.invalidate("trending_and_daily_needs")
         return jsonify({"status": "success", "message": "Daily needs item deleted", "item": deleted})
     except Exception as e:
         print(f"Error deleting daily needs item {item_id}:", e)
         return jsonify({"status": "error", "message": "Failed to delete daily needs item"}), 500
 
 
+@app.route('/admin/profiles', methods=['GET'])
+@admin_required
+def get_profiles():
+    return jsonify({"status": "success", "data": list_profiles()})
+
+@app.route('/admin/profiles/<filename>', methods=['GET'])
+@admin_required
+def get_profile_artifact(filename):
+    path = artifact_path(filename)
+    if path is None:
+        return jsonify({"status": "error", "message": "Profile not found"}), 404
+    mimetype = "image/svg+xml" if filename.endswith(".svg") else "text/plain"
+    return send_file(path, mimetype=mimetype, as_attachment=request.args.get("download") is not None)
+
+@app.route('/admin/proxy-usage', methods=['GET'])
+@admin_required
+def get_proxy_usage():
+    return jsonify({"status": "success", "data": proxy_scheduler.usage()})
+
+@app.route('/admin/platform-router', methods=['GET'])
+@admin_required
+def get_platform_router_report():
+    return jsonify({"status": "success", "data": platform_router.report()})
+
+@app.route('/admin/catalog', methods=['GET'])
+@admin_required
+def get_catalog_stats():
+    return jsonify({"status": "success", "data": product_catalog.stats()})
+
+@app.route('/admin/catalog/export', methods=['GET'])
+@admin_required
+def export_catalog():
+    buffer = io.StringIO()
+    product_catalog.export_jsonl(buffer, include_embeddings=request.args.get("embeddings") is not None)
+    response = app.response_class(buffer.getvalue(), mimetype="application/x-ndjson")
+    response.headers["Content-Disposition"] = "attachment; filename=product_catalog.jsonl"
+    return response
+
 @app.route('/api/customer_analytics', methods=['GET'])
+@admin_required
 def get_customer_analytics():
-    if 'admin_username' not in session:
-        return jsonify({"status": "error", "message": "Unauthorized"}), 401
     try:
-        # Total users count
-        total_users_resp = supabase.table('users').select('id', count='exact').execute()
-        total_users = total_users_resp.count or 0
-
-        # Premium users count
-        premium_users_resp = supabase.table('users').select('id', count='exact').eq('is_premium', True).execute()
-        premium_users = premium_users_resp.count or 0
-
-        # New users in last 7 days
-        from datetime import datetime, timedelta
-        now = datetime.utcnow()
-        seven_days_ago = now - timedelta(days=7)
-        thirty_days_ago = now - timedelta(days=30)
-        sixty_days_ago = now - timedelta(days=60)
-
-        new_users_7_resp = supabase.table('users').select('id', count='exact').gte('created_at', seven_days_ago.isoformat()).execute()
-        new_users_7 = new_users_7_resp.count or 0
-
-        # New users in last 30 days
-        new_users_30_resp = supabase.table('users').select('id', count='exact').gte('created_at', thirty_days_ago.isoformat()).execute()
-        new_users_30 = new_users_30_resp.count or 0
-
-        # Previous period calculations for trends
-        prev_period_7_resp = supabase.table('users').select('id', count='exact').gte('created_at', sixty_days_ago.isoformat()).lt('created_at', thirty_days_ago.isoformat()).execute()
-        prev_period_7 = prev_period_7_resp.count or 0
-
-        # Calculate growth rates
-        new_users_growth = calculate_growth_rate(new_users_7, prev_period_7)
-        total_users_growth = 5  # Placeholder, typically calculated based on previous total
-        premium_users_growth = 12  # Placeholder, typically calculated based on previous total
-
-        # Premium conversion rate
-        premium_conversion_rate = (premium_users / total_users * 100) if total_users > 0 else 0
-        conversion_rate_change = 0  # Placeholder, typically calculated based on previous rate
+        snapshot = get_customer_analytics_snapshot()
+        counts = snapshot["counts"]
+        total_users = counts["total_users"] or 0
+        premium_users = counts["premium_users"] or 0
 
-        # Recent premium subscribers (last 5)
-        recent_premium_resp = supabase.table('users').select('name', 'mobile', 'premium_start_at').eq('is_premium', True).order('premium_start_at', desc=True).limit(5).execute()
-        recent_premium = recent_premium_resp.data if recent_premium_resp.data else []
+        # Growth rates against the same counters 30 days (or 7 days for signups) ago
+        new_users_growth = calculate_growth_rate(counts["new_users_7_days"], counts["new_users_prev_7_days"])
+        total_users_growth = calculate_growth_rate(total_users, counts["total_users_30_days_ago"])
+        premium_users_growth = calculate_growth_rate(premium_users, counts["premium_users_30_days_ago"])
 
-        # Generate sample data for charts
-        # In a real scenario, this would come from database queries
-        months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun']
-        free_users = [50, 65, 75, 90, 100, 110]
-        premium_users_data = [8, 12, 18, 22, 28, 35]
+        # Premium conversion rate and its change over the last 30 days
+        premium_conversion_rate = (premium_users / total_users * 100) if total_users > 0 else 0
+        previous_total = counts["total_users_30_days_ago"]
+        previous_conversion_rate = (counts["premium_users_30_days_ago"] / previous_total * 100) if previous_total > 0 else 0
+        conversion_rate_change = round(premium_conversion_rate - previous_conversion_rate, 2)
 
         return jsonify({
             "total_users": total_users,
             "premium_users": premium_users,
-            "new_users_7_days": new_users_7,
-            "new_users_30_days": new_users_30,
+            "new_users_7_days": counts["new_users_7_days"],
+            "new_users_30_days": counts["new_users_30_days"],
             "premium_conversion_rate": premium_conversion_rate,
-            "recent_premium_subscribers": recent_premium,
+            "recent_premium_subscribers": snapshot["recent_premium_subscribers"],
             
             # Additional fields for UI
             "total_users_growth": total_users_growth,
@@ -556,12 +764,8 @@ def get_customer_analytics():
             "new_users_growth": new_users_growth,
             "conversion_rate_change": conversion_rate_change,
             
-            # Chart data
-            "growth_data": {
-                "months": months,
-                "free_users": free_users,
-                "premium_users": premium_users_data
-            }
+            # Chart data: monthly free signups and premium upgrades
+            "growth_data": snapshot["growth_data"]
         })
     except Exception as e:
         print("Error fetching customer analytics:", e)
@@ -574,11 +778,21 @@ def calculate_growth_rate(current, previous):
     return round(((current - previous) / previous) * 100)
 
 
-def main():
+def start_ngrok():
+    from pyngrok import ngrok
     kill_ngrok_processes()
     ngrok.set_auth_token(os.getenv("NGROK_AUTH_TOKEN"))
-    ngrok_tunnel = ngrok.connect(addr='5000', proto="http", hostname="noble-raven-entirely.ngrok-free.app")
+    ngrok_tunnel = ngrok.connect(addr='5000', proto="http", hostname=os.getenv("NGROK_HOSTNAME", "noble-raven-entirely.ngrok-free.app"))
+    if not TRUSTED_PROXY_HOPS:
+        # Every request now arrives from the tunnel's local end; take the caller's address from its header.
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1)
     print("Public URL:", ngrok_tunnel.public_url)
+
+def main():
+    start_warm_up()
+    # The tunnel is only for exposing a dev machine; NGROK_ENABLED=0 skips it (and its 2s+ cleanup).
+    if os.getenv("NGROK_AUTH_TOKEN") and os.getenv("NGROK_ENABLED", "1") != "0":
+        start_ngrok()
     app.run(port=5000, debug=True, use_reloader=False)
     app.run(debug=True)
 
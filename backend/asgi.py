@@ -0,0 +1,215 @@
+"""
+ASGI entry point with a native async search path.
+
+    WEB_CONCURRENCY=4 uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+POST /get-search-results and POST /get-list-results await
+get_compared_results_async and get_compared_list_async directly on the
+server's long-lived event loop, so many searches share one loop per worker
+instead of each request building its own. Every other route is served by the
+unchanged Flask app through asgiref's WSGI adapter.
+
+    SEARCH_EXECUTOR_THREADS  threads for the blocking platform handlers (default 256)
+    WARM_UP_BACKGROUND       0 to finish loading the model and indexes before accepting requests (default 1)
+"""
+import os
+import json
+import asyncio
+from urllib.parse import parse_qs
+from http.cookies import SimpleCookie
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.wsgi import WsgiToAsgi
+
+from app import app as flask_app
+from utils.main_functions import get_compared_results_async, get_compared_list_async, list_search_cost, start_warm_up, save_caches, LIST_SEARCH_MAX_ITEMS
+from utils.universal_function import log_debug
+from utils.response_encoding import dumps, negotiate_encoding, compress, shape_search_result, COMPRESSION_MIN_BYTES
+from utils.metrics import start_breakdown
+from utils.profiler import profile_request
+from utils.admission import search_admission, search_identity, may_force_full_fanout, client_address, Rejected
+from utils.auth_tokens import verify_token, TokenError, ADMIN_TOKEN_COOKIE
+
+SEARCH_EXECUTOR_THREADS = int(os.getenv('SEARCH_EXECUTOR_THREADS', 256))
+
+wsgi_application = WsgiToAsgi(flask_app)
+
+
+async def read_json(receive):
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    data = json.loads(body or b"{}")
+    # The endpoints read fields off an object; any other JSON value is as invalid as bad syntax.
+    if not isinstance(data, dict):
+        raise ValueError("JSON body must be an object")
+    return data
+
+
+def request_header(scope, name):
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def request_address(scope):
+    """The caller's address, trusting X-Forwarded-For as far as TRUSTED_PROXY_HOPS allows."""
+    client = scope.get("client") or ("unknown", 0)
+    return client_address(client[0], request_header(scope, b"x-forwarded-for"))
+
+
+def request_claims(scope, role=None):
+    """Claims of the Bearer token or admin cookie, or None (same rules as auth_tokens.current_claims)."""
+    header = request_header(scope, b"authorization") or ""
+    if header.lower().startswith("bearer "):
+        token = header[7:].strip()
+    else:
+        morsel = SimpleCookie(request_header(scope, b"cookie") or "").get(ADMIN_TOKEN_COOKIE)
+        token = morsel.value if morsel is not None else None
+    try:
+        return verify_token(token, role)
+    except TokenError:
+        return None
+
+
+async def send_json(send, payload, status=200, scope=None, extra_headers=()):
+    body = dumps(payload)
+    headers = [(b"content-type", b"application/json"), *extra_headers]
+    if scope is not None and len(body) >= COMPRESSION_MIN_BYTES:
+        headers.append((b"vary", b"Accept-Encoding"))
+        encoding = negotiate_encoding(request_header(scope, b"accept-encoding"))
+        if encoding is not None:
+            body = compress(body, encoding)
+            headers.append((b"content-encoding", encoding.encode()))
+    headers.append((b"content-length", str(len(body)).encode()))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def search_endpoint(scope, receive, send):
+    try:
+        data = await read_json(receive)
+    except (ValueError, UnicodeDecodeError):
+        await send_json(send, {"status": "error", "message": "Invalid JSON body"}, 400)
+        return
+    item_name = data.get("item_name")
+    lat = data.get("lat")
+    lon = data.get("lon")
+    if not item_name or lat is None or lon is None:
+        await send_json(send, {"status": "error", "message": "item_name, lat and lon are required"}, 400)
+        return
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    breakdown = start_breakdown() if data.get("timings") or query.get("timings") else None
+    profile = request_header(scope, b"x-profile") or query.get("profile")
+    if profile and request_claims(scope, "admin") is None:
+        await send_json(send, {"status": "error", "message": "Profiling requires an admin session"}, 403)
+        return
+    full_fanout = bool(data.get("full_fanout"))
+    claims = request_claims(scope)
+    if full_fanout and not may_force_full_fanout(claims):
+        await send_json(send, {"status": "error", "message": "Full fan-out requires an admin or premium session"}, 403)
+        return
+    key, premium = search_identity(claims, request_address(scope))
+    try:
+        async with search_admission.admit_async(key, premium):
+            # The event loop thread is shared with other requests, so a profile
+            # taken here can include their samples too.
+            with profile_request(f"search {item_name}") if profile else nullcontext() as profiler:
+                result = await get_compared_results_async(item_name, lat, lon, data.get("credentials", {}), full_fanout)
+    except Rejected as e:
+        await send_json(send, {"status": "error", "message": "Too many searches, try again shortly", "reason": e.reason, "retry_after": e.retry_after},
+                        429, extra_headers=[(b"retry-after", str(e.retry_after).encode())])
+        return
+    except Exception as e:
+        log_debug(f"Search failed: {e}", "ASGI", "ERROR")
+        await send_json(send, {"status": "error", "message": "Search failed"}, 500)
+        return
+    result = shape_search_result(result, compact=bool(data.get("compact")), fields=data.get("fields"))
+    response = {"status": "success", "data": result}
+    if breakdown is not None:
+        response["timings"] = breakdown
+    if profiler is not None:
+        response["profile"] = profiler.artifact_id
+    await send_json(send, response, scope=scope)
+
+
+async def list_endpoint(scope, receive, send):
+    try:
+        data = await read_json(receive)
+    except (ValueError, UnicodeDecodeError):
+        await send_json(send, {"status": "error", "message": "Invalid JSON body"}, 400)
+        return
+    items = data.get("items")
+    lat = data.get("lat")
+    lon = data.get("lon")
+    if not isinstance(items, list) or not items or lat is None or lon is None:
+        await send_json(send, {"status": "error", "message": "items (a list), lat and lon are required"}, 400)
+        return
+    if len(items) > LIST_SEARCH_MAX_ITEMS:
+        await send_json(send, {"status": "error", "message": f"At most {LIST_SEARCH_MAX_ITEMS} items per list"}, 400)
+        return
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    breakdown = start_breakdown() if data.get("timings") or query.get("timings") else None
+    full_fanout = bool(data.get("full_fanout"))
+    claims = request_claims(scope)
+    if full_fanout and not may_force_full_fanout(claims):
+        await send_json(send, {"status": "error", "message": "Full fan-out requires an admin or premium session"}, 403)
+        return
+    key, premium = search_identity(claims, request_address(scope))
+    try:
+        # The whole list holds one search slot and spends a rate-limit token per item it searches.
+        async with search_admission.admit_async(key, premium, list_search_cost(items, lat, lon, full_fanout)):
+            result = await get_compared_list_async(items, lat, lon, data.get("credentials", {}), full_fanout)
+    except Rejected as e:
+        await send_json(send, {"status": "error", "message": "Too many searches, try again shortly", "reason": e.reason, "retry_after": e.retry_after},
+                        429, extra_headers=[(b"retry-after", str(e.retry_after).encode())])
+        return
+    except Exception as e:
+        log_debug(f"List search failed: {e}", "ASGI", "ERROR")
+        await send_json(send, {"status": "error", "message": "Search failed"}, 500)
+        return
+    for entry in result["data"]:
+        entry["data"] = shape_search_result(entry["data"], compact=bool(data.get("compact")), fields=data.get("fields"))
+    response = {"status": "success", "data": result}
+    if breakdown is not None:
+        response["timings"] = breakdown
+    await send_json(send, response, scope=scope)
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            loop = asyncio.get_running_loop()
+            # Platform handlers are blocking; give them enough threads that
+            # in-flight searches queue on the network, not on the pool.
+            loop.set_default_executor(ThreadPoolExecutor(max_workers=SEARCH_EXECUTOR_THREADS, thread_name_prefix="search"))
+            # Returns at once unless WARM_UP_BACKGROUND=0; /readyz reports progress.
+            await loop.run_in_executor(None, start_warm_up)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            save_caches()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+ASYNC_ROUTES = {
+    ("POST", "/get-search-results"): search_endpoint,
+    ("POST", "/get-list-results"): list_endpoint,
+}
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(scope, receive, send)
+        return
+    if scope["type"] == "http":
+        handler = ASYNC_ROUTES.get((scope["method"], scope["path"]))
+        if handler is not None:
+            await handler(scope, receive, send)
+            return
+    await wsgi_application(scope, receive, send)
@@ -0,0 +1,110 @@
+"""
+Latency and memory of the /autocomplete modes on a list of product names.
+
+    python -m benchmarks.autocomplete_modes [names.json] [--scale N]
+
+Prefix and fuzzy indexes are built in-process. Semantic mode needs an index
+built with `python -m utils.semantic_index` and the embedding model installed;
+without them only the matrix scan is timed on random vectors of the same shape.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.autocomplete_index import AutocompleteIndex
+from utils.fuzzy_index import TrigramIndex
+
+QUERIES = ["amul", "milk", "basmati rice", "amul buttr", "basmti rice", "cold drink", "toothpaste", "atta", "ghee", "choco"]
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda p: samples[min(len(samples) - 1, int(p * len(samples)))] * 1e6
+    return f"p50 {pick(0.50):8.1f}us  p95 {pick(0.95):8.1f}us  p99 {pick(0.99):8.1f}us"
+
+
+def time_queries(fn, rounds):
+    samples = []
+    for _ in range(rounds):
+        for query in QUERIES:
+            start = time.perf_counter()
+            fn(query)
+            samples.append(time.perf_counter() - start)
+    return samples
+
+
+def load_names(path, scale):
+    with open(path, encoding='utf-8') as f:
+        names = json.load(f)
+    if scale > 1:
+        # Synthetic variants so larger tables keep a realistic vocabulary.
+        rng = random.Random(0)
+        words = [w for name in names for w in name.split()]
+        names = names + [" ".join(rng.sample(words, 4)) for _ in range(len(names) * (scale - 1))]
+    return list(dict.fromkeys(names))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("names", nargs="?", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "compared.json"))
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    names = load_names(args.names, args.scale)
+    rows = [{"id": i, "name": name} for i, name in enumerate(names)]
+    print(f"{len(names)} names")
+
+    index = AutocompleteIndex()
+    tracemalloc.start()
+    start = time.perf_counter()
+    index._build_snapshot(rows)
+    build_time = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"prefix+fuzzy build: {build_time:.2f}s, peak {peak / 2**20:.1f} MiB")
+
+    trigram = index._snapshot["trigrams"]
+    tracemalloc.start()
+    TrigramIndex(names)
+    _, trigram_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  of which trigram index peak {trigram_peak / 2**20:.1f} MiB")
+
+    print("prefix  ", percentiles(time_queries(lambda q: index.suggest(q, 5), args.rounds)))
+    print("fuzzy   ", percentiles(time_queries(lambda q: trigram.search(q, 5), args.rounds)))
+
+    try:
+        from utils.semantic_index import semantic_index
+        if not semantic_index.available:
+            raise ImportError("semantic index not built")
+        semantic_index.load()
+        semantic_index.search(QUERIES[0])
+        matrix_bytes = semantic_index.matrix.nbytes
+        semantic_samples = time_queries(lambda q: semantic_index.search(q, 5), max(1, args.rounds // 10))
+        print(f"semantic matrix {matrix_bytes / 2**20:.1f} MiB (mmap, float16)")
+        print("semantic", percentiles(semantic_samples), "(cached query embeddings after round 1)")
+    except ImportError as e:
+        print(f"semantic: {e}; timing the matrix scan only")
+        matrix = np.random.default_rng(0).standard_normal((len(names), 384)).astype(np.float16)
+        vector = np.random.default_rng(1).standard_normal(384).astype(np.float32)
+        def scan(_):
+            # Same chunked float16 -> float32 scan as SemanticIndex.search.
+            scores = np.empty(len(matrix), dtype=np.float32)
+            for start in range(0, len(matrix), 4096):
+                chunk = np.asarray(matrix[start:start + 4096], dtype=np.float32)
+                scores[start:start + len(chunk)] = chunk @ vector
+            np.argpartition(-scores, 4)[:5]
+        print(f"semantic matrix {matrix.nbytes / 2**20:.1f} MiB (float16)")
+        print("semantic", percentiles(time_queries(scan, max(1, args.rounds // 10))), "(scan only, excludes query encoding)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Latency and exactness of optimize_basket on random baskets with minimum orders.
+
+    python -m benchmarks.basket_optimizer [--baskets N] [--lines N] [--stores N] [--gap]
+
+Every store gets a min_order of 99, 199 or 499 on top of its default delivery
+terms, the case where the exact search has to branch. Prices are drawn per
+band (cheap staples up to pricier items); each store stocks an item with
+probability 0.85. --gap re-solves the baskets that hit BASKET_MAX_MILLISECONDS
+without a time limit and reports how far the returned plan was from the optimum.
+"""
+import os
+import sys
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.basket_optimizer import optimize_basket, BASKET_MAX_MILLISECONDS
+
+STORES = ["Blinkit", "Zepto", "Instamart", "DMart", "BigBasket", "JioMart", "Amazon Fresh", "Flipkart Minutes"]
+MIN_ORDERS = [99, 199, 499]
+PRICE_BANDS = [(5, 60), (10, 150), (20, 400)]
+
+
+def random_basket(rng, lines, stores, low, high):
+    fees = {store: {"min_order": MIN_ORDERS[i % len(MIN_ORDERS)]} for i, store in enumerate(stores)}
+    basket = [{"name": f"item {i}", "count": 1,
+               "prices": {store: round(rng.uniform(low, high), 2) for store in stores if rng.random() < 0.85}}
+              for i in range(lines)]
+    return basket, fees
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--baskets", type=int, default=20)
+    parser.add_argument("--lines", type=int, default=50)
+    parser.add_argument("--stores", type=int, default=5)
+    parser.add_argument("--gap", action="store_true")
+    args = parser.parse_args()
+    stores = STORES[:args.stores]
+
+    print(f"{args.baskets} baskets of {args.lines} lines over {len(stores)} stores, time cap {BASKET_MAX_MILLISECONDS:g}ms")
+    for low, high in PRICE_BANDS:
+        samples, exact, gaps = [], 0, []
+        for seed in range(args.baskets):
+            basket, fees = random_basket(random.Random(seed), args.lines, stores, low, high)
+            plan = optimize_basket(basket, fees)
+            samples.append(plan["elapsed_ms"])
+            exact += plan["exact"]
+            if args.gap and plan["feasible"] and not plan["exact"]:
+                optimum = optimize_basket(basket, fees, max_ms=float("inf"))
+                gaps.append((plan["total"] - optimum["total"]) / optimum["total"] * 100)
+        samples.sort()
+        row = (f"prices {low:>3}-{high:<3}  p50 {samples[len(samples) // 2]:7.1f}ms  max {samples[-1]:7.1f}ms"
+               f"  exact {exact}/{args.baskets}")
+        if gaps:
+            row += f"  gap to optimum avg {sum(gaps) / len(gaps):.2f}% max {max(gaps):.2f}%"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Import-time report for the backend entry points.
+
+    python -m benchmarks.import_time [module ...] [--top N] [--budget-ms MS]
+
+Each module (default: app) is imported in a fresh interpreter with
+`-X importtime`. The report lists the slowest imports by cumulative time and
+flags the known heavy packages that should stay lazy. With --budget-ms the
+exit status is 1 when any module exceeds the budget, so it can gate CI.
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only the search path needs these; importing them at startup is a regression.
+HEAVY_MODULES = ("sentence_transformers", "torch", "transformers", "pyngrok", "psutil")
+
+
+def measure(module):
+    """[(cumulative_us, self_us, name, depth)] for one import of module, in import order."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(cumulative_us), int(self_us), name.strip(), depth))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("modules", nargs="*", default=["app"])
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    over_budget = False
+    for module in args.modules:
+        rows = measure(module)
+        total_ms = next((cum for cum, _, name, _ in rows if name == module), 0) / 1000
+        print(f"import {module}: {total_ms:.0f}ms, {len(rows)} modules")
+
+        print(f"  {'cumulative':>10} {'self':>8}  module")
+        for cumulative, own, name, depth in sorted(rows, reverse=True)[:args.top]:
+            print(f"  {cumulative / 1000:8.1f}ms {own / 1000:6.1f}ms  {'  ' * depth}{name}")
+
+        heavy = [(cum, name) for cum, _, name, _ in rows if name.split(".")[0] in HEAVY_MODULES and "." not in name]
+        for cumulative, name in heavy:
+            print(f"  ! {name} imported at startup ({cumulative / 1000:.0f}ms)")
+
+        if args.budget_ms is not None and total_ms > args.budget_ms:
+            print(f"  over budget: {total_ms:.0f}ms > {args.budget_ms:.0f}ms")
+            over_budget = True
+        print()
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Byte size and encode time of search responses per schema and encoding.
+
+    python -m benchmarks.response_encoding [compared_data.json] [--groups N]
+
+--groups pads the payload to N groups with five stores each (the shape of a
+full 40-group search) by cycling through the real entries.
+"""
+import os
+import sys
+import copy
+import gzip
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import response_encoding
+from utils.response_encoding import shape_search_result, compress
+
+STORES = ["Blinkit", "Zepto", "Instamart", "DMart", "BigBasket"]
+
+
+def pad_payload(payload, groups):
+    entries = [entry for group in payload["data"] for entry in group["price"]]
+    padded = copy.deepcopy(payload)
+    padded["data"] = []
+    for i in range(groups):
+        template = payload["data"][i % len(payload["data"])]
+        prices = []
+        for j, store in enumerate(STORES):
+            entry = dict(entries[(i * len(STORES) + j) % len(entries)])
+            entry["store"] = store
+            prices.append(entry)
+        padded["data"].append({**template, "price": prices})
+    return padded
+
+
+def timed(fn, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = fn()
+    return result, (time.perf_counter() - start) / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", nargs="?", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "compared_data.json"))
+    parser.add_argument("--groups", type=int, default=0)
+    parser.add_argument("--rounds", type=int, default=500)
+    args = parser.parse_args()
+
+    with open(args.path, encoding="utf-8") as f:
+        payload = json.load(f)
+    if args.groups:
+        payload = pad_payload(payload, args.groups)
+    print(f"{len(payload['data'])} groups, {sum(len(g['price']) for g in payload['data'])} price entries")
+
+    variants = {
+        "full": lambda: payload,
+        "full fields=name,price.store,price.price": lambda: shape_search_result(payload, fields="name,price.store,price.price"),
+        "compact": lambda: shape_search_result(payload, compact=True),
+        "compact fields=name,price.store,price.price": lambda: shape_search_result(payload, compact=True, fields="name,price.store,price.price"),
+    }
+    print(f"{'variant':46} {'json.dumps':>18} {'fast dumps':>18} {'gzip':>16} {'br':>16}")
+    for name, build in variants.items():
+        shaped, shape_us = timed(build, args.rounds)
+        std_body, std_us = timed(lambda: json.dumps({"status": "success", "data": shaped}).encode(), args.rounds)
+        body, fast_us = timed(lambda: response_encoding.dumps({"status": "success", "data": shaped}), args.rounds)
+        gz, gz_us = timed(lambda: gzip.compress(body, compresslevel=response_encoding.GZIP_LEVEL), args.rounds // 5 or 1)
+        row = f"{name:46} {len(std_body):6}B {std_us:7.1f}us {len(body):6}B {fast_us + shape_us:7.1f}us {len(gz):6}B {gz_us:6.1f}us"
+        if response_encoding.brotli is not None:
+            br, br_us = timed(lambda: compress(body, "br"), args.rounds // 5 or 1)
+            row += f" {len(br):6}B {br_us:6.1f}us"
+        print(row)
+    if response_encoding.orjson is None:
+        print("orjson not installed: 'fast dumps' is the compact stdlib fallback")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Production entry point: a pre-fork gunicorn server around the Flask app.
+
+    python serve.py
+
+The master imports the app and runs warm_up() before forking, so the embedding
+model, autocomplete indexes and geocode cache are shared copy-on-write by all
+workers. Configuration comes from the environment:
+
+    PRICELY_BIND              address to bind (default 0.0.0.0:5000)
+    PRICELY_WORKERS           worker processes (default: CPU count)
+    PRICELY_THREADS           threads per worker (default 8)
+    PRICELY_TIMEOUT           seconds before a silent worker is restarted (default 120)
+    PRICELY_GRACEFUL_TIMEOUT  seconds in-flight requests get on reload/shutdown (default 60)
+
+Graceful reload: `kill -HUP <master pid>` starts fresh workers from the preloaded
+app and retires the old ones once their in-flight requests finish. Code changes
+need a full restart (or USR2 + QUIT for a zero-downtime binary swap).
+"""
+import gc
+import os
+import multiprocessing
+from gunicorn.app.base import BaseApplication
+
+from app import app
+from utils.main_functions import warm_up, save_caches, refresh_search
+from utils.autocomplete_index import autocomplete_index
+from utils.auth_tokens import start_revocation_sync
+from utils.search_refresh import search_refresher
+
+
+def post_fork(server, worker):
+    # Threads do not survive fork, so each worker starts its own refreshers.
+    autocomplete_index.start()
+    start_revocation_sync()
+    search_refresher.start(refresh_search, workers=server.cfg.workers)
+
+
+def worker_exit(server, worker):
+    save_caches()
+
+
+class PricelyServer(BaseApplication):
+    def __init__(self, application, options):
+        self.application = application
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def get_options():
+    return {
+        "bind": os.getenv("PRICELY_BIND", "0.0.0.0:5000"),
+        "workers": int(os.getenv("PRICELY_WORKERS", multiprocessing.cpu_count())),
+        "threads": int(os.getenv("PRICELY_THREADS", 8)),
+        "worker_class": "gthread",
+        "timeout": int(os.getenv("PRICELY_TIMEOUT", 120)),
+        "graceful_timeout": int(os.getenv("PRICELY_GRACEFUL_TIMEOUT", 60)),
+        "preload_app": True,
+        "post_fork": post_fork,
+        "worker_exit": worker_exit,
+    }
+
+
+def main():
+    warm_up()
+    # Move everything loaded so far out of the GC's reach so collections in
+    # the workers do not touch (and un-share) these pages.
+    gc.freeze()
+    PricelyServer(app, get_options()).run()
+
+
+if __name__ == "__main__":
+    main()
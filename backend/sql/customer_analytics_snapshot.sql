@@ -0,0 +1,56 @@
+-- Everything the admin dashboard's customer analytics card needs, in one round-trip.
+-- Apply once in the Supabase SQL editor; called via supabase.rpc('customer_analytics_snapshot').
+
+create or replace function customer_analytics_snapshot(months_back int default 6)
+returns json
+language sql
+stable
+as $$
+with counts as (
+    select
+        count(*)                                                                  as total_users,
+        count(*) filter (where is_premium)                                        as premium_users,
+        count(*) filter (where created_at >= now() - interval '7 days')           as new_users_7_days,
+        count(*) filter (where created_at >= now() - interval '14 days'
+                           and created_at <  now() - interval '7 days')           as new_users_prev_7_days,
+        count(*) filter (where created_at >= now() - interval '30 days')          as new_users_30_days,
+        count(*) filter (where created_at <  now() - interval '30 days')          as total_users_30_days_ago,
+        count(*) filter (where is_premium
+                           and premium_start_at < now() - interval '30 days')     as premium_users_30_days_ago
+    from users
+),
+months as (
+    select generate_series(
+        date_trunc('month', now()) - make_interval(months => months_back - 1),
+        date_trunc('month', now()),
+        interval '1 month'
+    ) as month_start
+),
+series as (
+    select
+        m.month_start,
+        (select count(*) from users u
+          where u.created_at >= m.month_start and u.created_at < m.month_start + interval '1 month'
+            and not coalesce(u.is_premium, false))                                as free_users,
+        (select count(*) from users u
+          where u.premium_start_at >= m.month_start and u.premium_start_at < m.month_start + interval '1 month'
+            and u.is_premium)                                                     as premium_users
+    from months m
+),
+recent as (
+    select name, mobile, premium_start_at
+    from users
+    where is_premium
+    order by premium_start_at desc nulls last
+    limit 5
+)
+select json_build_object(
+    'counts', (select row_to_json(c) from counts c),
+    'growth_data', json_build_object(
+        'months',        (select json_agg(to_char(month_start, 'Mon') order by month_start) from series),
+        'free_users',    (select json_agg(free_users order by month_start) from series),
+        'premium_users', (select json_agg(premium_users order by month_start) from series)
+    ),
+    'recent_premium_subscribers', coalesce((select json_agg(r) from recent r), '[]'::json)
+);
+$$;
@@ -0,0 +1,10 @@
+-- Revoked access tokens (utils/auth_tokens.py). Every process pulls the
+-- unexpired rows periodically; rows past expires_at can be deleted at any time.
+
+create table if not exists revoked_tokens (
+    jti         text primary key,
+    expires_at  bigint not null,          -- unix seconds, the token's exp claim
+    revoked_at  timestamptz not null default now()
+);
+
+create index if not exists revoked_tokens_expires_at_idx on revoked_tokens (expires_at);
@@ -9,6 +9,8 @@ import urllib.parse
 
 # LOCAL IMPORTS
 from .universal_function import *
+from .metrics import timed, CREDENTIAL_BOOTSTRAP_LATENCY, UPSTREAM_RETRIES
+from .proxy_scheduler import zenrows_request
 
 load_dotenv()
 
@@ -62,14 +64,13 @@ def update_address_in_session(location_data, cookies, headers, session_id):
 
             params = {
                 'url': 'https://www.bigbasket.com/member-svc/v2/member/current-delivery-address/',
-                'apikey': os.getenv('ZENROWS_API_KEY'),
                 'custom_headers': 'true',
                 'session_id': str(session_id)
             }
             
-            response = requests.put(
-                    'https://api.zenrows.com/v1/', 
-                    params=params,
+            response = zenrows_request(
+                    'PUT', 'BigBasket', 'credentials',
+                    params,
                     headers=headers,
                     data=json_data 
                 )
@@ -98,14 +99,13 @@ def get_address_info_varifiers(cookies, headers, session_id):
 
             params = {
                 'url': 'https://www.bigbasket.com/',
-                'apikey': os.getenv('ZENROWS_API_KEY'),
                 'custom_headers': 'true',
                 'session_id': str(session_id)
             }
             
-            response = requests.get(
-                    'https://api.zenrows.com/v1/', 
-                    params=params,
+            response = zenrows_request(
+                    'GET', 'BigBasket', 'credentials',
+                    params,
                     headers=headers
                 )
             auth_key = response.text.split(',"buildId":"')[-1].split('",')[0]
@@ -146,14 +146,13 @@ def fetch_csurf_token(cookies, headers, session_id):
 
             params = {
                 'url': url,
-                'apikey': os.getenv('ZENROWS_API_KEY'),
                 'custom_headers': 'true',
                 'session_id': str(session_id)
             }
             
-            response = requests.get(
-                    'https://api.zenrows.com/v1/', 
-                    params=params,
+            response = zenrows_request(
+                    'GET', 'BigBasket', 'credentials',
+                    params,
                     headers=headers
                 )
             
@@ -171,14 +170,13 @@ def get_initial_cookies(headers, session_id):
         url = "https://www.bigbasket.com/"
         params = {
             'url': url,
-            'apikey': os.getenv('ZENROWS_API_KEY'),
             'custom_headers': 'true',
             'session_id': str(session_id)
         }
 
-        response = requests.get(
-                    'https://api.zenrows.com/v1/', 
-                    params=params,
+        response = zenrows_request(
+                    'GET', 'BigBasket', 'credentials',
+                    params,
                     headers=headers
                 )
         
@@ -191,6 +189,7 @@ def get_initial_cookies(headers, session_id):
     return {}
 
 
+@timed(CREDENTIAL_BOOTSTRAP_LATENCY, "credentials.BigBasket", platform="BigBasket")
 def get_Bigbasket_Credentials(location_data):
     headers = {
             'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
@@ -267,11 +266,10 @@ def update_Bigbasket_Data(lat, lon, query):
     try:
         params = {
             'url': f'https://qp94doiea4.execute-api.ap-south-1.amazonaws.com/default/qc?lat={lat}&lon={lon}&type=groupsearch&query={urllib.parse.quote(query)}&page=1',
-            'apikey': os.getenv('ZENROWS_API_KEY'),
             'custom_headers': 'true',
         }
         
-        response = requests.get('https://api.zenrows.com/v1/', params=params, headers=headers)
+        response = zenrows_request('GET', 'BigBasket', 'search', params, headers=headers)
         response.raise_for_status()
         api_data = response.json()
     except requests.exceptions.RequestException as e:
@@ -409,14 +407,13 @@ def search_bigbasket(item_name, location_data, credentials=None):
 
             params = {
                 'url': f'https://www.bigbasket.com/_next/data/{auth_key}/ps.json?q={urllib.parse.quote(item_name)}&nc=as&listing=ps',
-                'apikey': os.getenv('ZENROWS_API_KEY', ''),
                 'custom_headers': 'true',
             }
             
-            response = requests.get(
-                'https://api.zenrows.com/v1/',
+            response = zenrows_request(
+                'GET', 'BigBasket', 'search',
+                params,
                 headers=headers,
-                params=params,
             )
             log_debug(response.status_code, "BigBasket_status")
             if response.status_code == 404:
@@ -425,6 +422,7 @@ def search_bigbasket(item_name, location_data, credentials=None):
         
         except (requests.RequestException, KeyError) as e:
             log_debug(f"Error in BigBasket search: {str(e)}, Retrying with new credentials...", "BigBasket", "ERROR")
+            UPSTREAM_RETRIES.inc(platform="BigBasket")
             try:
                 bigbasket_credentials = get_Bigbasket_Credentials(location_data)
                 credentials['BigBasket'] = bigbasket_credentials['BigBasket']
@@ -7,20 +7,22 @@ import uuid
 
 # LOCAL IMPORTS
 from .universal_function import *
+from .metrics import timed, CREDENTIAL_BOOTSTRAP_LATENCY, UPSTREAM_RETRIES
+from .proxy_scheduler import zenrows_request
 
 load_dotenv()
 
 
 
 
+@timed(CREDENTIAL_BOOTSTRAP_LATENCY, "credentials.Blinkit", platform="Blinkit")
 def get_blinkit_credentials(location_data):
     for i in range(3):
         try:
             params = {
                 'url': 'https://blinkit.com',
-                'apikey': os.getenv('ZENROWS_API_KEY'),
             }
-            response = requests.get('https://api.zenrows.com/v1/', params=params)
+            response = zenrows_request('GET', 'Blinkit', 'credentials', params)
             req_key = json.loads(response.text.split('window.grofers.CONFIG = ')[-1].split('};')[0] + '}')['requestKey']
             appVersion = json.loads(response.text.split('window.grofers.CONFIG = ')[-1].split('};')[0] + '}')['appVersion']
             device_id = dict(response.headers)['Zr-Cookies'].split('gr_1_deviceId=')[-1].split(';')[0]
@@ -43,10 +45,9 @@ def get_blinkit_credentials(location_data):
             }
             params = {
                 'url': 'https://blinkit.com/v2/accounts/auth_key/',
-                'apikey': os.getenv('ZENROWS_API_KEY'),
                 'custom_headers': 'true',
             }
-            res = requests.get('https://api.zenrows.com/v1/', params=params, headers=headers)
+            res = zenrows_request('GET', 'Blinkit', 'credentials', params, headers=headers)
             if res.json()['success'] == True:
                 auth_key = res.json()['auth_key']
                 data['BLINKIT']['auth_key'] = auth_key
@@ -159,14 +160,14 @@ def search_blinkit(item_name, location_data, credentials= None):
             url = f'https://blinkit.com/v6/search/products?start=0&size=30&search_type=6&q={urllib.parse.quote(item_name)}'
             params = {
                 'url': url,
-                'apikey': os.getenv('ZENROWS_API_KEY'),
                 'custom_headers': 'true',
             }
-            res = requests.get('https://api.zenrows.com/v1/', params=params, headers=headers)
+            res = zenrows_request('GET', 'Blinkit', 'search', params, headers=headers)
             return format_blinkit_data({"data": res.json(), "credentials": credentials})
         except Exception as e:
             log_debug("INVALID CREDENTIALS, TRYING TO FETCH NEW CREDENTIALS")
             log_debug(e, 'ERROR')
+            UPSTREAM_RETRIES.inc(platform="Blinkit")
             credentials = get_blinkit_credentials(location_data)
 
     return {"data":{}, "credentials": {}}
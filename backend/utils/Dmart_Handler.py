@@ -7,6 +7,9 @@ load_dotenv()
 
 # LOCAL IMPORTS
 from .universal_function import *
+from .metrics import timed, CREDENTIAL_BOOTSTRAP_LATENCY, UPSTREAM_RETRIES
+from .proxy_scheduler import zenrows_request
+from .cache_handler import dmart_serviceability_cache, LOCATION_NEGATIVE_CACHE_TTL
 
 headers = {
             'accept': 'application/json, text/plain, */*',
@@ -23,9 +26,14 @@ headers = {
         }
 
 def check_location_service_status(location_data):
-    
+    place_id = location_data['results'][0]['place_id']
+    cached = dmart_serviceability_cache.get(place_id)
+    if cached is not None:
+        log_debug(f"Serviceability cache hit for {place_id}: {cached}", 'DMart')
+        return cached
+
     json_data = {
-        'uniqueId': location_data['results'][0]['place_id'],
+        'uniqueId': place_id,
         'apiMode': 'GA',
         'pincode': '',
         'currentLat': '',
@@ -34,15 +42,18 @@ def check_location_service_status(location_data):
 
     params = {
         'url': 'https://digital.dmart.in/api/v2/pincodes/details',
-        'apikey': os.getenv('ZENROWS_API_KEY'),
         'custom_headers': 'true',
     }
-    response = requests.post('https://api.zenrows.com/v1/', params=params, headers=headers, json=json_data)
+    response = zenrows_request('POST', 'DMart', 'serviceability', params, headers=headers, json=json_data)
 
     log_debug(response.json(), 'response')
 
-    if response.json()['isPincodeServiceable'] != 'true':
-        return False
+    serviceable = response.json()['isPincodeServiceable'] == 'true'
+    dmart_serviceability_cache.set(
+        place_id, serviceable,
+        ttl=None if serviceable else LOCATION_NEGATIVE_CACHE_TTL
+    )
+    return serviceable
         
 def format_dmart_data(data):
     final_data = {'data': {}, 'credentials': data['credentials']}
@@ -74,22 +85,22 @@ def format_dmart_data(data):
 
 def search_dmart(item_name, location_data, credentials=None):
     if check_location_service_status(location_data) == False:
-        return {"data": {}, "credentials": {}}
+        return {"data": {}, "credentials": {}, "unserviceable": "Pincode not serviceable"}
 
     else:
         for i in range(3):
             try:
                 params = {
                 'url': f'https://digital.dmart.in/api/v3/search/{urllib.parse.quote(item_name)}?page=1&size=100&channel=web&storeId=10680',
-                'apikey': os.getenv('ZENROWS_API_KEY'),
                 'custom_headers': 'true',
             }
 
-                response = requests.get('https://api.zenrows.com/v1/', params=params, headers=headers)
+                response = zenrows_request('GET', 'DMart', 'search', params, headers=headers)
 
                 return format_dmart_data({"data": response.json(), "credentials": credentials})
             except Exception as e:
                 log_debug(f"Failed to fetch data: {str(e)}", "Error", "ERROR")
+                UPSTREAM_RETRIES.inc(platform="DMart")
                 continue
         
         return {"data":{}, "credentials": {}}
\ No newline at end of file
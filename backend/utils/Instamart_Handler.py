@@ -7,6 +7,9 @@ from dotenv import load_dotenv
 
 # LOCAL IMPORTS
 from .universal_function import *
+from .metrics import timed, CREDENTIAL_BOOTSTRAP_LATENCY, UPSTREAM_RETRIES
+from .proxy_scheduler import zenrows_request
+from .cache_handler import instamart_store_cache, LOCATION_NEGATIVE_CACHE_TTL
 
 load_dotenv()
 
@@ -47,9 +50,24 @@ def generate_random_string(length: int = RANDOM_STRING_LENGTH) -> str:
 
 
 def get_store_data(lat: float, lng: float, place: str, cookies: dict) -> Dict[str, Any]:
-    """Get store data based on location coordinates."""
+    """Get store data based on location coordinates, cached per geo-cell."""
     log_debug(f"Getting store data for lat: {lat}, lon: {lng}, place: {place}", name="get_store_data")
-    
+
+    cell = geo_cell_key(lat, lng)
+    cached = instamart_store_cache.get(cell)
+    if cached is not None:
+        log_debug(f"Store cache hit for cell {cell}", name="get_store_data")
+        return cached
+
+    store_data = _fetch_store_data(lat, lng, place, cookies)
+    if store_data['status'] == 'success':
+        instamart_store_cache.set(cell, store_data)
+    elif store_data.get('reason') == "Location not serviceable":
+        instamart_store_cache.set(cell, store_data, ttl=LOCATION_NEGATIVE_CACHE_TTL)
+    return store_data
+
+
+def _fetch_store_data(lat: float, lng: float, place: str, cookies: dict) -> Dict[str, Any]:
     try:
         headers = base_headers.copy()
         headers.update({
@@ -73,13 +91,12 @@ def get_store_data(lat: float, lng: float, place: str, cookies: dict) -> Dict[st
             try:
                 params = {
                     'url': LOCATION_ENDPOINT,
-                    'apikey': os.getenv('ZENROWS_API_KEY'),
                     'custom_headers': 'true'
                 }
                 
-                response = requests.post(
-                    'https://api.zenrows.com/v1/',
-                    params=params,
+                response = zenrows_request(
+                    'POST', 'Instamart', 'store',
+                    params,
                     headers=headers,
                     json=json_data,
                     timeout=30
@@ -113,6 +130,7 @@ def get_store_data(lat: float, lng: float, place: str, cookies: dict) -> Dict[st
                 log_debug(f"Attempt {attempt+1} failed: {str(e)}", name="get_store_data", level="ERROR")
                 if attempt == 2:
                     return {"status": "failed", "reason": f"Request failed after 3 attempts: {str(e)}"}
+                UPSTREAM_RETRIES.inc(platform="Instamart")
     
     except Exception as e:
         log_debug(f"Unexpected error in get_store_data: {str(e)}", name="get_store_data", level="ERROR")
@@ -169,14 +187,13 @@ def get_initial_cookies() -> Optional[Dict[str, str]]:
             
             params = {
                 'url': url,
-                'apikey': os.getenv('ZENROWS_API_KEY'), 
                 'custom_headers': 'true'
             }
             
-            response = requests.get(
-                'https://api.zenrows.com/v1/',
+            response = zenrows_request(
+                'GET', 'Instamart', 'credentials',
+                params,
                 headers=base_headers,
-                params=params,
                 timeout=30
             )
             response.raise_for_status()
@@ -194,11 +211,14 @@ def get_initial_cookies() -> Optional[Dict[str, str]]:
             log_debug(f"Attempt {attempt+1} failed: {str(e)}", name="get_initial_cookies", level="ERROR")
         except Exception as e:
             log_debug(f"Unexpected error: {str(e)}", name="get_initial_cookies", level="ERROR")
+        if attempt < 2:
+            UPSTREAM_RETRIES.inc(platform="Instamart")
     
     log_debug("Failed to get initial cookies after 3 attempts", name="get_initial_cookies", level="ERROR")
     return None
 
 
+@timed(CREDENTIAL_BOOTSTRAP_LATENCY, "credentials.Instamart", platform="Instamart")
 def get_instamart_credentials(location_data: Dict[str, Any]) -> Dict[str, Any]:
     """Get credentials required for Instamart API calls."""
     try:
@@ -311,6 +331,8 @@ def search_instamart(item_name: str, location_data: Dict[str, Any], credentials:
         if not credentials or "status" in credentials:
             error_reason = credentials.get("reason", "Unknown error") if credentials and "status" in credentials else "Failed to get credentials"
             log_debug(f"Credentials error: {error_reason}", name="search_instamart", level="ERROR")
+            if error_reason == "Location not serviceable":
+                return {"data": {}, "credentials": {}, "unserviceable": error_reason}
             return {"data": {}, "credentials": {}}
         
         if 'INSTAMART' not in credentials:
@@ -344,7 +366,6 @@ def search_instamart(item_name: str, location_data: Dict[str, Any], credentials:
                 
                 params = {
                     'url': updated_url,
-                    'apikey': os.getenv('ZENROWS_API_KEY'),
                     'custom_headers': 'true'
                 }
                     
@@ -353,9 +374,9 @@ def search_instamart(item_name: str, location_data: Dict[str, Any], credentials:
                     'sortAttribute': '',
                 }
                 
-                response = requests.post(
-                    'https://api.zenrows.com/v1/',
-                    params=params,
+                response = zenrows_request(
+                    'POST', 'Instamart', 'search',
+                    params,
                     headers=headers,
                     json=json_data,
                     timeout=30
@@ -374,6 +395,7 @@ def search_instamart(item_name: str, location_data: Dict[str, Any], credentials:
                     
                 # Get fresh credentials for next attempt
                 if attempt < 2:
+                    UPSTREAM_RETRIES.inc(platform="Instamart")
                     credentials = get_instamart_credentials(location_data)
                     if not credentials or "status" in credentials:
                         return {"data": {}, "credentials": {}}
@@ -382,6 +404,7 @@ def search_instamart(item_name: str, location_data: Dict[str, Any], credentials:
                 log_debug(f"Unexpected error in search (attempt {attempt+1}): {str(e)}", name="search_instamart", level="ERROR")
                 if attempt == 2:
                     return {"data": {}, "credentials": credentials}
+                UPSTREAM_RETRIES.inc(platform="Instamart")
                 
     except Exception as e:
         log_debug(f"Fatal error in search_instamart: {str(e)}", name="search_instamart", level="ERROR")
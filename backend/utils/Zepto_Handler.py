@@ -7,10 +7,13 @@ import uuid
 import hashlib
 # LOCAL IMPORTS
 from .universal_function import *
+from .metrics import timed, CREDENTIAL_BOOTSTRAP_LATENCY, UPSTREAM_RETRIES
+from .proxy_scheduler import zenrows_request
 
 load_dotenv()
 
 
+@timed(CREDENTIAL_BOOTSTRAP_LATENCY, "credentials.Zepto", platform="Zepto")
 def get_zepto_credentials(location_data):
     pos_data = {"latitude":location_data['results'][0]['geometry']['location']['lat'],"longitude":location_data['results'][0]['geometry']['location']['lng']}
     log_debug(pos_data, 'pos_data')
@@ -33,11 +36,10 @@ def get_zepto_credentials(location_data):
 
     params = {
         'url': 'https://www.zeptonow.com/search',
-        'apikey': os.getenv('ZENROWS_API_KEY'),
         'custom_headers': 'true',
     }
 
-    response = requests.get('https://api.zenrows.com/v1/', params=params, headers=headers)
+    response = zenrows_request('GET', 'Zepto', 'credentials', params, headers=headers)
     log_debug(response.headers, 'response')
 
     device_id = None
@@ -150,7 +152,7 @@ def search_zepto(item_name, location_data, credentials=None):
 
             if storeId == 'location not servicable':
                 log_debug('Location not servicable', 'Error', 'ERROR')
-                return {"data": {}, "credentials": {}}
+                return {"data": {}, "credentials": {}, "unserviceable": "Location not serviceable"}
 
             headers = {
                 'accept': 'application/json, text/plain, */*',
@@ -202,13 +204,12 @@ def search_zepto(item_name, location_data, credentials=None):
 
             params = {
                 'url': 'https://api.zeptonow.com/api/v3/search',
-                'apikey': os.getenv('ZENROWS_API_KEY'),
                 'custom_headers': 'true',
             }
 
-            response = requests.post(
-                'https://api.zenrows.com/v1/',
-                params=params,
+            response = zenrows_request(
+                'POST', 'Zepto', 'search',
+                params,
                 headers=headers,
                 data=body 
             )
@@ -217,6 +218,7 @@ def search_zepto(item_name, location_data, credentials=None):
             return format_zepto_data({"data": response.json(), "credentials": credentials})
         except Exception as e:
             log_debug(str(e), 'Error', 'ERROR')
+            UPSTREAM_RETRIES.inc(platform="Zepto")
             credentials = get_zepto_credentials(location_data)
 
     return {"data":{}, "credentials": {}}
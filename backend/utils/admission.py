@@ -0,0 +1,266 @@
+"""
+Admission control for searches.
+
+Every search holds one of MAX_CONCURRENT_SEARCHES slots while it fans out to
+the platforms. Before taking a slot a caller spends a token from its own
+bucket (keyed by mobile number, or client address when anonymous; behind
+a reverse proxy or tunnel set TRUSTED_PROXY_HOPS so the address is the
+caller's, not the proxy's, or every anonymous user shares one bucket). When all
+slots are busy the caller waits in the premium or standard lane; freed slots
+go to the premium lane first. Full lanes, empty buckets and waits longer
+than ADMISSION_QUEUE_TIMEOUT raise Rejected with a retry-after hint, which
+the routes turn into 429 responses.
+
+Waiters are threading.Event objects for sync callers and futures on the
+caller's event loop for async ones, so one controller serves both the Flask
+and the ASGI paths.
+
+    MAX_CONCURRENT_SEARCHES   searches running at once per process (default 32)
+    ADMISSION_QUEUE_SIZE      waiters per lane before rejecting (default 64)
+    ADMISSION_QUEUE_TIMEOUT   seconds a waiter may queue (default 10)
+    SEARCH_RATE_PER_MINUTE    bucket refill for standard users (default 10)
+    SEARCH_BURST              bucket size for standard users (default 5)
+    PREMIUM_RATE_PER_MINUTE   bucket refill for premium users (default 30)
+    PREMIUM_BURST             bucket size for premium users (default 10)
+    TRUSTED_PROXY_HOPS        proxies in front of the server whose X-Forwarded-For is trusted (default 0)
+"""
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from dotenv import load_dotenv
+
+from .cache_handler import TTLCache
+from .metrics import counter, histogram
+
+load_dotenv()
+
+MAX_CONCURRENT_SEARCHES = int(os.getenv('MAX_CONCURRENT_SEARCHES', 32))
+ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', 64))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 10))
+SEARCH_RATE_PER_MINUTE = float(os.getenv('SEARCH_RATE_PER_MINUTE', 10))
+SEARCH_BURST = float(os.getenv('SEARCH_BURST', 5))
+PREMIUM_RATE_PER_MINUTE = float(os.getenv('PREMIUM_RATE_PER_MINUTE', 30))
+PREMIUM_BURST = float(os.getenv('PREMIUM_BURST', 10))
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', 0))
+
+ADMISSION_DECISIONS = counter("pricely_admission_total", "Search admission decisions", ["lane", "result"])
+ADMISSION_WAIT = histogram("pricely_admission_wait_seconds", "Time searches spent queued for a slot", ["lane"])
+
+PREMIUM, STANDARD = "premium", "standard"
+
+
+class Rejected(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class _Waiter:
+    __slots__ = ("event", "future", "loop", "granted")
+
+    def __init__(self, loop=None):
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+        self.granted = False
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent=MAX_CONCURRENT_SEARCHES, queue_size=ADMISSION_QUEUE_SIZE,
+                 queue_timeout=ADMISSION_QUEUE_TIMEOUT):
+        self.max_concurrent = max_concurrent
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.lanes = {PREMIUM: deque(), STANDARD: deque()}
+        # Average search duration, for retry-after estimates
+        self.avg_duration = 5.0
+        self._lock = threading.Lock()
+        # A bucket untouched for a minute past its refill time is full again, so it can expire.
+        self._buckets = TTLCache("rate_limit_buckets", 60 + 60 * max(SEARCH_BURST / SEARCH_RATE_PER_MINUTE, PREMIUM_BURST / PREMIUM_RATE_PER_MINUTE), max_entries=100000)
+
+    # --- Rate limiting ---
+
+    def _take_token(self, key, premium, cost=1):
+        """
+        Spend cost tokens. A cost above the burst needs a full bucket and
+        leaves it in debt, so a shopping list of n searches waits out n tokens
+        before the next search instead of being refused outright.
+        """
+        rate = (PREMIUM_RATE_PER_MINUTE if premium else SEARCH_RATE_PER_MINUTE) / 60
+        burst = PREMIUM_BURST if premium else SEARCH_BURST
+        needed = min(cost, burst)
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens < needed:
+            self._buckets.set(key, (tokens, now))
+            raise Rejected("rate_limited", (needed - tokens) / rate)
+        self._buckets.set(key, (tokens - cost, now))
+
+    # --- Slots ---
+
+    def _retry_after(self):
+        queued = sum(len(lane) for lane in self.lanes.values())
+        return self.avg_duration * (1 + queued / max(1, self.max_concurrent))
+
+    def _try_admit(self, lane, loop=None):
+        """Return None when admitted at once, else a queued waiter. Raises Rejected. Caller holds the lock."""
+        ahead = len(self.lanes[PREMIUM]) + (len(self.lanes[STANDARD]) if lane == STANDARD else 0)
+        if self.active < self.max_concurrent and ahead == 0:
+            self.active += 1
+            return None
+        if len(self.lanes[lane]) >= self.queue_size:
+            raise Rejected("queue_full", self._retry_after())
+        waiter = _Waiter(loop)
+        self.lanes[lane].append(waiter)
+        return waiter
+
+    def _abandon(self, waiter, lane):
+        """Drop a waiter that gave up. True if it had been granted a slot meanwhile. Caller holds the lock."""
+        if waiter.granted:
+            return True
+        try:
+            self.lanes[lane].remove(waiter)
+        except ValueError:
+            pass
+        return False
+
+    def release(self, duration=None):
+        with self._lock:
+            if duration is not None:
+                self.avg_duration = 0.9 * self.avg_duration + 0.1 * duration
+            for lane in (PREMIUM, STANDARD):
+                if self.lanes[lane]:
+                    # Hand the slot straight to the next waiter; active stays the same.
+                    waiter = self.lanes[lane].popleft()
+                    waiter.granted = True
+                    waiter.wake()
+                    return
+            self.active -= 1
+
+    def _admit_prepare(self, key, premium, loop=None, cost=1):
+        lane = PREMIUM if premium else STANDARD
+        with self._lock:
+            try:
+                if key:
+                    self._take_token(key, premium, cost)
+                waiter = self._try_admit(lane, loop)
+            except Rejected as e:
+                ADMISSION_DECISIONS.inc(lane=lane, result=e.reason)
+                raise
+        return lane, waiter
+
+    def acquire(self, key, premium=False, cost=1):
+        """Block until admitted (sync callers). Raises Rejected."""
+        lane, waiter = self._admit_prepare(key, premium, cost=cost)
+        if waiter is None:
+            ADMISSION_DECISIONS.inc(lane=lane, result="admitted")
+            return
+        start = time.monotonic()
+        waiter.event.wait(self.queue_timeout)
+        with self._lock:
+            granted = self._abandon(waiter, lane)
+        ADMISSION_WAIT.observe(time.monotonic() - start, lane=lane)
+        if not granted:
+            ADMISSION_DECISIONS.inc(lane=lane, result="timeout")
+            raise Rejected("timeout", self._retry_after())
+        ADMISSION_DECISIONS.inc(lane=lane, result="queued")
+
+    async def acquire_async(self, key, premium=False, cost=1):
+        """Await admission without holding a thread. Raises Rejected."""
+        loop = asyncio.get_running_loop()
+        lane, waiter = self._admit_prepare(key, premium, loop, cost)
+        if waiter is None:
+            ADMISSION_DECISIONS.inc(lane=lane, result="admitted")
+            return
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # Client went away: give back a slot that may have been handed over meanwhile.
+            with self._lock:
+                granted = self._abandon(waiter, lane)
+            if granted:
+                self.release()
+            raise
+        with self._lock:
+            granted = self._abandon(waiter, lane)
+        ADMISSION_WAIT.observe(time.monotonic() - start, lane=lane)
+        if not granted:
+            ADMISSION_DECISIONS.inc(lane=lane, result="timeout")
+            raise Rejected("timeout", self._retry_after())
+        ADMISSION_DECISIONS.inc(lane=lane, result="queued")
+
+    @contextmanager
+    def admit(self, key, premium=False, cost=1):
+        """Hold a slot for the block; cost is the rate-limit tokens it spends (searches it runs)."""
+        self.acquire(key, premium, cost)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    @asynccontextmanager
+    async def admit_async(self, key, premium=False, cost=1):
+        await self.acquire_async(key, premium, cost)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": self.active,
+                "max_concurrent": self.max_concurrent,
+                "queued": {lane: len(waiters) for lane, waiters in self.lanes.items()},
+            }
+
+
+def client_address(peer, forwarded_for=None, hops=TRUSTED_PROXY_HOPS):
+    """
+    The caller's address: the entry `hops` proxies back in X-Forwarded-For
+    (the one werkzeug's ProxyFix picks with x_for=hops), else the peer's.
+    """
+    if hops and forwarded_for:
+        addresses = [address.strip() for address in forwarded_for.split(",")]
+        if len(addresses) >= hops:
+            return addresses[-hops]
+    return peer
+
+
+def search_identity(claims, client_address):
+    """(bucket key, premium) for a request: the user's mobile number when signed in, else the client address."""
+    if claims is not None and claims.get("role") == "user" and claims.get("mobile"):
+        return f"mobile:{claims['mobile']}", bool(claims.get("premium"))
+    return f"addr:{client_address}", False
+
+
+def may_force_full_fanout(claims):
+    """Admins and premium users may skip the search cache and platform routing (full_fanout)."""
+    if claims is None:
+        return False
+    return claims.get("role") == "admin" or (claims.get("role") == "user" and bool(claims.get("premium")))
+
+
+search_admission = AdmissionController()
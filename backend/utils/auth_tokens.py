@@ -0,0 +1,173 @@
+"""
+Signed, expiring access tokens verified entirely in-process.
+
+    <base64url(json claims)>.<base64url(HMAC-SHA256(claims))>
+
+Claims: sub, role ("user" or "admin"), iat, exp, jti, plus per-role extras
+(mobile and premium for users, username for admins). A verified token needs
+no database lookup. Revoked jtis are kept in a TTL cache until the token
+would have expired anyway; revocations are also written to the
+revoked_tokens table (sql/revoked_tokens.sql) and pulled by every process
+every REVOCATION_SYNC_INTERVAL seconds, so other workers honour them too.
+
+All processes (and gunicorn workers) must share AUTH_TOKEN_SECRET.
+"""
+import os
+import hmac
+import json
+import time
+import uuid
+import base64
+import secrets
+import hashlib
+import threading
+from functools import wraps
+from dotenv import load_dotenv
+from flask import request, jsonify, g
+
+from .cache_handler import revoked_tokens
+from .supabase_handler import insert_revoked_token, select_revoked_tokens
+from .universal_function import log_debug
+
+load_dotenv()
+
+USER_TOKEN_TTL = int(os.getenv('USER_TOKEN_TTL', 30 * 24 * 3600))
+ADMIN_TOKEN_TTL = int(os.getenv('ADMIN_TOKEN_TTL', 12 * 3600))
+REVOCATION_SYNC_INTERVAL = int(os.getenv('REVOCATION_SYNC_INTERVAL', 30))
+ADMIN_TOKEN_COOKIE = "pricely_admin_token"
+
+AUTH_TOKEN_SECRET = os.getenv('AUTH_TOKEN_SECRET') or os.getenv('FLASK_SECRET_KEY')
+if not AUTH_TOKEN_SECRET:
+    # Fine for a single dev process; tokens stop verifying on restart.
+    AUTH_TOKEN_SECRET = secrets.token_hex(32)
+    log_debug("AUTH_TOKEN_SECRET is not set; using a per-process secret", "AuthTokens", "WARNING")
+_SECRET = AUTH_TOKEN_SECRET.encode('utf-8')
+
+
+class TokenError(Exception):
+    pass
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload):
+    return _b64encode(hmac.new(_SECRET, payload.encode("ascii"), hashlib.sha256).digest())
+
+# =============================================== TOKENS ===================================================
+
+def issue_token(subject, role, ttl=None, **claims):
+    """Return (token, claims) for subject with the given role."""
+    now = int(time.time())
+    if ttl is None:
+        ttl = ADMIN_TOKEN_TTL if role == "admin" else USER_TOKEN_TTL
+    claims = {**claims, "sub": str(subject), "role": role, "iat": now, "exp": now + ttl, "jti": uuid.uuid4().hex}
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return f"{payload}.{_sign(payload)}", claims
+
+
+def verify_token(token, role=None):
+    """Claims of a valid token; raises TokenError for bad signatures, expiry, revocation or a role mismatch."""
+    # Signatures are compared as ASCII; anything else cannot be one of ours.
+    if not isinstance(token, str) or not token.isascii() or token.count(".") != 1:
+        raise TokenError("Malformed token")
+    payload, signature = token.split(".")
+    if not hmac.compare_digest(signature, _sign(payload)):
+        raise TokenError("Invalid signature")
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        raise TokenError("Malformed token")
+    if claims.get("exp", 0) <= time.time():
+        raise TokenError("Token expired")
+    if revoked_tokens.get(claims.get("jti")):
+        raise TokenError("Token revoked")
+    if role is not None and claims.get("role") != role:
+        raise TokenError("Insufficient role")
+    return claims
+
+
+def revoke_token(claims):
+    remaining = claims["exp"] - time.time()
+    if remaining <= 0:
+        return
+    revoked_tokens.set(claims["jti"], True, ttl=remaining)
+    try:
+        insert_revoked_token(claims["jti"], claims["exp"])
+    except Exception as e:
+        log_debug(f"Could not persist revocation of {claims['jti']}: {e}", "AuthTokens", "ERROR")
+
+# =============================================== REVOCATION SYNC ===================================================
+
+_sync_thread = None
+_sync_stop = threading.Event()
+
+
+def sync_revocations():
+    now = time.time()
+    rows = select_revoked_tokens(int(now))
+    for row in rows:
+        revoked_tokens.set(row["jti"], True, ttl=row["expires_at"] - now)
+    return len(rows)
+
+
+def _sync_loop(interval):
+    while not _sync_stop.wait(interval):
+        try:
+            sync_revocations()
+        except Exception as e:
+            log_debug(f"Revocation sync failed: {e}", "AuthTokens", "ERROR")
+
+
+def start_revocation_sync(interval=REVOCATION_SYNC_INTERVAL):
+    """Pull revocations now and then periodically in a daemon thread (one per process)."""
+    global _sync_thread
+    if _sync_thread is not None and _sync_thread.is_alive():
+        return
+    try:
+        sync_revocations()
+    except Exception as e:
+        log_debug(f"Revocation sync failed: {e}", "AuthTokens", "ERROR")
+    _sync_stop.clear()
+    _sync_thread = threading.Thread(target=_sync_loop, args=(interval,), name="revocation-sync", daemon=True)
+    _sync_thread.start()
+
+# =============================================== FLASK HELPERS ===================================================
+
+def token_from_request(req=None):
+    """Bearer token from the Authorization header, else the admin panel cookie."""
+    req = req or request
+    header = req.headers.get("Authorization", "")
+    if header.lower().startswith("bearer "):
+        return header[7:].strip()
+    return req.cookies.get(ADMIN_TOKEN_COOKIE)
+
+
+def current_claims(role=None, req=None):
+    """Claims of the request's token, or None when it is missing or invalid."""
+    try:
+        return verify_token(token_from_request(req), role)
+    except TokenError:
+        return None
+
+
+def _require(role):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                g.auth = verify_token(token_from_request(), role)
+            except TokenError as e:
+                return jsonify({"status": "error", "message": f"Unauthorized: {e}"}), 401
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+login_required = _require(None)
+admin_required = _require("admin")
@@ -0,0 +1,195 @@
+import os
+import time
+import heapq
+import bisect
+import threading
+from dotenv import load_dotenv
+
+# LOCAL IMPORTS
+from .universal_function import log_debug
+from .supabase_handler import select_rows_paginated
+from .fuzzy_index import TrigramIndex
+
+load_dotenv()
+
+AUTOSUGGEST_TABLE = "autosuggest"
+# New rows are picked up every REFRESH_INTERVAL seconds; a full reload catches edits and deletes.
+REFRESH_INTERVAL = int(os.getenv('AUTOCOMPLETE_REFRESH_INTERVAL', 300))
+FULL_RELOAD_INTERVAL = int(os.getenv('AUTOCOMPLETE_FULL_RELOAD_INTERVAL', 6 * 3600))
+
+
+class AutocompleteIndex:
+    """
+    In-memory autosuggest index.
+
+    Prefix lookups bisect a sorted list of lowercased names. Substring lookups
+    scan one newline-joined blob with str.find and map offsets back to names.
+    Fuzzy lookups go through a character-trigram index (see fuzzy_index).
+    Readers use an immutable snapshot, so refreshes never block a keystroke.
+    A refresh extends the current snapshot with the new names (sorted merge,
+    appended blob, trigram postings of the new names only); only the
+    periodic full reload rebuilds it.
+    """
+
+    def __init__(self, table=AUTOSUGGEST_TABLE):
+        self.table = table
+        self._snapshot = None
+        self._last_id = None
+        self._last_full_reload = 0.0
+        self._load_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    # ------------------------------------------------------------------ build
+
+    def _build_snapshot(self, rows):
+        names = list(dict.fromkeys(row['name'] for row in rows if row.get('name')))
+        lowered = [name.lower() for name in names]
+        order = sorted(range(len(names)), key=lowered.__getitem__)
+        keys = [lowered[i] for i in order]
+
+        offsets = []
+        position = 0
+        for key in lowered:
+            offsets.append(position)
+            position += len(key) + 1
+        blob = "\n".join(lowered) + "\n"
+
+        self._snapshot = {
+            "names": names,
+            "name_set": set(names),
+            "keys": keys,
+            "key_ids": order,
+            "blob": blob,
+            "offsets": offsets,
+            "trigrams": TrigramIndex(names),
+        }
+
+    def _extend_snapshot(self, rows):
+        """Build the next snapshot from the current one plus rows; returns how many names were new."""
+        old = self._snapshot
+        added = [name for name in dict.fromkeys(row['name'] for row in rows if row.get('name')) if name not in old["name_set"]]
+        if not added:
+            return 0
+        start = len(old["names"])
+        lowered = [name.lower() for name in added]
+        new_order = sorted(range(len(added)), key=lowered.__getitem__)
+        merged = list(heapq.merge(
+            zip(old["keys"], old["key_ids"]),
+            ((lowered[i], start + i) for i in new_order),
+            key=lambda entry: entry[0],
+        ))
+
+        offsets = list(old["offsets"])
+        position = len(old["blob"])
+        for key in lowered:
+            offsets.append(position)
+            position += len(key) + 1
+
+        self._snapshot = {
+            "names": old["names"] + added,
+            "name_set": old["name_set"] | set(added),
+            "keys": [key for key, _ in merged],
+            "key_ids": [name_id for _, name_id in merged],
+            "blob": old["blob"] + "\n".join(lowered) + "\n",
+            "offsets": offsets,
+            "trigrams": old["trigrams"].extended(added),
+        }
+        return len(added)
+
+    def load(self):
+        """Full load of the autosuggest table."""
+        with self._load_lock:
+            rows = select_rows_paginated(self.table, "id, name")
+            self._last_id = max((row['id'] for row in rows if row.get('id') is not None), default=None)
+            self._last_full_reload = time.monotonic()
+            self._build_snapshot(rows)
+        log_debug(f"Autocomplete index loaded with {len(self._snapshot['names'])} names", "Autocomplete", "INFO")
+
+    def refresh(self):
+        """Pick up rows added since the last load; fall back to a full reload periodically."""
+        if self._snapshot is None or time.monotonic() - self._last_full_reload >= FULL_RELOAD_INTERVAL:
+            self.load()
+            return
+        with self._load_lock:
+            new_rows = select_rows_paginated(self.table, "id, name", after_id=self._last_id)
+            if not new_rows:
+                return
+            self._last_id = max(row['id'] for row in new_rows)
+            added = self._extend_snapshot(new_rows)
+        log_debug(f"Autocomplete index added {added} names", "Autocomplete", "INFO")
+
+    def ensure_loaded(self):
+        if self._snapshot is None:
+            self.load()
+
+    # ----------------------------------------------------------- background
+
+    def start(self, interval=REFRESH_INTERVAL):
+        """Load now and keep refreshing in a daemon thread."""
+        self.ensure_loaded()
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, args=(interval,), name="autocomplete-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _refresh_loop(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                log_debug(f"Autocomplete refresh failed: {e}", "Autocomplete", "ERROR")
+
+    # --------------------------------------------------------------- lookup
+
+    def prefix_matches(self, query, limit):
+        snapshot = self._snapshot
+        keys, key_ids, names = snapshot["keys"], snapshot["key_ids"], snapshot["names"]
+        start = bisect.bisect_left(keys, query)
+        results = []
+        for i in range(start, min(start + limit, len(keys))):
+            if not keys[i].startswith(query):
+                break
+            results.append(names[key_ids[i]])
+        return results
+
+    def substring_matches(self, query, limit):
+        """Names containing query somewhere other than at the start."""
+        if "\n" in query:
+            return []
+        snapshot = self._snapshot
+        blob, offsets, names = snapshot["blob"], snapshot["offsets"], snapshot["names"]
+        results = []
+        seen = set()
+        position = blob.find(query)
+        while position != -1 and len(results) < limit:
+            name_idx = bisect.bisect_right(offsets, position) - 1
+            if offsets[name_idx] != position and name_idx not in seen:
+                seen.add(name_idx)
+                results.append(names[name_idx])
+            # Jump to the next name; one hit per name is enough.
+            next_start = offsets[name_idx + 1] if name_idx + 1 < len(offsets) else len(blob)
+            position = blob.find(query, next_start)
+        return results
+
+    def fuzzy_matches(self, query, limit):
+        return self._snapshot["trigrams"].search(query, limit)
+
+    def suggest(self, query, max_suggestions=5, mode="prefix"):
+        if not query:
+            return []
+        self.ensure_loaded()
+        query = query.lower()
+        if mode == "fuzzy":
+            return self.fuzzy_matches(query, max_suggestions)
+        suggestions = self.prefix_matches(query, max_suggestions)
+        if len(suggestions) < max_suggestions:
+            suggestions += self.substring_matches(query, max_suggestions - len(suggestions))
+        return suggestions
+
+
+autocomplete_index = AutocompleteIndex()
@@ -0,0 +1,555 @@
+"""
+Cheapest way to buy a compared shopping list: one store, or split across several.
+
+    plan = optimize_basket(basket_lines(groups))
+
+A line is one list item with its price per store (basket_lines takes the
+groups group_and_sort_products returns, one chosen group per item). A store
+the plan orders from needs a subtotal of at least its min_order and charges
+delivery_fee unless the subtotal reaches free_delivery_above.
+
+Every (store set, stores expected to deliver free) pattern is enumerated at
+once with numpy. Within a pattern, sending each item to its cheapest store
+in the set is optimal whenever that meets the pattern's minimums, so most
+patterns are settled without search. The search starts from the heuristic
+below. The remaining patterns get a Lagrangian bound (multipliers on their
+minimums, by subgradient ascent for all of them at once, whose assignments
+also yield candidate plans) and are visited lowest bound first with a
+branch-and-bound over the items, bounded by the better of that Lagrangian
+bound and the cheapest remaining prices plus what it costs to lift each
+store to its minimum (fractional knapsack); a pattern whose bound cannot
+beat the best plan so far is skipped. More than BASKET_EXACT_MAX_STORES
+stores uses the heuristic alone: the best greedy split over at most three
+stores improved by single-item moves. Either way the plan says exact: false
+when the search did not finish within BASKET_MAX_MILLISECONDS. Baskets are
+capped at BASKET_MAX_LINES lines and BASKET_MAX_STORES stores (ValueError
+above either): the exact search holds 3**stores x lines arrays and the
+heuristic grows with lines squared. python -m benchmarks.basket_optimizer
+times it on baskets with minimum orders.
+
+    BASKET_STORE_FEES        JSON {store: {min_order, delivery_fee, free_delivery_above}} over the defaults
+    BASKET_EXACT_MAX_STORES  default 8
+    BASKET_MAX_MILLISECONDS  time for the exact search per basket (default 100)
+    BASKET_MAX_LINES         list items per basket (default 50, as for list searches)
+    BASKET_MAX_STORES        stores per basket (default 12)
+"""
+import os
+import json
+import time
+import itertools
+from dotenv import load_dotenv
+import numpy as np
+
+from .metrics import counter, histogram
+from .universal_function import log_debug
+
+load_dotenv()
+
+BASKET_EXACT_MAX_STORES = int(os.getenv('BASKET_EXACT_MAX_STORES', 8))
+BASKET_MAX_MILLISECONDS = float(os.getenv('BASKET_MAX_MILLISECONDS', 100))
+BASKET_MAX_LINES = int(os.getenv('BASKET_MAX_LINES', 50))
+BASKET_MAX_STORES = int(os.getenv('BASKET_MAX_STORES', 12))
+
+# Typical terms of each platform; override with BASKET_STORE_FEES or per request.
+DEFAULT_STORE_FEES = {
+    "blinkit": {"min_order": 0, "delivery_fee": 30, "free_delivery_above": 199},
+    "zepto": {"min_order": 0, "delivery_fee": 30, "free_delivery_above": 199},
+    "instamart": {"min_order": 0, "delivery_fee": 35, "free_delivery_above": 199},
+    "bigbasket": {"min_order": 0, "delivery_fee": 40, "free_delivery_above": 300},
+    "dmart": {"min_order": 0, "delivery_fee": 49, "free_delivery_above": 999},
+}
+NO_FEES = {"min_order": 0, "delivery_fee": 0, "free_delivery_above": 0}
+# Largest min_order, delivery_fee or free_delivery_above a request may set.
+MAX_TERM_AMOUNT = 10000
+# Passes of single-item moves in the heuristic.
+HEURISTIC_ROUNDS = 20
+# Subgradient steps for the Lagrangian bound of a store set.
+LAGRANGE_ITERATIONS = 30
+# Patterns bounded together per batch of numpy work.
+LAGRANGE_CHUNK = 64
+EPSILON = 1e-9
+
+BASKET_PLANS = counter("pricely_basket_plans_total", "Basket optimizations", ["result"])
+BASKET_LATENCY = histogram("pricely_basket_optimizer_seconds", "Time to optimize a basket",
+                           buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+
+
+class _SearchTimedOut(Exception):
+    pass
+
+
+def _configured_fees():
+    fees = {store: dict(terms) for store, terms in DEFAULT_STORE_FEES.items()}
+    raw = os.getenv('BASKET_STORE_FEES')
+    if raw:
+        try:
+            for store, terms in json.loads(raw).items():
+                fees.setdefault(store.lower(), dict(NO_FEES)).update(terms)
+        except (ValueError, AttributeError) as e:
+            log_debug(f"Ignoring malformed BASKET_STORE_FEES: {e}", "BasketOptimizer", "WARNING")
+    return fees
+
+
+STORE_FEES = _configured_fees()
+
+
+def store_terms(store, overrides=None):
+    """
+    min_order, delivery_fee and free_delivery_above of a store (name in any
+    case). Overrides come from requests: ValueError unless each is a known
+    term with an amount between 0 and MAX_TERM_AMOUNT.
+    """
+    terms = dict(STORE_FEES.get(store.lower(), NO_FEES))
+    for name, override in (overrides or {}).items():
+        if name.lower() != store.lower():
+            continue
+        if not isinstance(override, dict):
+            raise ValueError(f"terms for {name} must be an object")
+        for term, amount in override.items():
+            if term not in NO_FEES:
+                raise ValueError(f"unknown term {term!r} for {name}")
+            amount = float(amount)
+            if not 0 <= amount <= MAX_TERM_AMOUNT:
+                raise ValueError(f"{term} for {name} must be between 0 and {MAX_TERM_AMOUNT}")
+            terms[term] = amount
+    return terms
+
+
+def basket_lines(groups, counts=None):
+    """
+    Lines for optimize_basket from compared groups: one group per list item,
+    each store at its lowest listed price. counts[i] multiplies line i.
+    """
+    lines = []
+    for i, group in enumerate(groups):
+        prices = {}
+        for entry in group.get("price", []):
+            if not isinstance(entry, dict):
+                continue
+            store, price = entry.get("store"), entry.get("price")
+            if not store or price is None:
+                continue
+            try:
+                price = float(price)
+            except (TypeError, ValueError):
+                continue
+            prices[store] = min(price, prices.get(store, price))
+        count = counts[i] if counts is not None else group.get("count", 1)
+        lines.append({"name": group.get("name", ""), "prices": prices, "count": count})
+    return lines
+
+
+# =========================================== PATTERNS ===========================================
+
+def _patterns(k):
+    """
+    Boolean (patterns, k) arrays of the stores in the set and the ones expected
+    to deliver free, plus each pattern's set as a bitmask.
+    """
+    digits = np.array(list(itertools.product((0, 1, 2), repeat=k)), dtype=np.int8)
+    digits = digits[(digits > 0).any(axis=1)]
+    in_set = digits > 0
+    return in_set, digits == 2, in_set @ (1 << np.arange(k))
+
+
+def _store_sets(k):
+    """Boolean (2**k, k) array; row m holds the stores of bitmask m."""
+    return ((np.arange(2 ** k)[:, None] >> np.arange(k)) & 1).astype(bool)
+
+
+def _greedy(cost, in_set):
+    """Each item at its cheapest store of each set: (item costs, choices, subtotals per store)."""
+    masked = np.where(in_set[:, None, :], cost[None, :, :], np.inf)
+    choice = masked.argmin(axis=2)
+    best = np.take_along_axis(masked, choice[:, :, None], axis=2)[:, :, 0]
+    onehot = choice[:, :, None] == np.arange(cost.shape[1])
+    subtotal = np.where(onehot, np.where(np.isfinite(best), best, 0.0)[:, :, None], 0.0).sum(axis=1)
+    return best, choice, subtotal
+
+
+def _plan_cost(subtotal, used, min_order, fee, free):
+    """Items plus fees of assignments; inf where a used store misses its minimum order."""
+    short = used & (subtotal < min_order - EPSILON)
+    fees = np.where(used & (subtotal < free - EPSILON), fee, 0.0).sum(axis=-1)
+    return np.where(short.any(axis=-1), np.inf, subtotal.sum(axis=-1) + fees)
+
+
+# ======================================= BRANCH AND BOUND =======================================
+
+def _multipliers(cost, in_set, floors, target, min_order, fee, free):
+    """
+    Multipliers for the floors of each pattern, by subgradient ascent on the
+    Lagrangian dual: any lam in [0, 1] gives the lower bound lam . floors plus,
+    per item, the least cost * (1 - lam) over the pattern's stores. Steps aim
+    at target, the item spend to beat per pattern. Returns (lam, bound), one
+    row per pattern, and the cheapest real plan (total, choices) among the
+    assignments the ascent went through.
+    """
+    n, k = cost.shape
+    allowed = in_set[:, None, :] & np.isfinite(cost)[None, :, :]
+    prices = np.where(np.isfinite(cost), cost, 0.0)[None, :, :]
+    stores = np.arange(k)
+    # No plan yet: no assignment costs more than every item at its dearest store.
+    target = np.where(np.isfinite(target), target, np.where(allowed, prices, 0.0).max(axis=2).sum(axis=1))
+    lam = np.zeros(floors.shape)
+    best_lam, best_bound = lam.copy(), np.full(len(floors), -np.inf)
+    plan = (np.inf, None)
+    scale, stalled = np.full(len(floors), 2.0), np.zeros(len(floors), dtype=int)
+    for _ in range(LAGRANGE_ITERATIONS):
+        reduced = np.where(allowed, prices * (1.0 - lam[:, None, :]), np.inf)
+        choice = reduced.argmin(axis=2)
+        bound = np.take_along_axis(reduced, choice[:, :, None], axis=2)[:, :, 0].sum(axis=1) + (lam * floors).sum(axis=1)
+        improved = bound > best_bound + EPSILON
+        best_lam[improved], best_bound[improved] = lam[improved], bound[improved]
+        stalled = np.where(improved, 0, stalled + 1)
+        halve = stalled >= 3
+        scale[halve], stalled[halve] = scale[halve] / 2, 0
+        onehot = choice[:, :, None] == stores
+        subtotal = np.where(onehot, np.take_along_axis(prices, choice[:, :, None], axis=2), 0.0).sum(axis=1)
+        # Assignments near the dual optimum are usually close to feasible: price them as plans.
+        actual = _plan_cost(subtotal, onehot.any(axis=1), min_order, fee, free)
+        cheapest = int(np.argmin(actual))
+        if actual[cheapest] < plan[0]:
+            plan = (float(actual[cheapest]), choice[cheapest].tolist())
+        gradient = floors - subtotal
+        norm = (gradient * gradient).sum(axis=1)
+        active = (best_bound < target - EPSILON) & (norm > EPSILON) & (scale >= 1e-3)
+        if not active.any():
+            break
+        step = np.where(active, scale * (target - bound) / np.where(active, norm, 1.0), 0.0)
+        lam = np.clip(lam + step[:, None] * gradient, 0.0, 1.0) * in_set
+    return best_lam, best_bound, plan
+
+
+def _branch_and_bound(cost, floors, best_total, fee_fixed, min_order, fee, free, lam, deadline):
+    """
+    Cheapest assignment of items to the columns of cost with every column's
+    subtotal at least floors, bounded with the multipliers lam. Returns
+    (total with real fees, choices, nodes); choices is None when nothing
+    beats best_total. Raises _SearchTimedOut past deadline (a
+    time.perf_counter() value).
+    """
+    n, k = cost.shape
+    finite = np.isfinite(cost)
+    mins = cost.min(axis=1)
+    ordered = np.sort(np.where(finite, cost, np.inf), axis=1)
+    regret = np.where(np.isfinite(ordered[:, 1]), ordered[:, 1] - ordered[:, 0], np.inf) if k > 1 else np.zeros(n)
+    order = [int(i) for i in np.argsort(-regret, kind="stable")]
+    position = {item: t for t, item in enumerate(order)}
+    cost_rows = [[float(c) for c in cost[i]] for i in order]
+    # Stores to try per item, cheapest after the multipliers first, so the first dives follow the relaxed plan.
+    reduced_order = np.argsort(np.where(finite, np.where(finite, cost, 0.0) * (1.0 - lam), np.inf), axis=1, kind="stable")
+    store_order = [[int(s) for s in reduced_order[i] if finite[i, s]] for i in order]
+    suffix_min = np.concatenate([np.cumsum(mins[order][::-1])[::-1], [0.0]]).tolist()
+    # Most the remaining items can add to the stores' subtotals together.
+    maxes = np.where(finite, cost, 0.0).max(axis=1)
+    suffix_max = np.concatenate([np.cumsum(maxes[order][::-1])[::-1], [0.0]]).tolist()
+    # Per store: items by extra cost per unit of subtotal they add there, for the knapsack bound.
+    extra = np.where(finite, cost - mins[:, None], np.inf)
+    by_ratio = []
+    for s in range(k):
+        candidates = [i for i in range(n) if finite[i, s] and cost[i, s] > 0]
+        candidates.sort(key=lambda i: extra[i, s] / cost[i, s])
+        by_ratio.append([(position[i], float(cost[i, s]), float(extra[i, s])) for i in candidates])
+    ordered_cost, ordered_finite = cost[order], finite[order]
+    lam_l = lam.tolist()
+    # Satisfied stores drop their multiplier; suffix sums of the reduced costs per set of stores still short.
+    reduced_suffix = {}
+
+    def lagrangian(t):
+        short = tuple(subtotal[s] < floors_l[s] - EPSILON for s in range(k))
+        suffix = reduced_suffix.get(short)
+        if suffix is None:
+            factor = 1.0 - np.where(short, lam, 0.0)
+            reduced = np.where(ordered_finite, np.where(ordered_finite, ordered_cost, 0.0) * factor, np.inf).min(axis=1)
+            suffix = reduced_suffix[short] = np.concatenate([np.cumsum(reduced[::-1])[::-1], [0.0]]).tolist()
+        return suffix[t] + sum(lam_l[s] * (floors_l[s] - subtotal[s]) for s in range(k) if short[s])
+
+    floors_l = floors.tolist()
+    min_order_l, fee_l, free_l = min_order.tolist(), fee.tolist(), free.tolist()
+
+    subtotal = [0.0] * k
+    counts = [0] * k
+    choice = [0] * n
+    state = {"best": best_total, "choice": None, "nodes": 0}
+
+    def lift_cost(t):
+        """Least extra spend (fractional) that brings every store up to its floor."""
+        if sum(max(0.0, floors_l[s] - subtotal[s]) for s in range(k)) > suffix_max[t] + EPSILON:
+            return None
+        total = 0.0
+        for s in range(k):
+            deficit = floors_l[s] - subtotal[s]
+            if deficit <= EPSILON:
+                continue
+            for pos, value, cost_extra in by_ratio[s]:
+                if pos < t:
+                    continue
+                if value >= deficit:
+                    total += cost_extra * deficit / value
+                    deficit = 0.0
+                    break
+                total += cost_extra
+                deficit -= value
+            if deficit > EPSILON:
+                return None
+        return total
+
+    def visit(t, spent):
+        state["nodes"] += 1
+        if not state["nodes"] & 255 and time.perf_counter() > deadline:
+            raise _SearchTimedOut()
+        if t == n:
+            total = spent
+            for s in range(k):
+                if counts[s]:
+                    if subtotal[s] < min_order_l[s] - EPSILON:
+                        return
+                    if subtotal[s] < free_l[s] - EPSILON:
+                        total += fee_l[s]
+            if total < state["best"] - EPSILON:
+                state["best"], state["choice"] = total, list(choice)
+            return
+        lift = lift_cost(t)
+        if lift is None or spent + max(suffix_min[t] + lift, lagrangian(t)) + fee_fixed >= state["best"] - EPSILON:
+            return
+        row = cost_rows[t]
+        for s in store_order[t]:
+            subtotal[s] += row[s]; counts[s] += 1; choice[order[t]] = s
+            visit(t + 1, spent + row[s])
+            subtotal[s] -= row[s]; counts[s] -= 1
+
+    visit(0, 0.0)
+    return state["best"], state["choice"], state["nodes"]
+
+
+# =========================================== SOLVERS ============================================
+
+def _solve_exact(cost, min_order, fee, free, deadline, start=None):
+    """
+    (total, choices, nodes), starting from the plan start = (total, choices)
+    when it is better than every greedy split; raises _SearchTimedOut with the
+    best plan found so far attached.
+    """
+    n, k = cost.shape
+    in_set, waived, set_id = _patterns(k)
+    # The greedy split depends on the store set only: compute it per set, then per pattern.
+    best_items, choice, subtotal = _greedy(cost, _store_sets(k))
+    best_items, choice, subtotal = best_items[set_id], choice[set_id], subtotal[set_id]
+    covers = np.isfinite(best_items).all(axis=1)
+    base = np.where(covers, best_items.sum(axis=1), np.inf)
+
+    floors = np.where(in_set, np.maximum(min_order, np.where(waived, free, 0.0)), 0.0)
+    fee_fixed = np.where(in_set & ~waived, fee, 0.0).sum(axis=1)
+    lower = base + fee_fixed
+    # A store that could not reach its floor with every item it stocks rules the pattern out.
+    capacity = np.where(np.isfinite(cost), cost, 0.0).sum(axis=0)
+    lower[(floors > capacity + EPSILON).any(axis=1)] = np.inf
+
+    # The greedy split of each pattern is a real plan; where it meets the floors it is the pattern's optimum.
+    used = (choice[:, :, None] == np.arange(k)).any(axis=1) & in_set
+    actual = np.where(covers, _plan_cost(subtotal, used, min_order, fee, free), np.inf)
+    meets = covers & (subtotal >= floors - EPSILON).all(axis=1)
+    best = int(np.argmin(actual))
+    best_total, best_choice, nodes = float(actual[best]), choice[best].tolist(), 0
+    if start is not None and start[0] < best_total:
+        best_total, best_choice = start[0], list(start[1])
+
+    columns = np.arange(k)
+    try:
+        # Patterns in batches, lowest simple bound first. Each batch gets its multipliers, then its patterns
+        # are searched lowest Lagrangian bound first: the plans found usually rule the rest out at their root.
+        candidates = [int(p) for p in np.argsort(lower, kind="stable") if lower[p] < best_total - EPSILON and not meets[p]]
+        while candidates:
+            if time.perf_counter() > deadline:
+                raise _SearchTimedOut()
+            batch = np.array([p for p in candidates[:LAGRANGE_CHUNK] if lower[p] < best_total - EPSILON], dtype=int)
+            candidates = candidates[LAGRANGE_CHUNK:]
+            if not len(batch):
+                break
+            lam, root, plan = _multipliers(cost, in_set[batch], floors[batch], best_total - fee_fixed[batch],
+                                           min_order, fee, free)
+            if plan[0] < best_total - EPSILON:
+                best_total, best_choice = _improve(cost, plan[1], plan[0], min_order, fee, free)
+            root += fee_fixed[batch]
+            for c in np.argsort(root, kind="stable"):
+                if root[c] >= best_total - EPSILON:
+                    break
+                p = batch[c]
+                stores = columns[in_set[p]]
+                total, local_choice, visited = _branch_and_bound(
+                    cost[:, stores], floors[p, stores], best_total, float(fee_fixed[p]),
+                    min_order[stores], fee[stores], free[stores], lam[c, stores], deadline)
+                nodes += visited
+                if local_choice is not None:
+                    best_total, best_choice = total, [int(stores[s]) for s in local_choice]
+    except _SearchTimedOut as e:
+        e.plan = (best_total, best_choice)
+        raise
+    return best_total, best_choice, nodes
+
+
+def _assignment_cost(cost, assignment, min_order, fee, free):
+    k = cost.shape[1]
+    subtotal = np.zeros(k)
+    np.add.at(subtotal, assignment, cost[np.arange(len(assignment)), assignment])
+    used = np.bincount(assignment, minlength=k) > 0
+    return float(_plan_cost(subtotal, used, min_order, fee, free))
+
+
+def _solve_heuristic(cost, min_order, fee, free, start=None):
+    """Best greedy split over sets of at most three stores, then single-item moves while they help."""
+    n, k = cost.shape
+    sets = [combo for size in range(1, min(3, k) + 1) for combo in itertools.combinations(range(k), size)]
+    in_set = np.zeros((len(sets), k), dtype=bool)
+    for row, combo in enumerate(sets):
+        in_set[row, list(combo)] = True
+    best_items, choice, subtotal = _greedy(cost, in_set)
+    covers = np.isfinite(best_items).all(axis=1)
+    used = (choice[:, :, None] == np.arange(k)).any(axis=1) & in_set
+    actual = np.where(covers, _plan_cost(subtotal, used, min_order, fee, free), np.inf)
+    best = int(np.argmin(actual))
+    assignment, total = choice[best].copy(), float(actual[best])
+    if start is not None and start[0] < total:
+        total, assignment = start[0], np.array(start[1])
+    if not np.isfinite(total):
+        # No split over three stores covers the basket: every item at its cheapest store.
+        assignment = cost.argmin(axis=1)
+        total = _assignment_cost(cost, assignment, min_order, fee, free)
+
+    return _improve(cost, assignment, total, min_order, fee, free)
+
+
+def _improve(cost, assignment, total, min_order, fee, free):
+    """Single-item moves from assignment (costing total) while they make the plan cheaper."""
+    n, k = cost.shape
+    # Moves only touch two stores' subtotals; keep them as plain floats.
+    cost_l = cost.tolist()
+    min_order_l, fee_l, free_l = min_order.tolist(), fee.tolist(), free.tolist()
+    assignment = [int(s) for s in assignment]
+    subtotal, counts = [0.0] * k, [0] * k
+    for i, s in enumerate(assignment):
+        subtotal[s] += cost_l[i][s]
+        counts[s] += 1
+
+    def store_cost(s):
+        if not counts[s]:
+            return 0.0
+        if subtotal[s] < min_order_l[s] - EPSILON:
+            return np.inf
+        return subtotal[s] + (fee_l[s] if subtotal[s] < free_l[s] - EPSILON else 0.0)
+
+    for _ in range(HEURISTIC_ROUNDS):
+        improved = False
+        for i in range(n):
+            row = cost_l[i]
+            for s in range(k):
+                current = assignment[i]
+                if s == current or row[s] == np.inf:
+                    continue
+                subtotal[current] -= row[current]; counts[current] -= 1
+                subtotal[s] += row[s]; counts[s] += 1
+                candidate = sum(store_cost(t) for t in range(k))
+                if candidate < total - EPSILON:
+                    total, assignment[i], improved = candidate, s, True
+                else:
+                    subtotal[s] -= row[s]; counts[s] -= 1
+                    subtotal[current] += row[current]; counts[current] += 1
+        if not improved:
+            break
+    return total, assignment
+
+
+# ============================================ PLANS =============================================
+
+def optimize_basket(lines, fees=None, max_ms=BASKET_MAX_MILLISECONDS):
+    """
+    Cheapest plan for the lines ([{"name", "prices": {store: price}, "count"}]).
+    fees overrides the store terms for this call ({store: {min_order, ...}}).
+    The exact search stops after max_ms milliseconds with the best plan so far.
+    """
+    start_time = time.perf_counter()
+    if len(lines) > BASKET_MAX_LINES:
+        raise ValueError(f"at most {BASKET_MAX_LINES} items per basket")
+    names = {}
+    for line in lines:
+        for store in line["prices"]:
+            names.setdefault(store.lower(), store)
+    if len(names) > BASKET_MAX_STORES:
+        raise ValueError(f"at most {BASKET_MAX_STORES} stores per basket")
+    stores = sorted(names.values(), key=str.lower)
+    index = {store.lower(): s for s, store in enumerate(stores)}
+
+    available = [line for line in lines if line["prices"]]
+    unavailable = [line["name"] for line in lines if not line["prices"]]
+    cost = np.full((len(available), len(stores)), np.inf)
+    for i, line in enumerate(available):
+        count = max(1, int(line.get("count") or 1))
+        for store, price in line["prices"].items():
+            s = index[store.lower()]
+            cost[i, s] = min(cost[i, s], float(price) * count)
+
+    terms = [store_terms(store, fees) for store in stores]
+    min_order = np.array([float(t["min_order"]) for t in terms])
+    fee = np.array([float(t["delivery_fee"]) for t in terms])
+    free = np.array([float(t["free_delivery_above"]) for t in terms])
+
+    exact = False
+    if not available:
+        total, assignment = 0.0, []
+        exact = True
+    elif len(stores) <= BASKET_EXACT_MAX_STORES:
+        # A good plan up front lets the bounds rule out most store sets at once.
+        start = _solve_heuristic(cost, min_order, fee, free)
+        try:
+            total, assignment, nodes = _solve_exact(cost, min_order, fee, free, start_time + max_ms / 1000, start)
+            exact = True
+        except _SearchTimedOut as e:
+            log_debug(f"Basket search passed {max_ms:g}ms; keeping the best plan found", "BasketOptimizer", "WARNING")
+            total, assignment = _solve_heuristic(cost, min_order, fee, free, start=e.plan)
+    else:
+        total, assignment = _solve_heuristic(cost, min_order, fee, free)
+
+    elapsed = time.perf_counter() - start_time
+    BASKET_LATENCY.observe(elapsed)
+    if not np.isfinite(total):
+        BASKET_PLANS.inc(result="infeasible")
+        return {"feasible": False, "exact": exact, "unavailable": unavailable,
+                "message": "No combination of stores meets the minimum order amounts"}
+    BASKET_PLANS.inc(result="exact" if exact else "heuristic")
+
+    plan_stores = {}
+    assigned = []
+    for i, s in enumerate(assignment):
+        line = available[i]
+        entry = plan_stores.setdefault(s, {"store": stores[s], "items": [], "subtotal": 0.0})
+        entry["items"].append(line["name"])
+        entry["subtotal"] += float(cost[i, s])
+        assigned.append({"name": line["name"], "store": stores[s], "count": max(1, int(line.get("count") or 1)),
+                         "price": round(float(cost[i, s]), 2)})
+    for s, entry in plan_stores.items():
+        entry["delivery_fee"] = float(fee[s]) if entry["subtotal"] < free[s] - EPSILON else 0.0
+        entry["subtotal"] = round(entry["subtotal"], 2)
+
+    # What the basket costs at each store that stocks all of it, for comparison.
+    single = []
+    for s, store in enumerate(stores):
+        if available and np.isfinite(cost[:, s]).all():
+            subtotal = float(cost[:, s].sum())
+            if subtotal >= min_order[s] - EPSILON:
+                single.append({"store": store, "total": round(subtotal + (fee[s] if subtotal < free[s] - EPSILON else 0.0), 2)})
+    single.sort(key=lambda option: option["total"])
+
+    return {
+        "feasible": True,
+        "exact": exact,
+        "total": round(float(total), 2),
+        "items_total": round(sum(entry["subtotal"] for entry in plan_stores.values()), 2),
+        "delivery_fees": round(sum(entry["delivery_fee"] for entry in plan_stores.values()), 2),
+        "stores": sorted(plan_stores.values(), key=lambda entry: entry["store"].lower()),
+        "assignment": assigned,
+        "unavailable": unavailable,
+        "single_store": single,
+        "savings_vs_single_store": round(single[0]["total"] - total, 2) if single else None,
+        "elapsed_ms": round(elapsed * 1000, 2),
+    }
@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+from .metrics import CACHE_REQUESTS
+
+load_dotenv()
+
+# Location answers (serviceability, store ids) change rarely, so keep them for days.
+LOCATION_CACHE_TTL = int(os.getenv('LOCATION_CACHE_TTL', 7 * 24 * 3600))
+# Unserviceable areas are re-checked sooner in case a platform starts delivering there.
+LOCATION_NEGATIVE_CACHE_TTL = int(os.getenv('LOCATION_NEGATIVE_CACHE_TTL', 24 * 3600))
+# Admin dashboard aggregates; a short TTL keeps the numbers fresh enough.
+ANALYTICS_CACHE_TTL = int(os.getenv('ANALYTICS_CACHE_TTL', 60))
+# Admin-managed home content is invalidated by the CRUD routes; the TTL only
+# bounds staleness from edits made outside this process (other workers, SQL).
+CONTENT_CACHE_TTL = int(os.getenv('CONTENT_CACHE_TTL', 300))
+# Platform sessions reused across searches in a geo-cell while the proxy budget is tight.
+CREDENTIAL_CACHE_TTL = int(os.getenv('CREDENTIAL_CACHE_TTL', 1800))
+GEOCODE_CACHE_TTL = int(os.getenv('GEOCODE_CACHE_TTL', 30 * 24 * 3600))
+# Snapshot of the geocode cache, loaded before workers fork and merged into on worker shutdown.
+GEOCODE_CACHE_FILE = os.getenv(
+    'GEOCODE_CACHE_FILE',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'geocode_cache.json')
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: single process, nothing to serialise
+    fcntl = None
+
+
+@contextmanager
+def snapshot_lock(path):
+    """
+    Hold an exclusive lock on path's ".lock" sibling, so workers shutting down
+    together merge into a snapshot one at a time instead of overwriting each other.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(f"{path}.lock", 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class TTLCache:
+    """Thread-safe in-process cache where every entry expires after a TTL."""
+
+    def __init__(self, name, ttl, max_entries=10000):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                del self._data[key]
+                entry = None
+        CACHE_REQUESTS.inc(cache=self.name, result="miss" if entry is None else "hit")
+        return default if entry is None else entry[0]
+
+    def peek(self, key, default=None):
+        """get() without counting a hit or miss, for background maintenance."""
+        with self._lock:
+            entry = self._data.get(key)
+        return default if entry is None or entry[1] < time.monotonic() else entry[0]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key not in self._data and len(self._data) >= self.max_entries:
+                self._evict()
+            self._data[key] = (value, expires_at)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    @staticmethod
+    def _read_snapshot(path):
+        """[[key, value, wall-clock expiry], ...] from a dump() file."""
+        with open(path, encoding='utf-8') as f:
+            snapshot = json.load(f)
+        if isinstance(snapshot, list):
+            # Older snapshots: bare [key, value, remaining] rows, timed from the file's mtime.
+            saved_at = os.path.getmtime(path)
+            rows = snapshot
+        else:
+            saved_at, rows = snapshot["saved_at"], snapshot["entries"]
+        return [[key, value, saved_at + remaining] for key, value, remaining in rows]
+
+    def dump(self, path):
+        """
+        Write live entries (JSON-serialisable keys and values only) with their
+        remaining TTL. Every worker fills its own copy of the cache, so entries
+        already in the file are kept unless this process has the same key with
+        a later expiry.
+        """
+        now, wall_now = time.monotonic(), time.time()
+        with self._lock:
+            ours = [[k, v, wall_now + exp - now] for k, (v, exp) in self._data.items() if exp > now]
+        with snapshot_lock(path):
+            merged = {}
+            if os.path.exists(path):
+                try:
+                    merged = {json.dumps(k): [k, v, exp] for k, v, exp in self._read_snapshot(path) if exp > wall_now}
+                except (OSError, ValueError, KeyError, TypeError):
+                    merged = {}
+            for k, v, exp in ours:
+                slot = json.dumps(k)
+                if slot not in merged or merged[slot][2] <= exp:
+                    merged[slot] = [k, v, exp]
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"saved_at": wall_now, "entries": [[k, v, exp - wall_now] for k, v, exp in merged.values()]}, f)
+            os.replace(tmp_path, path)
+
+    def load(self, path):
+        if not os.path.exists(path):
+            return 0
+        entries = self._read_snapshot(path)
+        wall_now = time.time()
+        for key, value, expires_at in entries:
+            if expires_at > wall_now:
+                self.set(key, value, ttl=expires_at - wall_now)
+        return len(entries)
+
+    def _evict(self):
+        # Drop expired entries first, then the ones closest to expiry.
+        now = time.monotonic()
+        expired = [k for k, (_, exp) in self._data.items() if exp < now]
+        for k in expired:
+            del self._data[k]
+        if len(self._data) >= self.max_entries:
+            oldest = sorted(self._data, key=lambda k: self._data[k][1])[:max(1, self.max_entries // 10)]
+            for k in oldest:
+                del self._data[k]
+
+
+class ContentCache:
+    """
+    Read-through cache for admin-managed content. Each entry keeps the loaded
+    data and an ETag derived from it; writers call invalidate() with the keys
+    they touched. A load that an invalidate() overlaps is returned to its
+    caller but not cached, since it may have read the data before the write.
+    """
+
+    def __init__(self, ttl):
+        self._cache = TTLCache("content", ttl, max_entries=256)
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._dependents = {}
+        # key -> number of invalidations, to spot loads that raced one
+        self._generations = {}
+
+    def add_dependency(self, key, *sources):
+        """Invalidate key whenever any of sources is invalidated (e.g. combined documents)."""
+        for source in sources:
+            self._dependents.setdefault(source, set()).add(key)
+
+    @staticmethod
+    def make_etag(data):
+        payload = json.dumps(data, sort_keys=True, default=str).encode('utf-8')
+        return hashlib.sha1(payload).hexdigest()
+
+    def get(self, key, loader):
+        """Return (data, etag), calling loader() on a miss. Loader errors are not cached."""
+        entry = self._cache.get(key)
+        if entry is not None:
+            return entry
+        # Per-key lock: one load per key, while loaders may read other keys.
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                with self._lock:
+                    generation = self._generations.get(key, 0)
+                data = loader()
+                entry = (data, self.make_etag(data))
+                with self._lock:
+                    if self._generations.get(key, 0) == generation:
+                        self._cache.set(key, entry)
+        return entry
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                for touched in (key, *self._dependents.get(key, ())):
+                    self._generations[touched] = self._generations.get(touched, 0) + 1
+                    self._cache.delete(touched)
+
+
+# DMart serviceability keyed by Google place_id: True / False
+dmart_serviceability_cache = TTLCache("dmart_serviceability", LOCATION_CACHE_TTL)
+# Instamart store resolution keyed by geo-cell: the get_store_data result dict
+instamart_store_cache = TTLCache("instamart_store", LOCATION_CACHE_TTL)
+# Platforms that said they do not deliver to a geo-cell: (platform key, geo-cell) -> reason.
+# The orchestrator skips them there until the entry expires.
+unserviceable_cache = TTLCache("unserviceable_locations", LOCATION_NEGATIVE_CACHE_TTL, max_entries=50000)
+# Platform credentials keyed by (platform key, geo-cell), from recent searches
+credential_cache = TTLCache("platform_credentials", CREDENTIAL_CACHE_TTL)
+# Google geocode responses keyed by the geocoded string
+geocode_cache = TTLCache("geocode", GEOCODE_CACHE_TTL, max_entries=50000)
+# Customer analytics snapshot from the customer_analytics_snapshot database function
+analytics_cache = TTLCache("analytics", ANALYTICS_CACHE_TTL, max_entries=16)
+# Revoked access-token ids, each kept until its token would have expired
+revoked_tokens = TTLCache("revoked_tokens", 24 * 3600, max_entries=100000)
+# Offers, background images, daily needs and trending rows served to the app
+content_cache = ContentCache(CONTENT_CACHE_TTL)
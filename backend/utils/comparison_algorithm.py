@@ -4,9 +4,14 @@ import json
 import os
 from dotenv import load_dotenv
 load_dotenv()
-from sentence_transformers import SentenceTransformer
 import numpy as np
 import sys
+import threading
+import time
+import heapq
+import bisect
+
+from .metrics import record_stage, EMBEDDING_LATENCY, GROUPING_LATENCY, GROUPED_PRODUCTS
 
 # Remove Mistral-related constants
 # MISTRAL_API_KEY = os.environ.get("MISTRAL_API_KEY")
@@ -15,6 +20,24 @@ import sys
 PRICE_TOLERANCE = 0.20
 NAME_SIMILARITY_THRESHOLD = 0.90
 QUANTITY_TOLERANCE = 0.10
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+
+_embedding_model = None
+_embedding_model_lock = threading.Lock()
+
+def get_embedding_model():
+    # Loading the model takes seconds; do it once per process and share it.
+    global _embedding_model
+    if _embedding_model is None:
+        with _embedding_model_lock:
+            if _embedding_model is None:
+                # Imported here: sentence_transformers pulls in torch, which
+                # dominates import time for routes that never embed anything.
+                from sentence_transformers import SentenceTransformer
+                print("Initializing SentenceTransformer model...")
+                _embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+                print("Model initialized.")
+    return _embedding_model
 
 def parse_quantity(quantity_str):
     if not isinstance(quantity_str, str):
@@ -88,109 +111,311 @@ def are_quantities_similar(q1, q2, tolerance):
     return abs(value1 - value2) / max_val <= tolerance
 
 
-def group_and_sort_products(products_data, search_query):
-    # Initialize the SentenceTransformer model
-    print("Initializing SentenceTransformer model...")
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    print("Model initialized.")
-
-    print("Generating query embedding...")
-    try:
-        # Generate query embedding using SentenceTransformer
-        query_embedding_np = model.encode(search_query, show_progress_bar=False)
-        print(f"Query embedding generated (dimension: {len(query_embedding_np)}).")
-    except Exception as e:
-        print(f"Error getting query embedding: {e}")
-        raise
-
-    processed_products = []
-    print("Preprocessing products...")
-    for i, p in enumerate(products_data):
-        try:
-            price_str = str(p.get('price', 'NaN'))
-            price = float(price_str.replace(',', '')) if price_str != 'NaN' else None
-        except ValueError: price = None
-        quantity_str = p.get('quantity', ''); parsed_qty = parse_quantity(quantity_str)
-        processed_products.append({
-            'original_data': p, 'id': i, 'name': p.get('name', ''),
-            'price': price, 'parsed_quantity': parsed_qty, 'embedding': None
-        })
-
-    print("Generating name embeddings using all-MiniLM-L6-v2...")
-    product_names = [p['name'] for p in processed_products if p['name']]
-    original_indices_with_names = [i for i, p in enumerate(processed_products) if p['name']]
-
-    if not product_names:
-        print("Warning: No valid product names found to generate embeddings.")
-        embeddings_np = []
-    else:
-        try:
-            # Process in batches to avoid memory issues (if needed)
-            batch_size = 128  # Adjust based on your memory constraints
-            embeddings_list = []
-            
-            for i in range(0, len(product_names), batch_size):
-                batch = product_names[i:i+batch_size]
-                # Generate embeddings for the batch
-                batch_embeddings = model.encode(batch, show_progress_bar=False)
-                embeddings_list.extend(batch_embeddings)
-            
-            # Map embeddings back to products
-            full_embeddings_np = [None] * len(processed_products)
-            for idx, original_idx in enumerate(original_indices_with_names):
-                if idx < len(embeddings_list):
-                    full_embeddings_np[original_idx] = embeddings_list[idx]
-            
-            embeddings_np = full_embeddings_np
-
-        except Exception as e:
-            print(f"Error generating embeddings: {e}")
-            raise
-
-    # Assign embeddings to products
-    for i, p in enumerate(processed_products):
-        if i < len(embeddings_np): p['embedding'] = embeddings_np[i]
-        else: p['embedding'] = None # Fallback if something went wrong with length
-
-    print(f"Embeddings generated for {len([e for e in embeddings_np if e is not None])} products.")
-
-    groups = []
-    grouped_ids = set()
-
-    print("Grouping products...")
-    for i, product1 in enumerate(processed_products):
-        if product1['id'] in grouped_ids: continue
-        current_group_items = [product1]; grouped_ids.add(product1['id'])
-
-        for j in range(i + 1, len(processed_products)):
-            product2 = processed_products[j]
-            if product2['id'] in grouped_ids: continue
-            if product1['embedding'] is None or product2['embedding'] is None: continue
-
-            price_match = are_prices_close(product1['price'], product2['price'], PRICE_TOLERANCE)
-            quantity_match = are_quantities_similar(product1['parsed_quantity'], product2['parsed_quantity'], QUANTITY_TOLERANCE)
-
-            emb1, emb2 = product1['embedding'], product2['embedding']
-            norm1, norm2 = np.linalg.norm(emb1), np.linalg.norm(emb2)
-            name_sim = np.dot(emb1, emb2) / (norm1 * norm2) if norm1 > 0 and norm2 > 0 else 0.0
-            name_match = name_sim >= NAME_SIMILARITY_THRESHOLD
-
-            if price_match and quantity_match and name_match:
-                current_group_items.append(product2)
-                grouped_ids.add(product2['id'])
-
+def unit_vector(embedding):
+    """embedding scaled to length 1, or None when it is missing or all zeros."""
+    if embedding is None: return None
+    norm = np.linalg.norm(embedding)
+    return embedding / norm if norm > 0 else None
+
+
+def is_same_product(product1, product2):
+    # 'unit' holds the normalized name embedding, so cosine similarity is a dot product.
+    if product1['unit'] is None or product2['unit'] is None: return False
+    if not are_prices_close(product1['price'], product2['price'], PRICE_TOLERANCE): return False
+    if not are_quantities_similar(product1['parsed_quantity'], product2['parsed_quantity'], QUANTITY_TOLERANCE): return False
+    return float(np.dot(product1['unit'], product2['unit'])) >= NAME_SIMILARITY_THRESHOLD
+
+
+def record_catalog_groups(group_items_list, catalog):
+    """
+    Persist groups as canonical products; new listings join their group's existing id if it has one.
+    A new group is only persisted once it spans two platforms: a listing seen alone stays unknown,
+    so later searches still compare it with other platforms' listings.
+    """
+    from .product_catalog import new_canonical_id
+    new_products, new_members = [], []
+    for items in group_items_list:
+        canonical_id = next((item['catalog_id'] for item in items if item['catalog_id']), None)
+        if canonical_id is None:
+            if len({str(item['original_data'].get('platform', '')).lower() for item in items}) < 2:
+                continue
+            canonical_id = new_canonical_id()
+            seed = items[0]['original_data']
+            new_products.append((canonical_id, seed.get('name', ''), str(seed.get('quantity', '')), seed.get('image_url')))
+        for item in items:
+            # Known listings are rewritten only when their name (and so their embedding) changed.
+            if item['catalog_id'] and not item['embedded']:
+                continue
+            data = item['original_data']
+            new_members.append((item['member_key'], canonical_id, str(data.get('platform', '')), item['name'],
+                                str(data.get('quantity', '')), data.get('product_url'), item['embedding']))
+            item['catalog_id'], item['embedded'] = canonical_id, False
+    catalog.record(new_products, new_members)
+
+
+def _sort_key(group):
+    query_similarity = group.get('_query_similarity', -1.0)
+    num_stores = len(group['price'])
+    min_price = group.get('_min_price', float('inf'))
+    if min_price is None: min_price = float('inf')
+    min_qty = group.get('_min_quantity_value', float('inf'))
+    if min_qty is None: min_qty = float('inf')
+    return (-query_similarity, -num_stores, min_price, min_qty)
+
+
+class GroupingState:
+    """
+    The grouping of one search's products, kept so that added and removed
+    listings (a retried platform, a late arrival) regroup only what they touch:
+
+        state = GroupingState(search_query)
+        groups = state.apply_delta(added=all_products)
+        groups = state.replace_platform("Instamart", retried_products)
+
+    Every call returns what group_and_sort_products would for the current
+    products in the order they were added. Known listings group by canonical
+    id, seeded by the earliest of them, as long as they still match that seed
+    (prices and quantities drift); one that does not is placed like an
+    unknown listing. Two known groups whose seeds match are one product: the
+    later id is merged into the earlier, here and in the catalog. An unknown
+    listing joins the earliest earlier unknown seed it matches, else the
+    first known group whose seed it matches, else seeds its own group. A
+    delta re-places only the added listings, the members of groups that lost
+    their seed and the listings matching a new seed that outranks their
+    current group; only groups whose members changed are rebuilt before the
+    re-rank. Not thread-safe: one state per search.
+    """
+
+    def __init__(self, search_query, model=None):
+        self.search_query = search_query
+        self.model = model
+        self.query_unit = None
+        # id -> processed product; ids grow in the order products were added
+        self.items = {}
+        self._next_id = 0
+        # canonical id -> ids of all its listings, ascending
+        self._listed = {}
+        # canonical id -> ids of the listings matching its seed, the seed (oldest listing) first
+        self._known = {}
+        # ids of catalog listings that do not match their group's seed; placed as unknown
+        self._mismatched = set()
+        self._known_order = []
+        # unknown listing id -> its group: ('u', seed id) or ('k', canonical id)
+        self._assign = {}
+        # group -> ids of the unknown listings in it
+        self._members = {}
+        # ids of unknown listings that seed a group, ascending
+        self._seeds = []
+        # group -> (first id, sort key, output group)
+        self._groups = {}
+        self._touched = set()
+
+    # --- Preprocessing ---
+
+    def _process(self, products_data):
+        """Parse prices and quantities and resolve catalog listings; embeddings come later."""
+        # Imported here: the catalog module imports parse_quantity from this one.
+        from .product_catalog import product_catalog, member_key, PRODUCT_CATALOG_ENABLED
+        processed_products = []
+        for p in products_data:
+            try:
+                price_str = str(p.get('price', 'NaN'))
+                price = float(price_str.replace(',', '')) if price_str != 'NaN' else None
+            except ValueError: price = None
+            quantity_str = p.get('quantity', ''); parsed_qty = parse_quantity(quantity_str)
+            processed_products.append({
+                'original_data': p, 'id': self._next_id, 'name': p.get('name', ''),
+                'price': price, 'parsed_quantity': parsed_qty, 'embedding': None, 'unit': None,
+                'member_key': member_key(p), 'canonical_id': None, 'catalog_id': None, 'embedded': False
+            })
+            self._next_id += 1
+
+        # Listings already in the catalog bring their canonical id and stored embedding.
+        if PRODUCT_CATALOG_ENABLED and processed_products:
+            known = product_catalog.resolve([p['member_key'] for p in processed_products],
+                                            [p['name'] for p in processed_products])
+            for p in processed_products:
+                if p['member_key'] in known:
+                    p['canonical_id'], p['embedding'] = known[p['member_key']]
+                    p['catalog_id'] = p['canonical_id']
+        return processed_products
+
+    # --- Placement ---
+
+    def _rank(self, group, item_id):
+        """Preference of an unknown listing for a group: lower wins."""
+        kind, ref = group
+        if kind == 'u':
+            return (2, 0) if ref == item_id else (0, ref)
+        seeds = self._known.get(ref)
+        return (1, seeds[0]) if seeds else (3, 0)
+
+    def _choose(self, item_id):
+        item = self.items[item_id]
+        if item['unit'] is not None:
+            for seed_id in self._seeds:
+                if seed_id >= item_id: break
+                if is_same_product(self.items[seed_id], item): return ('u', seed_id)
+            for canonical_id in self._known_order:
+                if is_same_product(self.items[self._known[canonical_id][0]], item): return ('k', canonical_id)
+        return ('u', item_id)
+
+    def _outranked_by(self, seed, rank):
+        """Unknown listings matching seed that currently sit in a group they like less than rank."""
+        return [item_id for item_id, group in self._assign.items()
+                if item_id != seed['id'] and self._rank(group, item_id) > rank
+                and is_same_product(seed, self.items[item_id])]
+
+    def _remove(self, item_id, dirty, reseeded):
+        item = self.items.pop(item_id)
+        canonical_id = item['canonical_id']
+        if canonical_id is not None:
+            listed = self._listed[canonical_id]
+            listed.remove(item_id)
+            if not listed:
+                del self._listed[canonical_id]
+            if item_id not in self._mismatched:
+                ids = self._known[canonical_id]
+                if ids[0] == item_id:
+                    reseeded.add(canonical_id)
+                ids.remove(item_id)
+                if not ids:
+                    del self._known[canonical_id]
+                self._touched.add(('k', canonical_id))
+                return
+            self._mismatched.discard(item_id)
+        self._unplace(item_id, dirty)
+
+    def _unplace(self, item_id, dirty):
+        """Take an unknown listing out of its group; listings it seeded choose again."""
+        dirty.discard(item_id)
+        group = self._assign.pop(item_id, None)
+        if group is None:
+            return
+        self._touched.add(group)
+        members = self._members.get(group)
+        if members is not None:
+            # Already gone when this listing's seed was removed in the same delta.
+            members.discard(item_id)
+        if group == ('u', item_id):
+            del self._seeds[bisect.bisect_left(self._seeds, item_id)]
+            dirty.update(self._members.pop(group))
+
+    def _refit(self, canonical_id, dirty, reseeded):
+        """Split a known group's listings into those matching its seed and those placed as unknown."""
+        listed = self._listed.get(canonical_id)
+        old = self._known.get(canonical_id)
+        self._touched.add(('k', canonical_id))
+        if not listed:
+            self._known.pop(canonical_id, None)
+            return
+        seed = self.items[listed[0]]
+        fitted = [listed[0]] + [item_id for item_id in listed[1:] if is_same_product(seed, self.items[item_id])]
+        matching = set(fitted)
+        for item_id in listed:
+            item = self.items[item_id]
+            if item_id in matching and item_id in self._mismatched:
+                self._mismatched.discard(item_id)
+                self._unplace(item_id, dirty)
+                if item['catalog_id'] != canonical_id:
+                    # Recorded elsewhere while it did not match: move its membership back.
+                    item['catalog_id'], item['embedded'] = canonical_id, True
+            elif item_id not in matching and item_id not in self._mismatched:
+                self._mismatched.add(item_id)
+                # Recorded again with whatever group it joins now.
+                item['catalog_id'] = None
+                dirty.add(item_id)
+        if not old or old[0] != fitted[0]:
+            reseeded.add(canonical_id)
+        self._known[canonical_id] = fitted
+
+    def _merge_known(self, candidates, dirty, reseeded, catalog):
+        """Merge known groups whose seeds match the seed of a group in candidates into the older one."""
+        seed_of = lambda canonical_id: self._known[canonical_id][0]
+        candidates = set(candidates)
+        while candidates:
+            canonical_id = min(candidates, key=seed_of)
+            candidates.discard(canonical_id)
+            seed = self.items[seed_of(canonical_id)]
+            match = next((other for other in sorted(self._known, key=seed_of)
+                          if other != canonical_id and is_same_product(self.items[seed_of(other)], seed)), None)
+            if match is None:
+                continue
+            keep, drop = sorted((canonical_id, match), key=seed_of)
+            candidates.discard(drop)
+            for item_id in self._listed.pop(drop):
+                item = self.items[item_id]
+                item['canonical_id'] = keep
+                if item['catalog_id'] == drop:
+                    item['catalog_id'] = keep
+                bisect.insort(self._listed[keep], item_id)
+            # Its listings are re-checked against the kept seed; its unknown members choose again.
+            del self._known[drop]
+            dirty.update(self._members.pop(('k', drop), ()))
+            self._touched.add(('k', drop))
+            reseeded.discard(drop)
+            catalog.merge(drop, keep)
+            self._refit(keep, dirty, reseeded)
+            candidates.add(keep)
+
+    def _settle(self, dirty):
+        # Ids in ascending order: a listing's group depends only on the seeds before it,
+        # and every listing a change can affect comes after the listing that changed.
+        pending = set(dirty)
+        heap = list(pending)
+        heapq.heapify(heap)
+
+        def push(item_id):
+            if item_id not in pending:
+                pending.add(item_id)
+                heapq.heappush(heap, item_id)
+
+        while heap:
+            item_id = heapq.heappop(heap)
+            pending.discard(item_id)
+            if item_id not in self.items:
+                continue
+            old, new = self._assign.get(item_id), self._choose(item_id)
+            if old == new:
+                continue
+            self._assign[item_id] = new
+            if old is not None:
+                self._touched.add(old)
+                members = self._members.get(old)
+                if members is not None:
+                    members.discard(item_id)
+                if old == ('u', item_id):
+                    del self._seeds[bisect.bisect_left(self._seeds, item_id)]
+                    for member_id in self._members.pop(old):
+                        push(member_id)
+            self._members.setdefault(new, set()).add(item_id)
+            self._touched.add(new)
+            if new == ('u', item_id):
+                bisect.insort(self._seeds, item_id)
+                for later_id in self._outranked_by(self.items[item_id], (0, item_id)):
+                    if later_id > item_id:
+                        push(later_id)
+
+    # --- Output ---
+
+    def _group_items(self, group):
+        kind, ref = group
+        unknown = [self.items[item_id] for item_id in sorted(self._members.get(group, ()))]
+        if kind == 'u':
+            return unknown
+        return [self.items[item_id] for item_id in self._known.get(ref, ())] + unknown
+
+    def _build_group(self, current_group_items):
         representative_product = current_group_items[0]['original_data']
-        representative_embedding = current_group_items[0]['embedding']
+        representative_unit = current_group_items[0]['unit']
 
         query_sim_score = -1.0
-        if representative_embedding is not None and query_embedding_np is not None:
-            rep_norm = np.linalg.norm(representative_embedding); query_norm = np.linalg.norm(query_embedding_np)
-            if rep_norm > 0 and query_norm > 0:
-                 query_sim_score = np.dot(representative_embedding, query_embedding_np) / (rep_norm * query_norm)
+        if representative_unit is not None and self.query_unit is not None:
+            query_sim_score = float(np.dot(representative_unit, self.query_unit))
 
         output_group = {
             "name": representative_product['name'], "image": representative_product.get('image_url'),
-            "_internal_items": current_group_items, "_query_similarity": query_sim_score, "price": []
+            "_query_similarity": query_sim_score, "price": []
         }
         min_price = float('inf'); min_quantity_value = float('inf')
 
@@ -205,28 +430,132 @@ def group_and_sort_products(products_data, search_query):
 
         output_group["_min_price"] = min_price if min_price != float('inf') else None
         output_group["_min_quantity_value"] = min_quantity_value if min_quantity_value != float('inf') else None
+        sort_key = _sort_key(output_group)
+        del output_group['_min_price']; del output_group['_min_quantity_value']; del output_group['_query_similarity']
+        return sort_key, output_group
+
+    # --- Deltas ---
+
+    def apply_delta(self, added=(), removed=()):
+        """
+        Add products and remove listings (product dicts or member keys), then
+        return the top 40 groups, best first.
+        """
+        new_items = self._process(list(added)) if added else []
+        if new_items:
+            embed_pending([self], [new_items], self.model)
+        return self._apply(new_items, removed)
+
+    def _apply(self, new_items, removed=()):
+        from .product_catalog import product_catalog, member_key, PRODUCT_CATALOG_ENABLED
+        removed_keys = {key if isinstance(key, str) else member_key(key) for key in removed}
+
+        grouping_start = time.perf_counter()
+        dirty, reseeded, refit = set(), set(), set()
+        if removed_keys:
+            for item_id in [item_id for item_id, item in self.items.items() if item['member_key'] in removed_keys]:
+                self._remove(item_id, dirty, reseeded)
+
+        for item in new_items:
+            self.items[item['id']] = item
+            if item['canonical_id'] is None:
+                dirty.add(item['id'])
+                continue
+            self._listed.setdefault(item['canonical_id'], []).append(item['id'])
+            refit.add(item['canonical_id'])
+
+        # Known groups that gained listings or lost their seed re-check them against the
+        # (new) seed; a new seed that matches another known group's merges the two.
+        for canonical_id in sorted(refit | reseeded, key=str):
+            self._refit(canonical_id, dirty, reseeded)
+        self._merge_known([canonical_id for canonical_id in reseeded if canonical_id in self._known],
+                          dirty, reseeded, product_catalog)
+
+        # A known group that appeared, vanished or changed seed: its unknown members
+        # choose again, and so does anything its (new) seed would now win.
+        self._known_order = sorted(self._known, key=lambda canonical_id: self._known[canonical_id][0])
+        for canonical_id in reseeded:
+            group = ('k', canonical_id)
+            dirty.update(self._members.get(group, ()))
+            if canonical_id in self._known:
+                dirty.update(self._outranked_by(self.items[self._known[canonical_id][0]], self._rank(group, None)))
+        self._settle(dirty)
+
+        touched = []
+        for group in self._touched:
+            items = self._group_items(group)
+            if items:
+                self._groups[group] = (items[0]['id'],) + self._build_group(items)
+                touched.append(items)
+            else:
+                self._groups.pop(group, None)
+                self._members.pop(group, None)
+        self._touched = set()
+
+        if PRODUCT_CATALOG_ENABLED:
+            record_catalog_groups(touched, product_catalog)
+
+        ranked = sorted(self._groups.values(), key=lambda entry: (entry[1], entry[0]))
+        grouping_time = time.perf_counter() - grouping_start
+        GROUPING_LATENCY.observe(grouping_time)
+        record_stage("grouping", grouping_time)
+        print(f"Grouping complete. Found {len(ranked)} groups.")
+        return [{**output_group, "price": list(output_group["price"])} for _, _, output_group in ranked[:40]]
+
+    def replace_platform(self, platform, products_data):
+        """Swap in a platform's refreshed results."""
+        platform = str(platform).lower()
+        stale = [item['member_key'] for item in self.items.values()
+                 if str(item['original_data'].get('platform', '')).lower() == platform]
+        return self.apply_delta(added=products_data, removed=stale)
+
+
+def embed_pending(states, processed_lists, model=None):
+    """
+    Embed what the states still lack, their queries and the names of the
+    processed products not resolved from the catalog, in one batched pass.
+    """
+    model = model or get_embedding_model()
+    GROUPED_PRODUCTS.inc(sum(len(items) for items in processed_lists))
+    embedding_start = time.perf_counter()
+
+    queries = [state for state in states if state.query_unit is None]
+    to_embed = [p for items in processed_lists for p in items if p['name'] and p['embedding'] is None]
+    texts = [state.search_query for state in queries] + [p['name'] for p in to_embed]
+    print(f"Generating {len(texts)} embeddings using {EMBEDDING_MODEL_NAME}...")
+    try:
+        # Process in batches to avoid memory issues (if needed)
+        batch_size = 128  # Adjust based on your memory constraints
+        embeddings_list = []
+        for i in range(0, len(texts), batch_size):
+            embeddings_list.extend(model.encode(texts[i:i+batch_size], show_progress_bar=False))
+    except Exception as e:
+        print(f"Error generating embeddings: {e}")
+        raise
 
-        groups.append(output_group)
+    for state, embedding in zip(queries, embeddings_list):
+        state.query_unit = unit_vector(embedding)
+    for p, embedding in zip(to_embed, embeddings_list[len(queries):]):
+        p['embedding'] = embedding
+        p['embedded'] = True
+    for items in processed_lists:
+        for p in items:
+            p['unit'] = unit_vector(p['embedding'])
 
-    print(f"Grouping complete. Found {len(groups)} groups.")
+    embedding_time = time.perf_counter() - embedding_start
+    EMBEDDING_LATENCY.observe(embedding_time)
+    record_stage("embedding", embedding_time)
+    print(f"Embeddings generated for {len(to_embed)} products.")
 
-    print("Sorting groups...")
-    def sort_key(group):
-        query_similarity = group.get('_query_similarity', -1.0)
-        num_stores = len(group['price'])
-        min_price = group.get('_min_price', float('inf'))
-        if min_price is None: min_price = float('inf')
-        min_qty = group.get('_min_quantity_value', float('inf'))
-        if min_qty is None: min_qty = float('inf')
-        return (-query_similarity, -num_stores, min_price, min_qty)
 
-    groups.sort(key=sort_key)
-    print("Sorting complete.")
+def group_and_sort_products(products_data, search_query):
+    return GroupingState(search_query).apply_delta(added=products_data)
 
-    final_result = []
-    for group in groups:
-        del group['_internal_items']; del group['_min_price']
-        del group['_min_quantity_value']; del group['_query_similarity']
-        final_result.append(group)
 
-    return final_result[:40]
\ No newline at end of file
+def group_and_sort_product_lists(product_lists, search_queries):
+    """group_and_sort_products for several searches, embedding all of them in one pass."""
+    states = [GroupingState(search_query) for search_query in search_queries]
+    processed_lists = [state._process(products_data) for state, products_data in zip(states, product_lists)]
+    if any(processed_lists):
+        embed_pending(states, processed_lists)
+    return [state._apply(items) if items else [] for state, items in zip(states, processed_lists)]
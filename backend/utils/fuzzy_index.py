@@ -0,0 +1,166 @@
+import re
+import numpy as np
+
+# How many trigram-overlap candidates go through edit-distance verification.
+CANDIDATE_POOL = 100
+# Verification stops once limit * VERIFIED_POOL_FACTOR candidates have passed.
+VERIFIED_POOL_FACTOR = 4
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+def word_trigrams(word):
+    # pg_trgm style padding so short words and word starts still produce grams.
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def text_trigrams(text):
+    grams = set()
+    for word in tokenize(text):
+        grams |= word_trigrams(word)
+    return grams
+
+
+def max_edits(token):
+    if len(token) <= 2:
+        return 0
+    if len(token) <= 5:
+        return 1
+    return 2
+
+
+def bounded_edit_distance(a, b, limit, prefix=False):
+    """
+    Levenshtein distance between a and b, or limit + 1 once it is exceeded.
+    With prefix=True, b may be longer than a (the user is still typing a).
+    """
+    if len(a) - len(b) > limit or (not prefix and len(b) - len(a) > limit):
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j, cb in enumerate(b, 1):
+            cost = 0 if ca == cb else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if current[j] < row_min:
+                row_min = current[j]
+        if row_min > limit:
+            return limit + 1
+        previous = current
+    distance = min(previous) if prefix else previous[-1]
+    return distance if distance <= limit else limit + 1
+
+
+class TrigramIndex:
+    """Character-trigram inverted index with edit-distance verification."""
+
+    def __init__(self, names):
+        self.names = names
+        self.tokens = [tokenize(name) for name in names]
+        postings = {}
+        gram_counts = np.zeros(len(names), dtype=np.int32)
+        for idx, tokens in enumerate(self.tokens):
+            grams = set()
+            for token in tokens:
+                grams |= word_trigrams(token)
+            gram_counts[idx] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(idx)
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+        self.gram_counts = gram_counts
+
+    def extended(self, names):
+        """
+        A new index with names appended (ids continue from len(self.names)).
+        Only the posting lists of grams the new names contain are copied; the
+        rest are shared with this index, which stays valid for its readers.
+        """
+        index = TrigramIndex.__new__(TrigramIndex)
+        start = len(self.names)
+        index.names = self.names + list(names)
+        new_tokens = [tokenize(name) for name in names]
+        index.tokens = self.tokens + new_tokens
+        added = {}
+        gram_counts = np.zeros(len(names), dtype=np.int32)
+        for offset, tokens in enumerate(new_tokens):
+            grams = set()
+            for token in tokens:
+                grams |= word_trigrams(token)
+            gram_counts[offset] = len(grams)
+            for gram in grams:
+                added.setdefault(gram, []).append(start + offset)
+        index.postings = dict(self.postings)
+        for gram, ids in added.items():
+            new_ids = np.array(ids, dtype=np.int32)
+            index.postings[gram] = np.concatenate((self.postings[gram], new_ids)) if gram in self.postings else new_ids
+        index.gram_counts = np.concatenate((self.gram_counts, gram_counts))
+        return index
+
+    def _candidates(self, query_grams):
+        lists = [self.postings[g] for g in query_grams if g in self.postings]
+        if not lists:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+        overlap = np.bincount(np.concatenate(lists), minlength=len(self.names))
+        # Dice coefficient so long names do not win just by having more grams.
+        scores = 2.0 * overlap / (len(query_grams) + self.gram_counts)
+        hits = np.flatnonzero(overlap)
+        if len(hits) > CANDIDATE_POOL:
+            top = np.argpartition(-scores[hits], CANDIDATE_POOL)[:CANDIDATE_POOL]
+            hits = hits[top]
+        return hits, scores[hits]
+
+    def _verify(self, query_tokens, name_tokens, memo):
+        """
+        Total edit distance of query tokens against the name, or None if any token misses.
+        memo caches (position, name_token) distances, since vocabularies repeat across names.
+        """
+        total = 0
+        last = len(query_tokens) - 1
+        for position, token in enumerate(query_tokens):
+            if token in name_tokens:
+                continue
+            limit = max_edits(token)
+            best = limit + 1
+            for name_token in name_tokens:
+                key = (position, name_token)
+                distance = memo.get(key)
+                if distance is None:
+                    # The last token is usually half typed, so match it as a prefix.
+                    distance = bounded_edit_distance(token, name_token, limit, prefix=position == last)
+                    memo[key] = distance
+                if distance < best:
+                    best = distance
+                    if best == 0:
+                        break
+            if best > limit:
+                return None
+            total += best
+        return total
+
+    def search(self, query, limit=5):
+        query_tokens = tokenize(query)
+        if not query_tokens or not self.names:
+            return []
+        query_grams = set()
+        for token in query_tokens:
+            query_grams |= word_trigrams(token)
+
+        hits, scores = self._candidates(query_grams)
+        order = np.argsort(-scores, kind="stable")
+        ranked = []
+        memo = {}
+        # Best-overlap candidates first; a few spare verified hits are enough to re-rank.
+        for idx, score in zip(hits[order].tolist(), scores[order].tolist()):
+            distance = self._verify(query_tokens, self.tokens[idx], memo)
+            if distance is not None:
+                ranked.append((distance, -score, len(self.names[idx]), idx))
+                if len(ranked) >= limit * VERIFIED_POOL_FACTOR:
+                    break
+        ranked.sort()
+        return [self.names[idx] for _, _, _, idx in ranked[:limit]]
@@ -0,0 +1,266 @@
+"""
+Leveled logging pipeline behind universal_function.log_debug.
+
+Records are filtered by level and sampling on the calling thread, then put on
+a bounded queue; a QueueListener thread does the formatting and writing. The
+calling thread only copies dict/list payloads and args, already truncated, so
+the request can keep changing its own objects; it never serializes them.
+
+    LOG_LEVEL              minimum level: DEBUG, INFO, SUCCESS, WARNING, ERROR (default INFO)
+    LOG_LEVELS             per-logger overrides, e.g. "Orchestrator=WARNING,get_store_data=DEBUG"
+    LOG_SAMPLE_RATES       fraction of DEBUG/INFO/SUCCESS records kept per logger, e.g. "Orchestrator=0.1"
+    LOG_FORMAT             text (default) or json (one object per line)
+    LOG_MAX_PAYLOAD_CHARS  cap on the rendered message (default 2000)
+    LOG_MAX_ITEMS          items kept per list/dict in logged payloads (default 20)
+    LOG_QUEUE_SIZE         pending records before new ones are dropped (default 10000)
+"""
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import threading
+import logging.handlers
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SUCCESS = 25
+logging.addLevelName(SUCCESS, "SUCCESS")
+
+LOGGER_PREFIX = "pricely"
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+LOG_MAX_PAYLOAD_CHARS = int(os.getenv('LOG_MAX_PAYLOAD_CHARS', 2000))
+LOG_MAX_ITEMS = int(os.getenv('LOG_MAX_ITEMS', 20))
+LOG_MAX_DEPTH = 4
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+
+COLORS = {
+    "DEBUG": "\033[33m",
+    "ERROR": "\033[31m",
+    "SUCCESS": "\033[32m",
+    "INFO": "\033[36m",
+    "WARNING": "\033[33m",
+}
+RESET = "\033[0m"
+
+
+def parse_mapping(value, convert):
+    """'a=1,b=2' -> {'a': convert('1'), 'b': convert('2')}; malformed parts are skipped."""
+    mapping = {}
+    for part in (value or "").split(","):
+        name, sep, raw = part.partition("=")
+        if not sep or not name.strip():
+            continue
+        try:
+            mapping[name.strip()] = convert(raw.strip())
+        except (ValueError, KeyError):
+            continue
+    return mapping
+
+
+def level_number(name):
+    level = logging.getLevelName(name.upper())
+    if not isinstance(level, int):
+        raise ValueError(name)
+    return level
+
+
+LOGGER_LEVELS = parse_mapping(os.getenv('LOG_LEVELS'), level_number)
+SAMPLE_RATES = parse_mapping(os.getenv('LOG_SAMPLE_RATES'), float)
+
+# =============================================== PAYLOADS ===================================================
+
+def truncate_payload(data, depth=0):
+    """Bound the size of a dict/list before it is rendered: LOG_MAX_ITEMS per container, LOG_MAX_DEPTH levels."""
+    if isinstance(data, dict):
+        if depth >= LOG_MAX_DEPTH:
+            return f"<dict of {len(data)}>"
+        items = list(data.items())
+        result = {str(k): truncate_payload(v, depth + 1) for k, v in items[:LOG_MAX_ITEMS]}
+        if len(items) > LOG_MAX_ITEMS:
+            result["..."] = f"{len(items) - LOG_MAX_ITEMS} more keys"
+        return result
+    if isinstance(data, (list, tuple)):
+        if depth >= LOG_MAX_DEPTH:
+            return f"<list of {len(data)}>"
+        result = [truncate_payload(v, depth + 1) for v in data[:LOG_MAX_ITEMS]]
+        if len(data) > LOG_MAX_ITEMS:
+            result.append(f"... {len(data) - LOG_MAX_ITEMS} more items")
+        return result
+    if isinstance(data, str) and len(data) > LOG_MAX_PAYLOAD_CHARS:
+        return data[:LOG_MAX_PAYLOAD_CHARS]
+    return data
+
+
+def cap(text):
+    if len(text) <= LOG_MAX_PAYLOAD_CHARS:
+        return text
+    return f"{text[:LOG_MAX_PAYLOAD_CHARS]}... ({len(text) - LOG_MAX_PAYLOAD_CHARS} chars truncated)"
+
+
+def truncate_args(args):
+    if isinstance(args, dict):
+        return {k: truncate_payload(v) for k, v in args.items()}
+    return tuple(truncate_payload(a) for a in args)
+
+
+def snapshot_payload(record):
+    """Runs on the calling thread: replace dict/list payloads and args with truncated copies."""
+    if isinstance(record.msg, (dict, list, tuple)):
+        record.msg = truncate_payload(record.msg)
+    if record.args:
+        record.args = truncate_args(record.args)
+    record.payload_snapshot = True
+
+
+def render_message(record):
+    """Runs on the listener thread: apply lazy messages, truncate what is not yet, cap the length."""
+    msg = record.msg
+    snapshot = getattr(record, "payload_snapshot", False)
+    if callable(msg):
+        msg = msg()
+        msg = truncate_payload(msg) if isinstance(msg, (dict, list, tuple)) else msg
+    elif not snapshot and isinstance(msg, (dict, list, tuple)):
+        msg = truncate_payload(msg)
+    args = record.args
+    if isinstance(msg, (dict, list, tuple)):
+        text = json.dumps(msg, default=str)
+    elif args:
+        if not snapshot:
+            args = truncate_args(args)
+        try:
+            text = str(msg) % args
+        except (TypeError, ValueError):
+            text = f"{msg} {args}"
+    else:
+        text = str(msg)
+    return cap(text)
+
+# =============================================== HANDLERS ===================================================
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of DEBUG/INFO/SUCCESS records per logger; warnings and errors always pass."""
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = SAMPLE_RATES.get(record.name[len(LOGGER_PREFIX) + 1:])
+        return rate is None or random.random() < rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue the record with its payloads copied (no formatting here) and drop it if the queue is full."""
+
+    dropped = 0
+
+    def prepare(self, record):
+        snapshot_payload(record)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+class PayloadFormatter(logging.Formatter):
+    def __init__(self, structured=False, colored=False):
+        super().__init__()
+        self.structured = structured
+        self.colored = colored
+
+    def format(self, record):
+        message = render_message(record)
+        short_name = record.name[len(LOGGER_PREFIX) + 1:] or None
+        if self.structured:
+            entry = {
+                "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+                "level": record.levelname,
+                "logger": short_name,
+                "thread": record.threadName,
+                "message": message,
+            }
+            if record.exc_info:
+                entry["exc"] = self.formatException(record.exc_info)
+            return json.dumps(entry, default=str)
+        timestamp = datetime.fromtimestamp(record.created).strftime("%Y-%m-%d %H:%M:%S")
+        line = f"[{timestamp}] [{record.levelname}] {short_name}: {message}" if short_name else f"[{timestamp}] [{record.levelname}] {message}"
+        if record.exc_info:
+            line = f"{line}\n{self.formatException(record.exc_info)}"
+        color = COLORS.get(record.levelname) if self.colored else None
+        return f"{color}{line}{RESET}" if color else line
+
+# =============================================== PIPELINE ===================================================
+
+_root = logging.getLogger(LOGGER_PREFIX)
+_listener = None
+_lock = threading.Lock()
+
+
+def start_logging():
+    """Attach the queue handler and start the writer thread. Safe to call repeatedly."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+        log_queue = queue.Queue(LOG_QUEUE_SIZE)
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(PayloadFormatter(structured=LOG_FORMAT == "json", colored=LOG_FORMAT != "json" and sys.stdout.isatty()))
+        queue_handler = DroppingQueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter())
+        for handler in list(_root.handlers):
+            _root.removeHandler(handler)
+        _root.addHandler(queue_handler)
+        _root.setLevel(level_number(LOG_LEVEL))
+        _root.propagate = False
+        for name, level in LOGGER_LEVELS.items():
+            logging.getLogger(f"{LOGGER_PREFIX}.{name}").setLevel(level)
+        _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+        _listener.start()
+
+
+def stop_logging():
+    """Flush pending records and stop the writer thread."""
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener = None
+
+
+def _restart_after_fork():
+    # The writer thread does not survive fork; gunicorn workers get a fresh one.
+    global _listener, _lock
+    _listener = None
+    _lock = threading.Lock()
+    start_logging()
+
+
+def get_logger(name=None):
+    return logging.getLogger(f"{LOGGER_PREFIX}.{name}" if name else LOGGER_PREFIX)
+
+
+def log(data, name=None, level="DEBUG", *args):
+    """
+    Log data (a string, a %-style format with args, a dict/list payload, or a
+    zero-argument callable producing any of these) under logger name.
+    """
+    levelno = logging.getLevelName(level.upper())
+    if not isinstance(levelno, int):
+        levelno = logging.INFO
+    logger = get_logger(name)
+    if logger.isEnabledFor(levelno):
+        logger.log(levelno, data, *args)
+
+
+start_logging()
+atexit.register(stop_logging)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
@@ -3,22 +3,34 @@ import random
 from dotenv import load_dotenv
 from datetime import datetime
 import base64
-import json,time, psutil
-from pyngrok import ngrok
+import json,time
+import threading
 import asyncio
 import time
 from functools import partial 
+import contextvars
 
 
 #LOCAL IMPORTS
 from .universal_function import *
 from .comparison_algorithm import *
 from .BigBasket_Handler import search_bigbasket
-from .Blinkit_Handler import search_blinkit
-from .Instamart_Handler import search_instamart
+from .Blinkit_Handler import search_blinkit, get_blinkit_credentials
+from .Instamart_Handler import search_instamart, get_instamart_credentials
 from .Dmart_Handler import search_dmart
 from .Zepto_Handler import search_zepto
 from .supabase_handler import select_data
+from .autocomplete_index import autocomplete_index
+from .semantic_index import semantic_index
+from .cache_handler import geocode_cache, credential_cache, unserviceable_cache, GEOCODE_CACHE_FILE
+from .proxy_scheduler import proxy_scheduler
+from .price_history import price_history, canonical_product_key, PRICE_HISTORY_ENABLED
+from .product_catalog import product_catalog, PRODUCT_CATALOG_ENABLED
+from .search_refresh import search_result_cache, search_popularity, search_refresher, normalize_query, cache_fresh
+from .platform_router import platform_router, ROUTED_PLATFORMS, PLATFORM_ROUTER_FILE
+from .profiler import register_thread
+from .auth_tokens import start_revocation_sync
+from .metrics import timer, record_stage, SEARCH_LATENCY, GEOCODE_LATENCY, HANDLER_LATENCY, HANDLER_RESULTS, HANDLER_PRODUCTS, PLATFORM_SKIPS
 
 
 load_dotenv()
@@ -52,6 +64,8 @@ def get_api_key():
         raise
 
 def kill_ngrok_processes():
+    import psutil
+    from pyngrok import ngrok
     ngrok.set_auth_token(os.getenv("NGROK_AUTH_TOKEN"))
     # Kill using pyngrok
     try:
@@ -86,10 +100,128 @@ def kill_ngrok_processes():
 
 
 
-async def get_compared_data_async(search_query, location_data, initial_credentials=None):
+_warm_state = {"model": False, "autocomplete": False, "semantic": False, "geocode": False, "catalog": False}
+
+# Serve requests while warming up; /readyz reports 503 until it finishes.
+WARM_UP_BACKGROUND = os.getenv('WARM_UP_BACKGROUND', '1') != '0'
+
+# Shopping lists: items per request, and item searches in flight at once per list.
+LIST_SEARCH_MAX_ITEMS = int(os.getenv('LIST_SEARCH_MAX_ITEMS', 50))
+LIST_SEARCH_CONCURRENCY = int(os.getenv('LIST_SEARCH_CONCURRENCY', 8))
+
+# Platform keys in the order _fetch_platforms creates their tasks.
+TASK_PLATFORMS = ("BIGBASKET", "BLINKIT", "INSTAMART", "DMART", "ZEPTO")
+# Platforms whose task can be left out of a search. BigBasket's also brings
+# the quickcompare Zepto results, so it always runs.
+SKIPPABLE_PLATFORMS = ("BLINKIT", "INSTAMART", "DMART", "ZEPTO")
+
+# Platforms whose sessions are worth reusing across searches in the same cell.
+SESSION_PLATFORMS = ("BIGBASKET", "BLINKIT", "INSTAMART", "ZEPTO")
+# Platforms whose search runs on a session bootstrapped beforehand; a list bootstraps each once.
+SESSION_BOOTSTRAP = {"BLINKIT": get_blinkit_credentials, "INSTAMART": get_instamart_credentials}
+
+def warm_up():
+    """
+    Load everything a request would otherwise load lazily: the embedding model,
+    the autocomplete indexes, the geocode cache snapshot and the product catalog. Run it in the
+    server master before forking so workers share the pages copy-on-write.
+    """
+    start_time = time.time()
+    get_embedding_model()
+    _warm_state["model"] = True
+    autocomplete_index.ensure_loaded()
+    _warm_state["autocomplete"] = True
+    if semantic_index.available:
+        semantic_index.load()
+    _warm_state["semantic"] = True
+    try:
+        loaded = geocode_cache.load(GEOCODE_CACHE_FILE)
+        log_debug(f"Loaded {loaded} geocode cache entries", "WarmUp", "INFO")
+    except Exception as e:
+        log_debug(f"Could not load geocode cache snapshot: {e}", "WarmUp", "WARNING")
+    _warm_state["geocode"] = True
+    try:
+        log_debug(f"Loaded {platform_router.load(PLATFORM_ROUTER_FILE)} platform routing counts", "WarmUp", "INFO")
+    except Exception as e:
+        log_debug(f"Could not load platform routing snapshot: {e}", "WarmUp", "WARNING")
+    if PRODUCT_CATALOG_ENABLED:
+        log_debug(f"Loaded {product_catalog.load()} catalog members", "WarmUp", "INFO")
+    _warm_state["catalog"] = True
+    log_debug(f"Warm-up finished in {time.time() - start_time:.2f}s", "WarmUp", "SUCCESS")
+
+def _warm_up_and_refresh():
+    warm_up()
+    autocomplete_index.start()
+    start_revocation_sync()
+    search_refresher.start(refresh_search)
+
+def start_warm_up(background=WARM_UP_BACKGROUND):
+    """
+    warm_up() plus the autocomplete refresher, inline or in a daemon thread so
+    a single-process server can start listening at once.
+    """
+    if not background:
+        _warm_up_and_refresh()
+        return None
+    thread = threading.Thread(target=_warm_up_and_refresh, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+def save_caches():
+    try:
+        geocode_cache.dump(GEOCODE_CACHE_FILE)
+    except Exception as e:
+        log_debug(f"Could not save geocode cache snapshot: {e}", "WarmUp", "WARNING")
+    try:
+        platform_router.dump(PLATFORM_ROUTER_FILE)
+    except Exception as e:
+        log_debug(f"Could not save platform routing snapshot: {e}", "WarmUp", "WARNING")
+
+def get_readiness():
+    return all(_warm_state.values()), dict(_warm_state)
+
+def _timed_handler(platform, handler, *args):
+    with timer(HANDLER_LATENCY, f"platform.{platform}", platform=platform), register_thread():
+        return handler(*args)
+
+def _run_handler(loop, platform, handler, *args):
+    # run_in_executor does not carry context variables over; copy them so the
+    # handler's stages land in this request's timing breakdown.
+    context = contextvars.copy_context()
+    return loop.run_in_executor(None, partial(context.run, _timed_handler, platform, handler, *args))
+
+def _platform_task(loop, skip, key, platform, handler, *args):
+    """The handler's task, or an empty finished one when the platform is skipped for this search."""
+    if key not in skip:
+        return _run_handler(loop, platform, handler, *args)
+    PLATFORM_SKIPS.inc(platform=platform, reason=skip[key])
+    log_debug(f"Skipping {platform}: {skip[key]}", "Orchestrator", "INFO")
+    future = loop.create_future()
+    future.set_result({"data": [], "credentials": {}, "skipped": True})
+    return future
+
+def _caller_platforms(credentials):
+    """Platforms the caller brought its own session for; those are never cached for anyone else."""
+    return frozenset(platform for platform, creds in (credentials or {}).items() if creds)
+
+def _reuse_cached_credentials(initial_credentials, cell):
+    """initial_credentials plus sessions cached for the cell for the platforms it lacks."""
+    credentials = dict(initial_credentials or {})
+    if cell is None:
+        return credentials
+    for platform in SESSION_PLATFORMS:
+        if not credentials.get(platform):
+            cached = credential_cache.get((platform, cell))
+            if cached:
+                credentials[platform] = cached
+                log_debug(f"Reusing cached {platform} credentials for cell {cell}", "Orchestrator", "INFO")
+    return credentials
+
+async def get_compared_data_async(search_query, location_data, initial_credentials=None, full_fanout=False):
     """
     Fetches data from all platforms concurrently, compares results,
-    and returns combined data and credentials.
+    and returns combined data and credentials. full_fanout asks every
+    platform, even those known not to deliver here or not to stock the query.
     """
     start_time = time.time()
     log_debug(f"Starting concurrent search for '{search_query}'", "Orchestrator", "INFO")
@@ -97,39 +229,92 @@ async def get_compared_data_async(search_query, location_data, initial_credentia
     if initial_credentials is None:
         initial_credentials = {}
 
+    # Short on proxy credits: reuse sessions bootstrapped for nearby searches.
+    cell = get_geo_cell(location_data)
+    caller_platforms = _caller_platforms(initial_credentials)
+    if proxy_scheduler.tight():
+        initial_credentials = _reuse_cached_credentials(initial_credentials, cell)
+
+    all_products, final_credentials = await _fetch_platforms(search_query, location_data, initial_credentials, cell,
+                                                             full_fanout, caller_platforms)
+
+    compared_data = []
+    if all_products:
+        try:
+            log_debug("Running comparison algorithm...", "Orchestrator", "INFO")
+            comparison_start_time = time.time()
+            # Embedding and grouping are CPU-bound; keep the event loop free for other searches meanwhile.
+            loop = asyncio.get_running_loop()
+            compared_data = await loop.run_in_executor(None, partial(
+                contextvars.copy_context().run, group_and_sort_products, all_products, search_query))
+            comparison_time = time.time() - comparison_start_time
+            log_debug(f"Comparison finished in {comparison_time:.2f}s. Found {len(compared_data)} groups.", "Orchestrator", "SUCCESS")
+        except Exception as e:
+            log_debug(f"Comparison algorithm failed: {e}", "Orchestrator", "ERROR")
+            compared_data = [] # Return empty list on failure
+    else:
+        log_debug("No products found to compare.", "Orchestrator", "WARNING")
+
+    # --- Format Final Output ---
+    final_result = {
+        "data": compared_data,
+        "credentials": final_credentials
+    }
+
+    total_time = time.time() - start_time
+    SEARCH_LATENCY.observe(total_time)
+    record_stage("orchestration", total_time)
+    log_debug(f"Orchestration completed in {total_time:.2f} seconds.", "Orchestrator", "SUCCESS")
+
+    return final_result
+
+async def _fetch_platforms(search_query, location_data, initial_credentials, cell, full_fanout=False, caller_platforms=frozenset()):
+    """
+    Run every platform handler for one query; returns (all products, final
+    credentials). Sessions the server started are cached for the cell, the
+    ones grown from a caller's session (caller_platforms) are not.
+    """
     loop = asyncio.get_running_loop()
 
+    # Platforms that recently said they do not deliver here are not asked again until the entry expires,
+    # nor are those that searches like this one rarely find anything on.
+    skip = {}
+    if not full_fanout:
+        if cell is not None:
+            skip = {key: "unserviceable" for key in SKIPPABLE_PLATFORMS if unserviceable_cache.get((key, cell)) is not None}
+        skip.update(platform_router.plan(search_query, [key for key in ROUTED_PLATFORMS if key not in skip]))
+
     # --- Create Tasks for each platform using run_in_executor ---
     # We use partial to pass arguments to the functions running in the executor
     tasks = []
 
     # BigBasket
     bb_cred = initial_credentials.get('BIGBASKET')
-    bb_task = loop.run_in_executor(None, partial(search_bigbasket, search_query, location_data, {'BigBasket': bb_cred} if bb_cred else None))
+    bb_task = _run_handler(loop, "BigBasket", search_bigbasket, search_query, location_data, {'BigBasket': bb_cred} if bb_cred else None)
     tasks.append(bb_task)
     log_debug("Created BigBasket task", "Orchestrator")
 
     # Blinkit
     bl_cred = initial_credentials.get('BLINKIT')
-    bl_task = loop.run_in_executor(None, partial(search_blinkit, search_query, location_data, {'BLINKIT': bl_cred} if bl_cred else None))
+    bl_task = _platform_task(loop, skip, "BLINKIT", "Blinkit", search_blinkit, search_query, location_data, {'BLINKIT': bl_cred} if bl_cred else None)
     tasks.append(bl_task)
     log_debug("Created Blinkit task", "Orchestrator")
 
     # Instamart
     im_cred = initial_credentials.get('INSTAMART')
-    im_task = loop.run_in_executor(None, partial(search_instamart, search_query, location_data, {'INSTAMART': im_cred} if im_cred else None))
+    im_task = _platform_task(loop, skip, "INSTAMART", "Instamart", search_instamart, search_query, location_data, {'INSTAMART': im_cred} if im_cred else None)
     tasks.append(im_task)
     log_debug("Created Instamart task", "Orchestrator")
 
     # DMart
     dm_cred = initial_credentials.get('DMART') # DMart doesn't seem to use credentials in the provided code
-    dm_task = loop.run_in_executor(None, partial(search_dmart, search_query, location_data, None)) # Pass None for creds
+    dm_task = _platform_task(loop, skip, "DMART", "DMart", search_dmart, search_query, location_data, None) # Pass None for creds
     tasks.append(dm_task)
     log_debug("Created DMart task", "Orchestrator")
 
     # Zepto
     zp_cred = initial_credentials.get('ZEPTO')
-    zp_task = loop.run_in_executor(None, partial(search_zepto, search_query, location_data, {'ZEPTO': zp_cred} if zp_cred else None))
+    zp_task = _platform_task(loop, skip, "ZEPTO", "Zepto", search_zepto, search_query, location_data, {'ZEPTO': zp_cred} if zp_cred else None)
     tasks.append(zp_task)
     log_debug("Created Zepto task", "Orchestrator")
 
@@ -138,6 +323,11 @@ async def get_compared_data_async(search_query, location_data, initial_credentia
     results = await asyncio.gather(*tasks, return_exceptions=True)
     log_debug("All tasks completed.", "Orchestrator", "INFO")
 
+    for key, res in zip(TASK_PLATFORMS, results):
+        if cell is not None and isinstance(res, dict) and res.get("unserviceable"):
+            unserviceable_cache.set((key, cell), res["unserviceable"])
+            log_debug(f"{key} does not deliver to cell {cell}: {res['unserviceable']}", "Orchestrator", "INFO")
+
     # --- Process Results ---
     all_products = []
     final_credentials = {}
@@ -148,6 +338,7 @@ async def get_compared_data_async(search_query, location_data, initial_credentia
     for i, res in enumerate(results):
         platform = platform_names[i].upper()
         if isinstance(res, Exception):
+            HANDLER_RESULTS.inc(platform=platform_names[i], outcome="error")
             log_debug(f"Task for {platform} failed: {res}", "Orchestrator", "ERROR")
             # Keep original credential if task failed, if it existed
             if platform in initial_credentials:
@@ -159,8 +350,14 @@ async def get_compared_data_async(search_query, location_data, initial_credentia
 
             if isinstance(platform_data, list):
                 all_products.extend(platform_data)
+                if platform in ROUTED_PLATFORMS and not res.get("skipped"):
+                    platform_router.record(search_query, platform, bool(platform_data))
+                HANDLER_RESULTS.inc(platform=platform_names[i], outcome="success" if platform_data else "skipped" if res.get("skipped") else "empty")
+                HANDLER_PRODUCTS.inc(len(platform_data), platform=platform_names[i])
+                proxy_scheduler.record_products(platform_names[i], len(platform_data))
                 log_debug(f"Added {len(platform_data)} products from {platform}", "Orchestrator")
             else:
+                 HANDLER_RESULTS.inc(platform=platform_names[i], outcome="empty")
                  log_debug(f"Received non-list data from {platform}: {type(platform_data)}", "Orchestrator", "WARNING")
 
 
@@ -177,62 +374,218 @@ async def get_compared_data_async(search_query, location_data, initial_credentia
                  final_credentials[platform] = {} # Or whatever default DMart should have
 
         else:
+            HANDLER_RESULTS.inc(platform=platform_names[i], outcome="error")
             log_debug(f"Unexpected result type from {platform}: {type(res)}", "Orchestrator", "ERROR")
             # Keep original credential if task gave weird result
             if platform in initial_credentials:
                  final_credentials[platform] = initial_credentials[platform]
 
 
+    if cell is not None:
+        for platform, creds in final_credentials.items():
+            if creds and platform not in caller_platforms and creds != initial_credentials.get(platform):
+                credential_cache.set((platform, cell), creds)
+
+    if PRICE_HISTORY_ENABLED and all_products:
+        price_history.record(all_products, cell)
+
     log_debug(f"Total products collected before comparison: {len(all_products)}", "Orchestrator", "INFO")
+    return all_products, final_credentials
+
+def _cached_search(search_query, lat, lon, credentials, record=True):
+    """(cache key, cached response or None) for a search; records its popularity."""
+    cell = geo_cell_key(lat, lon)
+    if record:
+        search_popularity.record(search_query, cell, lat, lon)
+    key = (normalize_query(search_query), cell)
+    entry = search_result_cache.get(key)
+    if not cache_fresh(entry):
+        return key, None
+    record_stage("search_cache", 0.0)
+    # Results are shared between callers, sessions are not: the handlers (or
+    # credential_cache) provide one when the caller has none.
+    return key, {"data": entry["data"], "credentials": credentials or {}}
+
+def _store_search(key, data):
+    # Empty results are usually upstream failures; do not pin them for a TTL.
+    if data.get("data"):
+        search_result_cache.set(key, {"data": data["data"], "fetched_at": time.time()})
+
+async def get_compared_results_async(search_query, lat, lon, credentials=None, full_fanout=False):
+    """Async counterpart of get_compared_results for servers that own a long-lived event loop."""
+    key, cached = _cached_search(search_query, lat, lon, credentials)
+    if cached is not None and not full_fanout:
+        return cached
+    loop = asyncio.get_running_loop()
+    with timer(GEOCODE_LATENCY, "geocode"):
+        loc = await loop.run_in_executor(None, geocode_location, f'{lat},{lon}')
+    data = await get_compared_data_async(search_query, loc, credentials, full_fanout)
+    _store_search(key, data)
+    return data
+
+def get_compared_results(search_query, lat, lon, credentials=None, use_cache=True, full_fanout=False):
+    """
+    Compared results for a search, from the cache when fresh. full_fanout
+    bypasses the cache and asks every platform.
+    """
+    key, cached = _cached_search(search_query, lat, lon, credentials, record=use_cache)
+    if use_cache and not full_fanout and cached is not None:
+        return cached
+    with timer(GEOCODE_LATENCY, "geocode"):
+        loc = geocode_location(f'{lat},{lon}')
+    try:
+        loop = asyncio.get_event_loop()
+        data = loop.run_until_complete(get_compared_data_async(search_query, loc, credentials, full_fanout))
+    except RuntimeError:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        data = loop.run_until_complete(get_compared_data_async(search_query, loc, credentials, full_fanout))
+        loop.close()
+
+    log_debug("Final compared data: %s", "Orchestrator", "DEBUG", data)
+    _store_search(key, data)
+
+    return data
+
+def refresh_search(search_query, lat, lon):
+    """Re-run a search for the background refresher, reusing sessions cached for its cell."""
+    cell = geo_cell_key(lat, lon)
+    credentials = {}
+    for platform in SESSION_PLATFORMS:
+        cached = credential_cache.peek((platform, cell))
+        if cached:
+            credentials[platform] = cached
+    return get_compared_results(search_query, lat, lon, credentials, use_cache=False)
+
+async def _list_sessions(location_data, credentials, cell, full_fanout=False):
+    """One session per platform for a whole list: the request's, the cell's cached one, else one bootstrap each."""
+    sessions = _reuse_cached_credentials(credentials, cell)
+    missing = [platform for platform in SESSION_BOOTSTRAP if not sessions.get(platform)
+               and (full_fanout or cell is None or unserviceable_cache.get((platform, cell)) is None)]
+    if not missing:
+        return sessions
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(*(
+        loop.run_in_executor(None, partial(contextvars.copy_context().run, SESSION_BOOTSTRAP[platform], location_data))
+        for platform in missing
+    ), return_exceptions=True)
+    for platform, result in zip(missing, results):
+        if isinstance(result, dict) and result.get(platform):
+            sessions[platform] = result[platform]
+            if cell is not None:
+                credential_cache.set((platform, cell), result[platform])
+        elif isinstance(result, dict) and result.get("reason") == "Location not serviceable" and cell is not None:
+            unserviceable_cache.set((platform, cell), result["reason"])
+        else:
+            # Each item's handler bootstraps its own session then, as a single search would.
+            log_debug(f"Could not bootstrap a {platform} session for the list: {result}", "Orchestrator", "WARNING")
+    return sessions
+
+def _unique_items(items):
+    """The list's items, each searched once whatever its spelling, in list order."""
+    unique = {}
+    for item in items:
+        key = normalize_query(item)
+        if key and key not in unique:
+            unique[key] = str(item).strip()
+    return list(unique.values())
+
+def list_search_cost(items, lat, lon, full_fanout=False):
+    """Searches a list will run: its items not served from the search cache (at least 1)."""
+    queries = _unique_items(items)
+    if full_fanout:
+        return max(1, len(queries))
+    cell = geo_cell_key(lat, lon)
+    return max(1, sum(1 for query in queries if not cache_fresh(search_result_cache.peek((normalize_query(query), cell)))))
+
+async def get_compared_list_async(items, lat, lon, credentials=None, full_fanout=False):
+    """
+    Compare a whole shopping list at one location. Items still in the search
+    cache are served from it (unless full_fanout, which also asks every
+    platform). The rest share one geocode and one session per platform, run
+    LIST_SEARCH_CONCURRENCY at a time, and are grouped after a single
+    embedding pass over every item's products.
+    """
+    start_time = time.time()
+    queries = _unique_items(items)
+    results, pending = {}, []
+    for query in queries:
+        key, cached = _cached_search(query, lat, lon, credentials)
+        if cached is not None and not full_fanout:
+            results[query] = cached["data"]
+        else:
+            pending.append((query, key))
+
+    final_credentials = dict(credentials or {})
+    if pending:
+        loop = asyncio.get_running_loop()
+        with timer(GEOCODE_LATENCY, "geocode"):
+            loc = await loop.run_in_executor(None, geocode_location, f'{lat},{lon}')
+        cell = get_geo_cell(loc)
+        sessions = await _list_sessions(loc, credentials, cell, full_fanout)
+        semaphore = asyncio.Semaphore(LIST_SEARCH_CONCURRENCY)
+
+        async def fetch(query):
+            async with semaphore:
+                return await _fetch_platforms(query, loc, sessions, cell, full_fanout, _caller_platforms(credentials))
+
+        fetched = await asyncio.gather(*(fetch(query) for query, _ in pending), return_exceptions=True)
+        product_lists = []
+        final_credentials = dict(sessions)
+        for (query, _), res in zip(pending, fetched):
+            if isinstance(res, Exception):
+                log_debug(f"List search for '{query}' failed: {res}", "Orchestrator", "ERROR")
+                product_lists.append([])
+                continue
+            product_lists.append(res[0])
+            # A handler that had to renew its session hands the new one back.
+            for platform, creds in res[1].items():
+                if creds and creds != sessions.get(platform):
+                    final_credentials[platform] = creds
 
-    compared_data = []
-    if all_products:
         try:
-            log_debug("Running comparison algorithm...", "Orchestrator", "INFO")
-            comparison_start_time = time.time()
-            # Consider running in executor if Mistral call is blocking and slow
-            # compared_data = await loop.run_in_executor(None, partial(group_and_sort_products, all_products, search_query))
-            compared_data = group_and_sort_products(all_products, search_query)
-            comparison_time = time.time() - comparison_start_time
-            log_debug(f"Comparison finished in {comparison_time:.2f}s. Found {len(compared_data)} groups.", "Orchestrator", "SUCCESS")
+            # Embedding a whole list's products takes a while; keep the event loop free meanwhile.
+            grouped = await loop.run_in_executor(None, partial(
+                contextvars.copy_context().run, group_and_sort_product_lists, product_lists, [query for query, _ in pending]))
         except Exception as e:
             log_debug(f"Comparison algorithm failed: {e}", "Orchestrator", "ERROR")
-            compared_data = [] # Return empty list on failure
-    else:
-        log_debug("No products found to compare.", "Orchestrator", "WARNING")
-
-    # --- Format Final Output ---
-    final_result = {
-        "data": compared_data,
-        "credentials": final_credentials
-    }
+            grouped = [[] for _ in pending]
+        for (query, key), data in zip(pending, grouped):
+            results[query] = data
+            _store_search(key, {"data": data})
 
     total_time = time.time() - start_time
-    log_debug(f"Orchestration completed in {total_time:.2f} seconds.", "Orchestrator", "SUCCESS")
+    record_stage("orchestration", total_time)
+    log_debug(f"Compared {len(queries)} list items ({len(pending)} searched) in {total_time:.2f} seconds.", "Orchestrator", "SUCCESS")
+    return {"data": [{"item": query, "data": results[query]} for query in queries], "credentials": final_credentials}
 
-    return final_result
-
-def get_compared_results(search_query, lat, lon, credentials=None):
-    loc = geocode_location(f'{lat},{lon}')
+def get_compared_list(items, lat, lon, credentials=None, full_fanout=False):
     try:
         loop = asyncio.get_event_loop()
-        data = loop.run_until_complete(get_compared_data_async(search_query, loc, credentials))
+        return loop.run_until_complete(get_compared_list_async(items, lat, lon, credentials, full_fanout))
     except RuntimeError:
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
-        data = loop.run_until_complete(get_compared_data_async(search_query, loc, credentials))
-        loop.close()
-
-    log_debug(f"Final compared data: {data}", "Orchestrator", "INFO")
-
-    return data
+        try:
+            return loop.run_until_complete(get_compared_list_async(items, lat, lon, credentials, full_fanout))
+        finally:
+            loop.close()
+
+def get_price_history(product_key, platform=None, lat=None, lon=None, days=30):
+    """Trend, lowest-ever price and price-drop check for a product, from the local price history."""
+    cell = geo_cell_key(lat, lon) if lat is not None and lon is not None else None
+    return {
+        "product_key": product_key,
+        "cell": cell,
+        "trend": price_history.trend(product_key, platform, cell, days),
+        "lowest": price_history.lowest(product_key, platform, cell),
+        "price_drop": price_history.price_dropped(product_key, platform, cell),
+    }
 
-def get_suggestions(query, max_suggestions=5):
-    products = [i['name'] for i in select_data("autosuggest")]
-    if not query:
-        return []
-    query = query.lower()
-    starts_with = [product for product in products if product.lower().startswith(query)]
-    contains = [product for product in products if query in product.lower() and not product.lower().startswith(query)]
-    suggestions = starts_with + contains
-    return suggestions[:max_suggestions]
+def get_suggestions(query, max_suggestions=5, mode="prefix"):
+    if mode == "semantic":
+        if semantic_index.available:
+            return semantic_index.search(query, max_suggestions)
+        log_debug("Semantic index not built, falling back to prefix mode", "Autocomplete", "WARNING")
+        mode = "prefix"
+    return autocomplete_index.suggest(query, max_suggestions, mode)
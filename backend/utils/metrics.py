@@ -0,0 +1,174 @@
+"""
+In-process counters and latency histograms, rendered in the Prometheus text
+format by the /metrics route.
+
+Values are per process; under gunicorn every worker keeps its own and
+Prometheus should scrape each one (or aggregate by instance).
+
+timer() also records into the per-request breakdown when one is active
+(start_breakdown()), which the search routes return when asked for timings.
+"""
+import time
+import bisect
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Upstream calls through the proxy take seconds, so the buckets run to a minute.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+_registry = {}
+_registry_lock = threading.Lock()
+_breakdown = contextvars.ContextVar("metrics_breakdown", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(labelnames, values, extra=()):
+    pairs = [f'{k}="{_escape(v)}"' for k, v in list(zip(labelnames, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value=1, **labels):
+        key = tuple(str(labels.get(k, "")) for k in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels.get(k, "")) for k in self.labelnames), 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_label_text(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(k, "")) for k in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 2)
+            row[index] += 1
+            row[-1] += value
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, list(row)) for key, row in self._values.items())
+        lines = []
+        for key, row in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, [('le', bound)])} {cumulative}")
+            cumulative += row[len(self.buckets)]
+            lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, [('le', '+Inf')])} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {row[-1]}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+def _register(metric):
+    with _registry_lock:
+        return _registry.setdefault(metric.name, metric)
+
+
+def counter(name, documentation, labelnames=()):
+    return _register(Counter(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    return _register(Histogram(name, documentation, labelnames, buckets))
+
+
+def render_metrics():
+    """All registered metrics in the Prometheus text exposition format (version 0.0.4)."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# =============================================== REQUEST BREAKDOWN ===================================================
+
+def start_breakdown():
+    """Collect timer() stages for the current request (and executor calls wrapped with copy_context)."""
+    breakdown = {}
+    _breakdown.set(breakdown)
+    return breakdown
+
+
+def record_stage(stage, seconds):
+    breakdown = _breakdown.get()
+    if breakdown is not None:
+        # Repeated stages (retries, batches) add up.
+        breakdown[stage] = round(breakdown.get(stage, 0.0) + seconds, 4)
+
+
+@contextmanager
+def timer(metric, stage=None, **labels):
+    """Observe the block's duration on a histogram and, if stage is given, in the request breakdown."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        metric.observe(elapsed, **labels)
+        if stage:
+            record_stage(stage, elapsed)
+
+
+def timed(metric, stage=None, **labels):
+    """Decorator form of timer()."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(metric, stage, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# =============================================== METRICS ===================================================
+
+SEARCH_LATENCY = histogram("pricely_search_seconds", "End-to-end search orchestration time")
+GEOCODE_LATENCY = histogram("pricely_geocode_seconds", "Reverse geocoding time per search")
+HANDLER_LATENCY = histogram("pricely_handler_seconds", "Platform search handler time", ["platform"])
+HANDLER_RESULTS = counter("pricely_handler_results_total", "Platform handler outcomes", ["platform", "outcome"])
+HANDLER_PRODUCTS = counter("pricely_handler_products_total", "Products returned by platform handlers", ["platform"])
+PLATFORM_SKIPS = counter("pricely_platform_skips_total", "Platform searches skipped before fan-out", ["platform", "reason"])
+# _count is the bootstrap frequency: every call fetches a fresh session through the proxy.
+CREDENTIAL_BOOTSTRAP_LATENCY = histogram("pricely_credential_bootstrap_seconds", "Credential/session bootstrap time", ["platform"])
+UPSTREAM_RETRIES = counter("pricely_upstream_retries_total", "Retried upstream requests", ["platform"])
+EMBEDDING_LATENCY = histogram("pricely_embedding_seconds", "Sentence embedding time per search (query and product names)")
+GROUPING_LATENCY = histogram("pricely_grouping_seconds", "Product grouping and sorting time per search")
+GROUPED_PRODUCTS = counter("pricely_grouped_products_total", "Products fed into the comparison algorithm")
+CACHE_REQUESTS = counter("pricely_cache_requests_total", "In-process cache lookups", ["cache", "result"])
@@ -0,0 +1,238 @@
+"""
+Learned platform routing: leave out platforms a query is unlikely to find anything on.
+
+Every search records, per platform, whether it returned any products. Counts
+are kept per normalized query and per query word (the word stands in for the
+query's category: "headset", "gaming" and "steelseries" never hit on DMart)
+and decay with a half-life of PLATFORM_ROUTER_HALF_LIFE, so a platform that
+starts stocking a category is picked up again.
+
+A platform's expected yield for a query is the hit rate of the exact query
+once it has PLATFORM_ROUTER_MIN_SAMPLES searches, else the best hit rate among
+its words, and only when every word has that many. Without enough history the
+platform is always asked. Below PLATFORM_ROUTER_THRESHOLD (or the higher
+PLATFORM_ROUTER_TIGHT_THRESHOLD while the proxy budget is tight) the search
+skips it, except for a PLATFORM_ROUTER_EXPLORE_RATE share of searches that
+ask anyway so the estimate keeps learning. A search with full_fanout set
+(admins and premium users only, on the ASGI search routes and list searches)
+asks every platform. Skipped calls and their expected credits are reported by
+platform_router.report() (/admin/platform-router).
+
+Only platforms whose results come from their own task are routed: BigBasket
+always runs, and it also brings the Zepto results.
+
+    PLATFORM_ROUTER_ENABLED          0 asks every platform on every search (default 1)
+    PLATFORM_ROUTER_THRESHOLD        skip below this expected hit rate (default 0.05)
+    PLATFORM_ROUTER_TIGHT_THRESHOLD  the same while the proxy budget is tight (default 0.2)
+    PLATFORM_ROUTER_MIN_SAMPLES      searches of a query or word before it counts (default 8)
+    PLATFORM_ROUTER_EXPLORE_RATE     share of skips asked anyway (default 0.05)
+    PLATFORM_ROUTER_HALF_LIFE        seconds for an outcome's weight to halve (default 1209600)
+    PLATFORM_ROUTER_FILE             snapshot loaded at warm-up and saved on shutdown
+"""
+import os
+import re
+import json
+import time
+import random
+import threading
+from dotenv import load_dotenv
+
+from .metrics import counter
+from .cache_handler import snapshot_lock
+from .proxy_scheduler import proxy_scheduler
+from .search_refresh import normalize_query
+
+load_dotenv()
+
+PLATFORM_ROUTER_ENABLED = os.getenv('PLATFORM_ROUTER_ENABLED', '1') != '0'
+PLATFORM_ROUTER_THRESHOLD = float(os.getenv('PLATFORM_ROUTER_THRESHOLD', 0.05))
+PLATFORM_ROUTER_TIGHT_THRESHOLD = float(os.getenv('PLATFORM_ROUTER_TIGHT_THRESHOLD', 0.2))
+PLATFORM_ROUTER_MIN_SAMPLES = float(os.getenv('PLATFORM_ROUTER_MIN_SAMPLES', 8))
+PLATFORM_ROUTER_EXPLORE_RATE = float(os.getenv('PLATFORM_ROUTER_EXPLORE_RATE', 0.05))
+PLATFORM_ROUTER_HALF_LIFE = float(os.getenv('PLATFORM_ROUTER_HALF_LIFE', 14 * 86400))
+PLATFORM_ROUTER_FILE = os.getenv(
+    'PLATFORM_ROUTER_FILE',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'platform_router.json')
+)
+
+# Platform key -> the name its proxy requests are accounted under.
+ROUTED_PLATFORMS = {"BLINKIT": "Blinkit", "INSTAMART": "Instamart", "DMART": "DMart"}
+# Words too generic to say anything about a query's category.
+STOPWORDS = {"and", "for", "with", "the", "pack", "combo", "fresh", "new"}
+# Decayed search counts below this are forgotten.
+MIN_WEIGHT = 0.05
+# Entries listed under "low_yield" in the report.
+REPORT_TOP_N = 50
+
+ROUTER_DECISIONS = counter("pricely_platform_router_decisions_total", "Learned routing decisions for a platform", ["platform", "decision"])
+
+
+def query_words(query):
+    """The words of a normalized query that can stand for its category."""
+    return sorted({word for word in re.findall(r"[a-z]+", query) if len(word) >= 3 and word not in STOPWORDS})
+
+
+def query_features(query):
+    query = normalize_query(query)
+    if not query:
+        return []
+    return [f"q:{query}"] + [f"w:{word}" for word in query_words(query)]
+
+
+class PlatformRouter:
+    def __init__(self, enabled=PLATFORM_ROUTER_ENABLED, threshold=PLATFORM_ROUTER_THRESHOLD,
+                 tight_threshold=PLATFORM_ROUTER_TIGHT_THRESHOLD, min_samples=PLATFORM_ROUTER_MIN_SAMPLES,
+                 explore_rate=PLATFORM_ROUTER_EXPLORE_RATE, half_life=PLATFORM_ROUTER_HALF_LIFE):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.tight_threshold = tight_threshold
+        self.min_samples = min_samples
+        self.explore_rate = explore_rate
+        self.half_life = half_life
+        # (feature, platform key) -> [searches, hits, updated_at], both counts decayed
+        self._stats = {}
+        # platform key -> {"asked", "skipped", "explored", "saved_credits"}
+        self._decisions = {}
+        self._lock = threading.Lock()
+
+    def _decayed(self, entry, now):
+        searches, hits, updated_at = entry
+        factor = 0.5 ** (max(0.0, now - updated_at) / self.half_life)
+        return searches * factor, hits * factor
+
+    # --- Learning ---
+
+    def record(self, query, platform, hit):
+        """One search outcome: did platform return any products for query."""
+        features = query_features(query)
+        now = time.time()
+        with self._lock:
+            for feature in features:
+                entry = self._stats.get((feature, platform))
+                searches, hits = self._decayed(entry, now) if entry else (0.0, 0.0)
+                self._stats[(feature, platform)] = [searches + 1, hits + (1 if hit else 0), now]
+
+    def expected_yield(self, query, platform):
+        """(hit rate, searches) the estimate rests on, or None without enough history."""
+        query = normalize_query(query)
+        if not query:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._stats.get((f"q:{query}", platform))
+            if entry:
+                searches, hits = self._decayed(entry, now)
+                if searches >= self.min_samples:
+                    return hits / searches, searches
+            best = None
+            for word in query_words(query):
+                entry = self._stats.get((f"w:{word}", platform))
+                if not entry:
+                    return None
+                searches, hits = self._decayed(entry, now)
+                if searches < self.min_samples:
+                    return None
+                # Any word a platform does well on is enough to ask it.
+                if best is None or hits / searches > best[0]:
+                    best = (hits / searches, searches)
+            return best
+
+    # --- Routing ---
+
+    def plan(self, query, platforms):
+        """{platform key: "low_yield"} for the platforms this search should leave out."""
+        if not self.enabled:
+            return {}
+        threshold = self.tight_threshold if proxy_scheduler.tight() else self.threshold
+        skip = {}
+        for platform in platforms:
+            estimate = self.expected_yield(query, platform)
+            if estimate is None or estimate[0] >= threshold:
+                decision = "asked"
+            elif random.random() < self.explore_rate:
+                decision = "explored"
+            else:
+                decision = "skipped"
+                skip[platform] = "low_yield"
+            ROUTER_DECISIONS.inc(platform=ROUTED_PLATFORMS.get(platform, platform), decision=decision)
+            with self._lock:
+                counts = self._decisions.setdefault(platform, {"asked": 0, "skipped": 0, "explored": 0, "saved_credits": 0.0})
+                counts[decision] += 1
+                if decision == "skipped":
+                    counts["saved_credits"] += proxy_scheduler.expected_cost(ROUTED_PLATFORMS.get(platform, platform), "search", {})
+        return skip
+
+    # --- Snapshots ---
+
+    def prune(self):
+        now = time.time()
+        with self._lock:
+            for key, entry in list(self._stats.items()):
+                if self._decayed(entry, now)[0] < MIN_WEIGHT:
+                    del self._stats[key]
+
+    def dump(self, path=PLATFORM_ROUTER_FILE):
+        """
+        Write the counts. Every worker learns on its own, so entries already in
+        the file that are newer than this process's are kept.
+        """
+        self.prune()
+        with snapshot_lock(path):
+            entries = {}
+            if os.path.exists(path):
+                try:
+                    with open(path, encoding='utf-8') as f:
+                        entries = {(feature, platform): [searches, hits, updated_at]
+                                   for feature, platform, searches, hits, updated_at in json.load(f)}
+                except (OSError, ValueError):
+                    entries = {}
+            with self._lock:
+                for key, entry in self._stats.items():
+                    if key not in entries or entries[key][2] <= entry[2]:
+                        entries[key] = list(entry)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump([[feature, platform, *entry] for (feature, platform), entry in entries.items()], f)
+            os.replace(tmp_path, path)
+
+    def load(self, path=PLATFORM_ROUTER_FILE):
+        if not os.path.exists(path):
+            return 0
+        with open(path, encoding='utf-8') as f:
+            entries = json.load(f)
+        with self._lock:
+            for feature, platform, searches, hits, updated_at in entries:
+                self._stats[(feature, platform)] = [searches, hits, updated_at]
+        return len(entries)
+
+    # --- Reporting ---
+
+    def report(self):
+        """Decisions and saved calls per platform, and the query words each platform is skipped for."""
+        now = time.time()
+        with self._lock:
+            decisions = {platform: dict(counts, saved_credits=round(counts["saved_credits"], 2))
+                         for platform, counts in sorted(self._decisions.items())}
+            low_yield = []
+            for (feature, platform), entry in self._stats.items():
+                searches, hits = self._decayed(entry, now)
+                if feature.startswith("w:") and searches >= self.min_samples and hits / searches < self.threshold:
+                    low_yield.append({"word": feature[2:], "platform": platform,
+                                      "searches": round(searches, 1), "hit_rate": round(hits / searches, 3)})
+            features = len(self._stats)
+        low_yield.sort(key=lambda row: -row["searches"])
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "tight_threshold": self.tight_threshold,
+            "min_samples": self.min_samples,
+            "explore_rate": self.explore_rate,
+            "features": features,
+            "saved_calls": sum(counts["skipped"] for counts in decisions.values()),
+            "saved_credits": round(sum(counts["saved_credits"] for counts in decisions.values()), 2),
+            "platforms": decisions,
+            "low_yield": low_yield[:REPORT_TOP_N],
+        }
+
+
+platform_router = PlatformRouter()
@@ -0,0 +1,324 @@
+"""
+Append-only price history fed by every search.
+
+The orchestrator hands each search's normalized products to
+price_history.record(); rows are queued and a background thread writes them
+in batches to one SQLite file per UTC day:
+
+    PRICE_HISTORY_DIR/prices-YYYY-MM-DD.sqlite
+        prices(observed_at, product_key, platform, cell, name, quantity, price, product_url)
+        index (product_key, platform, cell, observed_at)
+
+product_key is the canonical product: the normalized name plus the parsed
+quantity, so "Tata Salt 1 kg" and "TATA SALT, 1kg" share a history. Queries
+(trend, lowest-ever, price dropped) read the day files in range and never
+touch the platforms. Day files older than PRICE_HISTORY_RETENTION_DAYS are
+deleted by the writer.
+
+    PRICE_HISTORY_ENABLED          0 disables recording (default 1)
+    PRICE_HISTORY_BATCH_SIZE       rows per write transaction (default 500)
+    PRICE_HISTORY_FLUSH_INTERVAL   seconds before a partial batch is written (default 5)
+    PRICE_HISTORY_QUEUE_SIZE       searches waiting to be written before new ones are dropped (default 1000)
+    PRICE_HISTORY_RETENTION_DAYS   day files kept (default 365)
+    PRICE_DROP_MIN_PCT             drop below the usual price that counts as a price drop (default 5)
+"""
+import os
+import re
+import time
+import queue
+import atexit
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+
+from .comparison_algorithm import parse_quantity
+from .metrics import counter
+from .universal_function import log_debug
+
+load_dotenv()
+
+PRICE_HISTORY_DIR = os.getenv(
+    'PRICE_HISTORY_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'price_history')
+)
+PRICE_HISTORY_ENABLED = os.getenv('PRICE_HISTORY_ENABLED', '1') != '0'
+PRICE_HISTORY_BATCH_SIZE = int(os.getenv('PRICE_HISTORY_BATCH_SIZE', 500))
+PRICE_HISTORY_FLUSH_INTERVAL = float(os.getenv('PRICE_HISTORY_FLUSH_INTERVAL', 5))
+PRICE_HISTORY_QUEUE_SIZE = int(os.getenv('PRICE_HISTORY_QUEUE_SIZE', 1000))
+PRICE_HISTORY_RETENTION_DAYS = int(os.getenv('PRICE_HISTORY_RETENTION_DAYS', 365))
+PRICE_DROP_MIN_PCT = float(os.getenv('PRICE_DROP_MIN_PCT', 5))
+
+PRICE_HISTORY_ROWS = counter("pricely_price_history_rows_total", "Price observations handed to the history store", ["result"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prices (
+    observed_at REAL NOT NULL,
+    product_key TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    cell TEXT NOT NULL,
+    name TEXT,
+    quantity TEXT,
+    price REAL NOT NULL,
+    product_url TEXT
+);
+CREATE INDEX IF NOT EXISTS prices_product ON prices (product_key, platform, cell, observed_at);
+"""
+PARTITION_PATTERN = re.compile(r"^prices-(\d{4}-\d{2}-\d{2})\.sqlite$")
+_STOP = object()
+
+
+# A size inside a product name ("Tata Salt 1 kg", "Amul Milk 2 x 500ml", "Coke 750 ml x 6").
+QUANTITY_IN_NAME = re.compile(
+    r"\b\d+(?:\.\d+)?\s*(?:x\s*\d+(?:\.\d+)?\s*)?"
+    r"(?:kgs?|g|gms?|grams?|mg|l|lt|ltrs?|litres?|liters?|ml|pcs?|pieces?|units?|packs?)\b"
+    r"(?:\s*x\s*\d+\b)?"
+)
+
+
+def canonical_product_key(name, quantity=None):
+    """
+    Normalized name plus parsed quantity, e.g. "tata salt|1000g". Sizes
+    written into the name are dropped from it, so "Tata Salt 1 kg" and
+    "TATA SALT, 1kg" share a key; without a quantity the name's size is used.
+
+    >>> canonical_product_key("Tata Salt 1 kg", "1 kg")
+    'tata salt|1000g'
+    >>> canonical_product_key("TATA SALT, 1kg")
+    'tata salt|1000g'
+    """
+    lowered = str(name or "").lower()
+    sizes = QUANTITY_IN_NAME.findall(lowered)
+    tokens = re.findall(r"[a-z0-9]+", QUANTITY_IN_NAME.sub(" ", lowered))
+    parsed = parse_quantity(quantity) if quantity else None
+    if parsed is None and not quantity and sizes:
+        quantity = sizes[0]
+        parsed = parse_quantity(quantity)
+    size = f"{parsed['value']:g}{parsed['unit']}" if parsed else re.sub(r"\s+", "", str(quantity or "").lower())
+    return f"{' '.join(tokens)}|{size}"
+
+
+def parse_price(value):
+    try:
+        price = float(str(value).replace(',', '').replace('₹', '').strip())
+    except ValueError:
+        return None
+    return price if price > 0 else None
+
+
+def _day(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d")
+
+
+class PriceHistoryStore:
+    def __init__(self, directory=PRICE_HISTORY_DIR, batch_size=PRICE_HISTORY_BATCH_SIZE,
+                 flush_interval=PRICE_HISTORY_FLUSH_INTERVAL, queue_size=PRICE_HISTORY_QUEUE_SIZE,
+                 retention_days=PRICE_HISTORY_RETENTION_DAYS):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.retention_days = retention_days
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._pruned_day = None
+        self._lock = threading.Lock()
+
+    # --- Writing ---
+
+    def _ensure_writer(self):
+        # Started lazily so every gunicorn worker gets its own thread after fork.
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="price-history", daemon=True)
+            self._thread.start()
+
+    def record(self, products, cell, observed_at=None):
+        """Queue one search's products for writing; never blocks the caller."""
+        observed_at = time.time() if observed_at is None else observed_at
+        rows = []
+        for product in products:
+            price = parse_price(product.get('price'))
+            if price is None or not product.get('name'):
+                continue
+            rows.append((
+                observed_at,
+                canonical_product_key(product['name'], product.get('quantity')),
+                str(product.get('platform', '')),
+                cell or "",
+                product['name'],
+                str(product.get('quantity', '')),
+                price,
+                product.get('product_url'),
+            ))
+        if not rows:
+            return 0
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(rows)
+        except queue.Full:
+            PRICE_HISTORY_ROWS.inc(len(rows), result="dropped")
+            return 0
+        return len(rows)
+
+    def _run(self):
+        pending = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                self._write(pending)
+                return
+            if item:
+                pending.extend(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if pending and (len(pending) >= self.batch_size or time.monotonic() >= deadline):
+                self._write(pending)
+                pending, deadline = [], None
+
+    def _connect(self, day, readonly=False):
+        path = os.path.join(self.directory, f"prices-{day}.sqlite")
+        if readonly:
+            return sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=10)
+        conn = sqlite3.connect(path, timeout=10)
+        # WAL lets other workers append and readers query concurrently.
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def _write(self, rows):
+        if not rows:
+            return
+        by_day = {}
+        for row in rows:
+            by_day.setdefault(_day(row[0]), []).append(row)
+        os.makedirs(self.directory, exist_ok=True)
+        for day, day_rows in by_day.items():
+            try:
+                conn = self._connect(day)
+                try:
+                    with conn:
+                        conn.executemany("INSERT INTO prices VALUES (?, ?, ?, ?, ?, ?, ?, ?)", day_rows)
+                finally:
+                    conn.close()
+                PRICE_HISTORY_ROWS.inc(len(day_rows), result="written")
+            except sqlite3.Error as e:
+                PRICE_HISTORY_ROWS.inc(len(day_rows), result="failed")
+                log_debug(f"Could not write {len(day_rows)} price rows for {day}: {e}", "PriceHistory", "ERROR")
+        today = _day(time.time())
+        if self._pruned_day != today:
+            self._pruned_day = today
+            self.prune()
+
+    def stop(self, timeout=10):
+        """Write everything queued so far and stop the writer."""
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def prune(self):
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=self.retention_days)).strftime("%Y-%m-%d")
+        for day in self.partitions():
+            if day < cutoff:
+                for suffix in ("", "-wal", "-shm"):
+                    try:
+                        os.remove(os.path.join(self.directory, f"prices-{day}.sqlite{suffix}"))
+                    except FileNotFoundError:
+                        pass
+
+    # --- Queries ---
+
+    def partitions(self, days=None):
+        """Day strings with a file, oldest first; only the last `days` days when given."""
+        if not os.path.isdir(self.directory):
+            return []
+        found = sorted(m.group(1) for m in map(PARTITION_PATTERN.match, os.listdir(self.directory)) if m)
+        if days is not None:
+            since = (datetime.now(timezone.utc) - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+            found = [day for day in found if day >= since]
+        return found
+
+    def _select(self, product_key, platform=None, cell=None, days=None, newest_first=False, columns="*", suffix=""):
+        where, args = ["product_key = ?"], [product_key]
+        if platform:
+            where.append("platform = ?")
+            args.append(platform)
+        if cell:
+            where.append("cell = ?")
+            args.append(cell)
+        sql = f"SELECT {columns} FROM prices WHERE {' AND '.join(where)} {suffix}"
+        partitions = self.partitions(days)
+        for day in (reversed(partitions) if newest_first else partitions):
+            try:
+                conn = self._connect(day, readonly=True)
+            except sqlite3.Error:
+                continue
+            try:
+                yield day, conn.execute(sql, args).fetchall()
+            except sqlite3.Error as e:
+                log_debug(f"Could not read price partition {day}: {e}", "PriceHistory", "ERROR")
+            finally:
+                conn.close()
+
+    def trend(self, product_key, platform=None, cell=None, days=30):
+        """Daily min/avg/max price per platform over the last `days` days."""
+        points = []
+        for day, rows in self._select(product_key, platform, cell, days,
+                                      columns="platform, MIN(price), AVG(price), MAX(price), COUNT(*)",
+                                      suffix="GROUP BY platform ORDER BY platform"):
+            for row_platform, low, mean, high, samples in rows:
+                points.append({"day": day, "platform": row_platform, "min": low, "avg": round(mean, 2),
+                               "max": high, "samples": samples})
+        return points
+
+    def lowest(self, product_key, platform=None, cell=None, days=None):
+        """The cheapest observation on record (within `days` days when given), or None."""
+        best = None
+        for _, rows in self._select(product_key, platform, cell, days,
+                                    columns="price, platform, cell, observed_at, name, product_url",
+                                    suffix="ORDER BY price, observed_at DESC LIMIT 1"):
+            if rows and (best is None or rows[0][0] < best[0]):
+                best = rows[0]
+        if best is None:
+            return None
+        price, row_platform, row_cell, observed_at, name, product_url = best
+        return {"price": price, "platform": row_platform, "cell": row_cell, "name": name, "product_url": product_url,
+                "observed_at": datetime.fromtimestamp(observed_at, timezone.utc).isoformat(timespec="seconds")}
+
+    def price_dropped(self, product_key, platform=None, cell=None, days=7, min_drop_pct=PRICE_DROP_MIN_PCT):
+        """
+        Compare the best price of the latest search with the median best price
+        of the earlier searches in the window. dropped is True when it is at
+        least min_drop_pct lower.
+        """
+        best = {}
+        for _, rows in self._select(product_key, platform, cell, days,
+                                    columns="observed_at, MIN(price)", suffix="GROUP BY observed_at"):
+            for observed_at, price in rows:
+                best[observed_at] = min(price, best.get(observed_at, price))
+        if not best:
+            return {"dropped": False, "current": None, "usual": None, "drop_pct": 0.0}
+        latest_at = max(best)
+        current = best.pop(latest_at)
+        earlier = sorted(best.values())
+        if not earlier:
+            return {"dropped": False, "current": current, "usual": None, "drop_pct": 0.0}
+        usual = earlier[len(earlier) // 2]
+        drop_pct = round((usual - current) / usual * 100, 2)
+        return {"dropped": drop_pct >= min_drop_pct, "current": current, "usual": usual, "drop_pct": drop_pct}
+
+
+price_history = PriceHistoryStore()
+atexit.register(price_history.stop)
@@ -0,0 +1,383 @@
+"""
+Canonical product catalog: which platform listings are the same product.
+
+Every group a search finds on two or more platforms is recorded as a
+canonical product, each listing a member keyed by platform plus product URL
+(query string dropped, since Instamart puts the store id there) or, without
+a URL, plus the normalized name and quantity. Listings seen on one platform
+only are not recorded, so later searches keep comparing them:
+
+    products(canonical_id, name, quantity, image_url, created_at, updated_at)
+    members(member_key, canonical_id, platform, name, quantity, product_url, embedding, updated_at)
+
+Later searches resolve known listings with a dict lookup and reuse their
+stored name embeddings, so only unknown listings are embedded and compared
+(see group_and_sort_products). Products with members on fewer than two
+platforms (from older versions) are not resolved. When a search finds two
+canonical products to be the same, merge() keeps the first and moves the
+other's members to it; the merge is recorded so listings other workers
+still file under the old id follow it:
+
+    merges(canonical_id, merged_into, merged_at)
+
+New memberships and merges go into the in-process map at once and are
+written to PRODUCT_CATALOG_PATH by a background thread; other workers pick
+them up every PRODUCT_CATALOG_SYNC_INTERVAL seconds.
+
+Export (one canonical product per line):
+
+    python -m utils.product_catalog export catalog.jsonl [--embeddings]
+
+    PRODUCT_CATALOG_ENABLED         0 groups every search from scratch (default 1)
+    PRODUCT_CATALOG_PATH            SQLite file (default data/product_catalog.sqlite)
+    PRODUCT_CATALOG_SYNC_INTERVAL   seconds between reloads of other workers' rows (default 300)
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import atexit
+import sqlite3
+import argparse
+import threading
+import urllib.parse
+from dotenv import load_dotenv
+import numpy as np
+
+from .metrics import counter
+from .price_history import canonical_product_key
+from .universal_function import log_debug
+
+load_dotenv()
+
+PRODUCT_CATALOG_ENABLED = os.getenv('PRODUCT_CATALOG_ENABLED', '1') != '0'
+PRODUCT_CATALOG_PATH = os.getenv(
+    'PRODUCT_CATALOG_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'product_catalog.sqlite')
+)
+PRODUCT_CATALOG_SYNC_INTERVAL = float(os.getenv('PRODUCT_CATALOG_SYNC_INTERVAL', 300))
+
+CATALOG_LOOKUPS = counter("pricely_catalog_lookups_total", "Products resolved against the canonical catalog", ["result"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    canonical_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    quantity TEXT,
+    image_url TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS members (
+    member_key TEXT PRIMARY KEY,
+    canonical_id TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    name TEXT NOT NULL,
+    quantity TEXT,
+    product_url TEXT,
+    embedding BLOB,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS merges (
+    canonical_id TEXT PRIMARY KEY,
+    merged_into TEXT NOT NULL,
+    merged_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS members_canonical ON members (canonical_id);
+CREATE INDEX IF NOT EXISTS members_updated ON members (updated_at);
+"""
+_STOP = object()
+
+
+def member_key(product):
+    """Stable key of one platform listing."""
+    platform = str(product.get('platform', '')).lower()
+    url = product.get('product_url')
+    if url and url != 'N/A':
+        parts = urllib.parse.urlsplit(url)
+        return f"{platform}:{parts.netloc}{parts.path}".rstrip('/')
+    return f"{platform}:{canonical_product_key(product.get('name'), product.get('quantity'))}"
+
+
+def new_canonical_id():
+    return uuid.uuid4().hex[:16]
+
+
+class ProductCatalog:
+    def __init__(self, path=PRODUCT_CATALOG_PATH, sync_interval=PRODUCT_CATALOG_SYNC_INTERVAL):
+        self.path = path
+        self.sync_interval = sync_interval
+        # member_key -> (canonical_id, name)
+        self._members = {}
+        # canonical_id -> platforms of its members
+        self._platforms = {}
+        # merged canonical_id -> the id it was merged into
+        self._merged = {}
+        self._loaded = False
+        self._synced_at = 0.0
+        self._sync_mark = 0.0
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    # --- Loading ---
+
+    def load(self):
+        """Load (or incrementally reload) the member map from disk."""
+        with self._lock:
+            since = self._sync_mark if self._loaded else 0.0
+            # Rows written by another worker just before the last sync may
+            # carry a slightly older timestamp; overlap the window a little.
+            since = max(0.0, since - 5)
+            try:
+                conn = self._connect()
+                try:
+                    merges = conn.execute(
+                        "SELECT canonical_id, merged_into, merged_at FROM merges WHERE merged_at >= ? ORDER BY merged_at", (since,)
+                    ).fetchall()
+                    rows = conn.execute(
+                        "SELECT member_key, canonical_id, name, platform, updated_at FROM members WHERE updated_at >= ?", (since,)
+                    ).fetchall()
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                log_debug(f"Could not load product catalog: {e}", "ProductCatalog", "ERROR")
+                merges, rows = [], []
+            for canonical_id, merged_into, merged_at in merges:
+                self._merge_locked(canonical_id, merged_into)
+                self._sync_mark = max(self._sync_mark, merged_at)
+            for key, canonical_id, name, platform, updated_at in rows:
+                canonical_id = self._current_id(canonical_id)
+                self._members[key] = (canonical_id, name)
+                self._platforms.setdefault(canonical_id, set()).add(platform.lower())
+                self._sync_mark = max(self._sync_mark, updated_at)
+            self._loaded = True
+            self._synced_at = time.monotonic()
+        return len(rows)
+
+    def _maybe_sync(self):
+        if not self._loaded or time.monotonic() - self._synced_at > self.sync_interval:
+            self.load()
+
+    # --- Lookups ---
+
+    def _current_id(self, canonical_id):
+        """The id a canonical product lives on after any merges."""
+        while canonical_id in self._merged:
+            canonical_id = self._merged[canonical_id]
+        return canonical_id
+
+    def resolve(self, keys, names):
+        """
+        {member_key: (canonical_id, embedding or None)} for the known keys.
+        The stored embedding is only returned while the listing's name is unchanged.
+        """
+        self._maybe_sync()
+        found = {}
+        reuse = []
+        for key, name in zip(keys, names):
+            entry = self._members.get(key)
+            if entry is None:
+                continue
+            canonical_id = self._current_id(entry[0])
+            if len(self._platforms.get(canonical_id, ())) < 2:
+                continue
+            found[key] = (canonical_id, None)
+            if entry[1] == name:
+                reuse.append(key)
+        CATALOG_LOOKUPS.inc(len(found), result="known")
+        CATALOG_LOOKUPS.inc(len(keys) - len(found), result="unknown")
+        if reuse:
+            try:
+                conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=10)
+                try:
+                    placeholders = ",".join("?" * len(reuse))
+                    for key, blob in conn.execute(
+                        f"SELECT member_key, embedding FROM members WHERE member_key IN ({placeholders})", reuse
+                    ):
+                        if blob is not None and key in found:
+                            found[key] = (found[key][0], np.frombuffer(blob, dtype=np.float32))
+                finally:
+                    conn.close()
+            except sqlite3.Error:
+                # Not written yet (or unreadable): the caller embeds those names.
+                pass
+        return found
+
+    # --- Writing ---
+
+    def record(self, products, members):
+        """
+        Add canonical products and memberships.
+            products: [(canonical_id, name, quantity, image_url)]
+            members:  [(member_key, canonical_id, platform, name, quantity, product_url, embedding)]
+        """
+        if not products and not members:
+            return
+        with self._lock:
+            for key, canonical_id, platform, name, *_ in members:
+                self._members[key] = (canonical_id, name)
+                self._platforms.setdefault(canonical_id, set()).add(platform.lower())
+        self._ensure_writer()
+        self._queue.put((products, members, []))
+
+    def merge(self, canonical_id, merged_into):
+        """Fold canonical product canonical_id into merged_into: its members (here and on disk) move over."""
+        with self._lock:
+            canonical_id, merged_into = self._current_id(canonical_id), self._current_id(merged_into)
+            if canonical_id == merged_into:
+                return
+            self._merge_locked(canonical_id, merged_into)
+        self._ensure_writer()
+        self._queue.put(([], [], [(canonical_id, merged_into)]))
+
+    def _merge_locked(self, canonical_id, merged_into):
+        canonical_id, merged_into = self._current_id(canonical_id), self._current_id(merged_into)
+        if canonical_id == merged_into:
+            return
+        self._merged[canonical_id] = merged_into
+        self._platforms.setdefault(merged_into, set()).update(self._platforms.pop(canonical_id, ()))
+
+    def _ensure_writer(self):
+        # Started lazily so every gunicorn worker gets its own thread after fork.
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="product-catalog", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            batches = [self._queue.get()]
+            # Whatever else is already queued goes into the same transaction.
+            while True:
+                try:
+                    batches.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = _STOP in batches
+            self._write([batch for batch in batches if batch is not _STOP])
+            if stop:
+                return
+
+    def _write(self, batches):
+        if not batches:
+            return
+        now = time.time()
+        product_rows, member_rows, merge_rows = [], [], []
+        for products, members, merges in batches:
+            merge_rows.extend((canonical_id, merged_into, now) for canonical_id, merged_into in merges)
+            product_rows.extend((canonical_id, name, quantity, image_url, now, now)
+                                for canonical_id, name, quantity, image_url in products)
+            member_rows.extend(
+                (key, canonical_id, platform, name, quantity, product_url,
+                 None if embedding is None else np.asarray(embedding, dtype=np.float32).tobytes(), now)
+                for key, canonical_id, platform, name, quantity, product_url, embedding in members
+            )
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany("INSERT OR IGNORE INTO products VALUES (?, ?, ?, ?, ?, ?)", product_rows)
+                    conn.executemany(
+                        "INSERT INTO members VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT(member_key) DO UPDATE SET name = excluded.name, quantity = excluded.quantity, "
+                        "product_url = excluded.product_url, embedding = excluded.embedding, updated_at = excluded.updated_at",
+                        member_rows,
+                    )
+                    # After the inserts: members queued under a merged id before the merge move over too.
+                    conn.executemany("INSERT OR REPLACE INTO merges VALUES (?, ?, ?)", merge_rows)
+                    conn.executemany("UPDATE members SET canonical_id = ?, updated_at = ? WHERE canonical_id = ?",
+                                     [(merged_into, now, canonical_id) for canonical_id, merged_into, _ in merge_rows])
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            log_debug(f"Could not write {len(member_rows)} catalog members: {e}", "ProductCatalog", "ERROR")
+
+    def stop(self, timeout=10):
+        """Write everything queued so far and stop the writer."""
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    # --- Reporting ---
+
+    def stats(self):
+        return {"members": len(self._members), "products": len({self._current_id(cid) for cid, _ in self._members.values()})}
+
+    def export_jsonl(self, out, include_embeddings=False):
+        """Write one JSON object per canonical product with its members; returns the product count."""
+        conn = self._connect()
+        try:
+            # Replayed in order, as load() does, so two workers merging a pair both ways cannot form a cycle.
+            merged = {}
+            for canonical_id, merged_into in conn.execute("SELECT canonical_id, merged_into FROM merges ORDER BY merged_at"):
+                while canonical_id in merged:
+                    canonical_id = merged[canonical_id]
+                while merged_into in merged:
+                    merged_into = merged[merged_into]
+                if merged_into != canonical_id:
+                    merged[canonical_id] = merged_into
+            members = {}
+            for canonical_id, platform, name, quantity, product_url, embedding in conn.execute(
+                "SELECT canonical_id, platform, name, quantity, product_url, embedding FROM members ORDER BY canonical_id, platform"
+            ):
+                member = {"platform": platform, "name": name, "quantity": quantity, "product_url": product_url}
+                if include_embeddings and embedding is not None:
+                    member["embedding"] = [round(float(x), 6) for x in np.frombuffer(embedding, dtype=np.float32)]
+                while canonical_id in merged:
+                    canonical_id = merged[canonical_id]
+                members.setdefault(canonical_id, []).append(member)
+            count = 0
+            for canonical_id, name, quantity, image_url, created_at, updated_at in conn.execute(
+                "SELECT canonical_id, name, quantity, image_url, created_at, updated_at FROM products ORDER BY created_at"
+            ):
+                if canonical_id in merged:
+                    continue
+                out.write(json.dumps({
+                    "canonical_id": canonical_id, "name": name, "quantity": quantity, "image_url": image_url,
+                    "created_at": created_at, "updated_at": updated_at, "members": members.get(canonical_id, []),
+                }, ensure_ascii=False) + "\n")
+                count += 1
+            return count
+        finally:
+            conn.close()
+
+
+product_catalog = ProductCatalog()
+atexit.register(product_catalog.stop)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export")
+    export.add_argument("path", nargs="?", default="-")
+    export.add_argument("--embeddings", action="store_true")
+    args = parser.parse_args()
+
+    if args.path == "-":
+        count = product_catalog.export_jsonl(sys.stdout, args.embeddings)
+    else:
+        with open(args.path, "w", encoding="utf-8") as f:
+            count = product_catalog.export_jsonl(f, args.embeddings)
+    print(f"exported {count} products", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
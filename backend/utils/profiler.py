@@ -0,0 +1,253 @@
+"""
+On-demand sampling profiler for single search requests.
+
+    with profile_request("rice") as session:
+        ...  # the request
+
+A daemon thread samples sys._current_frames() every PROFILE_INTERVAL seconds,
+but only for threads registered with the active session: the request thread
+itself and any executor thread that runs under register_thread() with the
+request's context. When no session is active register_thread() is a single
+context-variable lookup.
+
+Each profile is written to PROFILE_ARTIFACTS_DIR as
+    <id>.folded   collapsed stacks (flamegraph.pl / speedscope input)
+    <id>.svg      flame graph
+    <id>.txt      top functions by self and total samples
+"""
+import os
+import re
+import sys
+import time
+import html
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', 0.005))
+PROFILE_MAX_ARTIFACTS = int(os.getenv('PROFILE_MAX_ARTIFACTS', 50))
+PROFILE_ARTIFACTS_DIR = os.getenv(
+    'PROFILE_ARTIFACTS_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'profiles')
+)
+ARTIFACT_SUFFIXES = (".svg", ".txt", ".folded")
+TOP_FUNCTIONS = 40
+
+_session = contextvars.ContextVar("profile_session", default=None)
+
+
+def frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.thread_ids = set()
+        self.stacks = {}
+        self.samples = 0
+        self.started_at = None
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def add_thread(self, thread_id):
+        with self._lock:
+            self.thread_ids.add(thread_id)
+
+    def remove_thread(self, thread_id):
+        with self._lock:
+            self.thread_ids.discard(thread_id)
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        with self._lock:
+            thread_ids = list(self.thread_ids)
+        frames = sys._current_frames()
+        for thread_id in thread_ids:
+            frame = frames.get(thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            key = tuple(stack)
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    # --- Reports ---
+
+    def folded(self):
+        return "\n".join(f"{';'.join(stack)} {count}" for stack, count in sorted(self.stacks.items())) + "\n"
+
+    def top_functions(self, limit=TOP_FUNCTIONS):
+        self_counts, total_counts = {}, {}
+        for stack, count in self.stacks.items():
+            self_counts[stack[-1]] = self_counts.get(stack[-1], 0) + count
+            for label in set(stack):
+                total_counts[label] = total_counts.get(label, 0) + count
+        total = self.samples or 1
+        lines = [
+            f"samples: {self.samples}  interval: {self.interval * 1000:.1f}ms  wall: {self.duration:.3f}s",
+            "",
+            f"{'self':>7} {'self%':>6} {'total':>7} {'total%':>6}  function",
+        ]
+        for label, count in sorted(self_counts.items(), key=lambda item: -item[1])[:limit]:
+            lines.append(f"{count:7d} {count / total * 100:5.1f}% {total_counts[label]:7d} {total_counts[label] / total * 100:5.1f}%  {label}")
+        lines += ["", "by total samples:"]
+        for label, count in sorted(total_counts.items(), key=lambda item: -item[1])[:limit]:
+            lines.append(f"{count:7d} {count / total * 100:5.1f}%  {label}")
+        return "\n".join(lines) + "\n"
+
+    def flame_graph(self, title, width=1200, row_height=16):
+        # Merge stacks into a tree: label -> [count, children]
+        root = [0, {}]
+        for stack, count in self.stacks.items():
+            node = root
+            node[0] += count
+            for label in stack:
+                node = node[1].setdefault(label, [0, {}])
+                node[0] += count
+
+        rects = []
+
+        def walk(children, x, depth):
+            for label, (count, grandchildren) in sorted(children.items()):
+                w = count / (root[0] or 1) * width
+                if w >= 0.5:
+                    rects.append((x, depth, w, label, count))
+                    walk(grandchildren, x, depth + 1)
+                x += w
+
+        walk(root[1], 0.0, 0)
+        max_depth = max((r[1] for r in rects), default=0) + 1
+        height = (max_depth + 2) * row_height
+        parts = [
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace" font-size="11">',
+            f'<text x="4" y="{row_height - 4}">{html.escape(title)} ({self.samples} samples)</text>',
+        ]
+        for x, depth, w, label, count in rects:
+            y = height - (depth + 1) * row_height
+            # Stable warm colour per function name
+            hue = sum(map(ord, label)) % 50
+            pct = count / (root[0] or 1) * 100
+            text = html.escape(label)
+            visible = text[:int(w / 7)] if w > 21 else ""
+            parts.append(
+                f'<g><title>{text} ({count} samples, {pct:.1f}%)</title>'
+                f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row_height - 1}" fill="hsl({hue},85%,60%)"/>'
+                f'<text x="{x + 3:.1f}" y="{y + row_height - 4}">{visible}</text></g>'
+            )
+        parts.append("</svg>")
+        return "\n".join(parts)
+
+# =============================================== REQUEST SESSIONS ===================================================
+
+@contextmanager
+def register_thread():
+    """Include the current thread in the active profile session, if any."""
+    profiler = _session.get()
+    if profiler is None:
+        yield
+        return
+    thread_id = threading.get_ident()
+    profiler.add_thread(thread_id)
+    try:
+        yield
+    finally:
+        profiler.remove_thread(thread_id)
+
+
+def _artifact_id(label):
+    slug = re.sub(r"[^a-z0-9]+", "-", (label or "").lower()).strip("-")[:40] or "request"
+    return f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{slug}"
+
+
+def save_profile(profiler, label, directory=PROFILE_ARTIFACTS_DIR):
+    os.makedirs(directory, exist_ok=True)
+    artifact_id = _artifact_id(label)
+    base = os.path.join(directory, artifact_id)
+    with open(f"{base}.folded", "w", encoding="utf-8") as f:
+        f.write(profiler.folded())
+    with open(f"{base}.txt", "w", encoding="utf-8") as f:
+        f.write(f"{label}\n\n{profiler.top_functions()}")
+    with open(f"{base}.svg", "w", encoding="utf-8") as f:
+        f.write(profiler.flame_graph(label))
+    prune_profiles(directory)
+    return artifact_id
+
+
+def prune_profiles(directory=PROFILE_ARTIFACTS_DIR, keep=PROFILE_MAX_ARTIFACTS):
+    for profile in list_profiles(directory)[keep:]:
+        for suffix in ARTIFACT_SUFFIXES:
+            try:
+                os.remove(os.path.join(directory, profile["id"] + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(directory=PROFILE_ARTIFACTS_DIR):
+    """Saved profiles, newest first."""
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in os.listdir(directory):
+        if not name.endswith(".svg"):
+            continue
+        artifact_id = name[:-len(".svg")]
+        path = os.path.join(directory, name)
+        profiles.append({
+            "id": artifact_id,
+            "created_at": datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec="seconds"),
+            "files": [artifact_id + suffix for suffix in ARTIFACT_SUFFIXES if os.path.exists(os.path.join(directory, artifact_id + suffix))],
+        })
+    profiles.sort(key=lambda p: p["id"], reverse=True)
+    return profiles
+
+
+def artifact_path(filename, directory=PROFILE_ARTIFACTS_DIR):
+    """Path of a saved artifact, or None for anything that is not a plain artifact file name."""
+    if os.path.basename(filename) != filename or not filename.endswith(ARTIFACT_SUFFIXES):
+        return None
+    path = os.path.join(directory, filename)
+    return path if os.path.isfile(path) else None
+
+
+@contextmanager
+def profile_request(label):
+    """
+    Profile the current thread (and threads entering register_thread() from
+    this context) until the block exits, then save the artifacts.
+    session.artifact_id is set once they are written.
+    """
+    profiler = SamplingProfiler()
+    token = _session.set(profiler)
+    profiler.add_thread(threading.get_ident())
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        _session.reset(token)
+        profiler.artifact_id = save_profile(profiler, label)
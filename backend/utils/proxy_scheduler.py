@@ -0,0 +1,285 @@
+"""
+Central scheduler for requests sent through the ZenRows proxy.
+
+    response = zenrows_request("GET", "Blinkit", "search", params, headers=headers)
+
+Every proxied call names its platform and request type (credentials, store,
+serviceability, search). The scheduler adds the API key, charges the call's
+credits (the X-Request-Cost response header, else an estimate from the
+params) to that pair and enforces two budgets. Calls reserve the average cost
+of earlier calls of the same kind up front and settle the difference after.
+
+    per minute   a call that would overflow the sliding minute window waits
+                 up to ZENROWS_MAX_WAIT seconds for credits to free up
+    per day      once spent, every call is refused until UTC midnight
+
+Once either budget is ZENROWS_TIGHT_RATIO spent, calls from platforms that
+return the fewest products per credit are refused as well, and the
+orchestrator reuses credentials bootstrapped for the same geo-cell instead of
+paying for new sessions. Refused calls raise ProxyBudgetExceeded (a
+requests.RequestException, so the handlers' existing error paths apply).
+
+Budgets are per process; with several gunicorn workers divide the account's
+budget between them. 0 disables a budget.
+
+    ZENROWS_CREDITS_PER_MINUTE   default 0
+    ZENROWS_CREDITS_PER_DAY      default 0
+    ZENROWS_TIGHT_RATIO          default 0.8
+    ZENROWS_MAX_WAIT             default 5
+"""
+import os
+import time
+import threading
+from collections import deque
+from dotenv import load_dotenv
+import requests
+
+from .metrics import counter
+from .universal_function import log_debug
+
+load_dotenv()
+
+ZENROWS_URL = 'https://api.zenrows.com/v1/'
+ZENROWS_CREDITS_PER_MINUTE = float(os.getenv('ZENROWS_CREDITS_PER_MINUTE', 0))
+ZENROWS_CREDITS_PER_DAY = float(os.getenv('ZENROWS_CREDITS_PER_DAY', 0))
+ZENROWS_TIGHT_RATIO = float(os.getenv('ZENROWS_TIGHT_RATIO', 0.8))
+ZENROWS_MAX_WAIT = float(os.getenv('ZENROWS_MAX_WAIT', 5))
+
+# A platform yielding less than this share of the median products-per-credit is low value.
+LOW_VALUE_SHARE = 0.5
+# Spend rate for forecasts is taken over the last hour.
+FORECAST_WINDOW = 3600
+
+PROXY_CREDITS = counter("pricely_proxy_credits_total", "ZenRows credits spent", ["platform", "request_type"])
+PROXY_REQUESTS = counter("pricely_proxy_requests_total", "Requests sent through ZenRows", ["platform", "request_type", "result"])
+
+
+class ProxyBudgetExceeded(requests.RequestException):
+    def __init__(self, reason, platform, request_type):
+        super().__init__(f"ZenRows budget: {reason} ({platform} {request_type})")
+        self.reason = reason
+
+
+def estimate_cost(params):
+    """Credits ZenRows charges for a request with these params."""
+    js = str(params.get('js_render', '')).lower() == 'true'
+    premium = str(params.get('premium_proxy', '')).lower() == 'true'
+    if js and premium:
+        return 25
+    if premium:
+        return 10
+    if js:
+        return 5
+    return 1
+
+
+def _utc_day(now=None):
+    return time.strftime("%Y-%m-%d", time.gmtime(now))
+
+
+class ProxyScheduler:
+    def __init__(self, per_minute=ZENROWS_CREDITS_PER_MINUTE, per_day=ZENROWS_CREDITS_PER_DAY,
+                 tight_ratio=ZENROWS_TIGHT_RATIO, max_wait=ZENROWS_MAX_WAIT):
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self.tight_ratio = tight_ratio
+        self.max_wait = max_wait
+        self.day = _utc_day()
+        # (monotonic time, credits) of the last minute / hour
+        self._minute = deque()
+        self._minute_total = 0.0
+        self._hour = deque()
+        # (platform, request_type) -> [calls, credits] for the current UTC day
+        self._usage = {}
+        # platform -> products returned today, for value ranking
+        self._products = {}
+        self._cond = threading.Condition()
+
+    # --- Accounting ---
+
+    def _roll(self, now):
+        """Drop expired window entries and reset the day's totals at UTC midnight. Caller holds the lock."""
+        while self._minute and self._minute[0][0] <= now - 60:
+            self._minute_total -= self._minute.popleft()[1]
+        while self._hour and self._hour[0][0] <= now - FORECAST_WINDOW:
+            self._hour.popleft()
+        day = _utc_day()
+        if day != self.day:
+            self.day = day
+            self._usage = {}
+            self._products = {}
+
+    def _spent_today(self):
+        return sum(credits for _, credits in self._usage.values())
+
+    def _charge(self, platform, request_type, credits, now):
+        self._minute.append((now, credits))
+        self._minute_total += credits
+        self._hour.append((now, credits, platform))
+        row = self._usage.setdefault((platform, request_type), [0, 0.0])
+        row[0] += 1
+        row[1] += credits
+
+    def _adjust(self, platform, request_type, reserved, actual):
+        """Replace a reservation with the credits actually charged."""
+        with self._cond:
+            delta = actual - reserved
+            if delta:
+                now = time.monotonic()
+                self._minute.append((now, delta))
+                self._minute_total += delta
+                self._hour.append((now, delta, platform))
+                self._usage.setdefault((platform, request_type), [0, 0.0])[1] += delta
+            self._cond.notify_all()
+
+    def expected_cost(self, platform, request_type, params):
+        """Average credits of earlier calls of this kind today, else the estimate from params."""
+        with self._cond:
+            calls, credits = self._usage.get((platform, request_type), (0, 0.0))
+        return credits / calls if calls else estimate_cost(params)
+
+    def record_products(self, platform, count):
+        """Products a platform returned for a search; feeds the value ranking."""
+        with self._cond:
+            self._products[platform] = self._products.get(platform, 0) + count
+
+    # --- Budgets ---
+
+    def tight(self):
+        with self._cond:
+            self._roll(time.monotonic())
+            return self._tight()
+
+    def _tight(self):
+        if self.per_day and self._spent_today() >= self.per_day * self.tight_ratio:
+            return True
+        return bool(self.per_minute and self._minute_total >= self.per_minute * self.tight_ratio)
+
+    def _platform_credits(self):
+        credits = {}
+        for (platform, _), (_, spent) in self._usage.items():
+            credits[platform] = credits.get(platform, 0.0) + spent
+        return credits
+
+    def _yields(self):
+        return {platform: self._products.get(platform, 0) / spent
+                for platform, spent in self._platform_credits().items() if spent > 0}
+
+    def _low_value(self, platform):
+        yields = self._yields()
+        if platform not in yields or len(yields) < 2:
+            return False
+        ranked = sorted(yields.values())
+        median = ranked[len(ranked) // 2]
+        return yields[platform] < median * LOW_VALUE_SHARE
+
+    def reserve(self, platform, request_type, credits):
+        """Charge credits for a call about to be made; raises ProxyBudgetExceeded."""
+        deadline = time.monotonic() + self.max_wait
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._roll(now)
+                if self.per_day and self._spent_today() + credits > self.per_day:
+                    reason = "day_budget"
+                elif self._tight() and self._low_value(platform):
+                    reason = "low_value"
+                elif self.per_minute and self._minute_total + credits > self.per_minute:
+                    wait = min(deadline, self._minute[0][0] + 60) - now if self._minute else 0
+                    if wait > 0:
+                        self._cond.wait(wait)
+                        continue
+                    reason = "minute_budget"
+                else:
+                    self._charge(platform, request_type, credits, now)
+                    return
+                PROXY_REQUESTS.inc(platform=platform, request_type=request_type, result=reason)
+                log_debug(f"Refused {platform} {request_type} call: {reason}", "ProxyScheduler", "WARNING")
+                raise ProxyBudgetExceeded(reason, platform, request_type)
+
+    # --- Requests ---
+
+    def request(self, method, platform, request_type, params, **kwargs):
+        params = {**params, 'apikey': os.getenv('ZENROWS_API_KEY')}
+        estimate = self.expected_cost(platform, request_type, params)
+        self.reserve(platform, request_type, estimate)
+        try:
+            response = requests.request(method, ZENROWS_URL, params=params, **kwargs)
+        except requests.RequestException:
+            # Failed connections are not billed.
+            self._adjust(platform, request_type, estimate, 0)
+            PROXY_REQUESTS.inc(platform=platform, request_type=request_type, result="error")
+            raise
+        try:
+            cost = float(response.headers.get('X-Request-Cost', estimate))
+        except ValueError:
+            cost = estimate
+        self._adjust(platform, request_type, estimate, cost)
+        PROXY_CREDITS.inc(cost, platform=platform, request_type=request_type)
+        PROXY_REQUESTS.inc(platform=platform, request_type=request_type, result=str(response.status_code))
+        return response
+
+    # --- Reporting ---
+
+    def usage(self):
+        """Today's spend per platform and request type, window totals and end-of-day forecasts."""
+        with self._cond:
+            now = time.monotonic()
+            self._roll(now)
+            spent = self._spent_today()
+            hour_total, hour_by_platform = 0.0, {}
+            for _, credits, platform in self._hour:
+                hour_total += credits
+                hour_by_platform[platform] = hour_by_platform.get(platform, 0.0) + credits
+            platform_credits = self._platform_credits()
+            yields = self._yields()
+            rows = [
+                {"platform": platform, "request_type": request_type, "calls": calls,
+                 "credits": round(credits, 2), "credits_per_call": round(credits / calls, 2) if calls else 0}
+                for (platform, request_type), (calls, credits) in sorted(self._usage.items())
+            ]
+            platforms = {
+                platform: {
+                    "credits": round(credits, 2),
+                    "products": self._products.get(platform, 0),
+                    "products_per_credit": round(yields.get(platform, 0), 3),
+                    "low_value": self._low_value(platform),
+                }
+                for platform, credits in sorted(platform_credits.items())
+            }
+            minute_total, tight = self._minute_total, self._tight()
+
+        # The last hour's spend rate, projected to UTC midnight.
+        seconds_left = 86400 - time.time() % 86400
+        rate = hour_total / FORECAST_WINDOW
+        forecast = {
+            "credits_per_hour": round(hour_total, 2),
+            "end_of_day": round(spent + rate * seconds_left, 2),
+            "by_platform": {
+                platform: round(platform_credits.get(platform, 0) + credits / FORECAST_WINDOW * seconds_left, 2)
+                for platform, credits in sorted(hour_by_platform.items())
+            },
+            "budget_exhausted_in": None,
+        }
+        if self.per_day and rate > 0:
+            forecast["budget_exhausted_in"] = max(0, round((self.per_day - spent) / rate))
+        for platform in platforms:
+            platforms[platform]["forecast_end_of_day"] = forecast["by_platform"].get(platform, platforms[platform]["credits"])
+
+        return {
+            "day": self.day,
+            "budgets": {"per_minute": self.per_minute, "per_day": self.per_day, "tight_ratio": self.tight_ratio},
+            "spent": {"last_minute": round(minute_total, 2), "today": round(spent, 2)},
+            "tight": tight,
+            "platforms": platforms,
+            "requests": rows,
+            "forecast": forecast,
+        }
+
+
+proxy_scheduler = ProxyScheduler()
+
+
+def zenrows_request(method, platform, request_type, params, **kwargs):
+    """Send a request through ZenRows via the shared scheduler. params need no apikey."""
+    return proxy_scheduler.request(method, platform, request_type, params, **kwargs)
@@ -0,0 +1,223 @@
+import os
+import gzip
+import json
+from dotenv import load_dotenv
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+load_dotenv()
+
+# Smaller bodies fit in a packet or two anyway; compressing them only costs CPU.
+COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', 1024))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', 5))
+
+COMPACT_SCHEMA = "compact-v1"
+GROUP_FIELDS = ("name", "image", "price")
+PRICE_FIELDS = ("store", "price", "quantity", "url")
+
+# =============================================== JSON ===================================================
+
+def dumps(obj):
+    """Serialize to UTF-8 JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS, default=str)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False, default=str).encode('utf-8')
+
+
+def install_json_provider(app):
+    """Make jsonify() use orjson for every route of a Flask app."""
+    if orjson is None:
+        return
+    from flask.json.provider import DefaultJSONProvider
+
+    class OrjsonProvider(DefaultJSONProvider):
+        def dumps(self, obj, **kwargs):
+            return dumps(obj).decode('utf-8')
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+        def response(self, *args, **kwargs):
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(dumps(obj), mimetype=self.mimetype)
+
+    app.json = OrjsonProvider(app)
+
+# =============================================== COMPRESSION ===================================================
+
+def negotiate_encoding(accept_encoding):
+    """
+    Pick br or gzip from an Accept-Encoding header value, or None: the
+    highest-q encoding the server supports, br before gzip on a tie. "*"
+    stands for any encoding the header does not list by name.
+    """
+    offered = {}
+    for part in (accept_encoding or "").split(","):
+        token, *params = [piece.strip() for piece in part.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if token:
+            offered[token.lower()] = quality
+    supported = ("br", "gzip") if brotli is not None else ("gzip",)
+    best, best_quality = None, 0.0
+    for encoding in supported:
+        quality = offered.get(encoding, offered.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+
+def compress_response(response, accept_encoding):
+    """Flask after_request helper: compress large JSON bodies the client can decode."""
+    if (response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or response.mimetype != 'application/json'):
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESSION_MIN_BYTES:
+        return response
+    encoding = negotiate_encoding(accept_encoding)
+    response.vary.add('Accept-Encoding')
+    if encoding is None:
+        return response
+    response.set_data(compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # Bytes differ per encoding, so the validator can only stay as a weak ETag.
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+# =============================================== SEARCH RESPONSE SHAPES ===================================================
+
+def parse_fields(fields):
+    """
+    'name,price.store,price.price' -> ({'name', 'price'}, {'store', 'price'}).
+    None means everything; 'price' alone keeps every price field.
+    """
+    if not fields:
+        return None, None
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    group_fields, price_fields = set(), set()
+    for field in (f.strip() for f in fields):
+        if field.startswith("price."):
+            group_fields.add("price")
+            price_fields.add(field[len("price."):])
+        elif field:
+            group_fields.add(field)
+    return group_fields & set(GROUP_FIELDS), (price_fields & set(PRICE_FIELDS)) or None
+
+
+def url_prefix(url):
+    # scheme://host/first-segment/ is shared by every product link of a store.
+    scheme_end = url.find("://")
+    if scheme_end == -1:
+        return ""
+    host_end = url.find("/", scheme_end + 3)
+    if host_end == -1:
+        return ""
+    segment_end = url.find("/", host_end + 1)
+    if segment_end == -1:
+        return url[:host_end + 1]
+    return url[:segment_end + 1]
+
+
+def trim_groups(groups, fields):
+    group_fields, price_fields = parse_fields(fields)
+    if group_fields is None:
+        return groups
+    trimmed = []
+    for group in groups:
+        item = {k: v for k, v in group.items() if k in group_fields}
+        if "price" in item and price_fields is not None:
+            item["price"] = [{k: v for k, v in entry.items() if k in price_fields} for entry in group["price"]]
+        trimmed.append(item)
+    return trimmed
+
+
+def compact_groups(groups, fields=None):
+    """
+    Dictionary-encode store names and URL prefixes. Price entries become
+    arrays ordered like price_fields, with the url as [prefix_index, suffix].
+    """
+    group_fields, price_fields = parse_fields(fields)
+    group_fields = [f for f in GROUP_FIELDS if group_fields is None or f in group_fields]
+    price_fields = [f for f in PRICE_FIELDS if price_fields is None or f in price_fields]
+    stores, store_ids = [], {}
+    prefixes, prefix_ids = [], {}
+
+    def intern(value, values, ids):
+        if value not in ids:
+            ids[value] = len(values)
+            values.append(value)
+        return ids[value]
+
+    compact = []
+    for group in groups:
+        item = [group.get(f) for f in group_fields if f != "price"]
+        if "price" in group_fields:
+            entries = []
+            for entry in group.get("price", []):
+                row = []
+                for f in price_fields:
+                    value = entry.get(f)
+                    if f == "store":
+                        value = intern(value, stores, store_ids)
+                    elif f == "url" and value:
+                        prefix = url_prefix(value)
+                        value = [intern(prefix, prefixes, prefix_ids), value[len(prefix):]]
+                    row.append(value)
+                entries.append(row)
+            item.append(entries)
+        compact.append(item)
+
+    return {
+        "schema": COMPACT_SCHEMA,
+        "group_fields": group_fields,
+        "price_fields": price_fields,
+        "stores": stores,
+        "url_prefixes": prefixes,
+        "groups": compact,
+    }
+
+
+def shape_search_result(result, compact=False, fields=None):
+    """Apply the optional compact schema and/or field trimming to get_compared_data_async output."""
+    if not compact and not fields:
+        return result
+    groups = result.get("data", []) if isinstance(result, dict) else result
+    if not isinstance(groups, list) or not all(isinstance(g, dict) for g in groups):
+        return result
+    shaped = dict(result) if isinstance(result, dict) else None
+    if compact:
+        shaped_groups = compact_groups(groups, fields)
+    else:
+        shaped_groups = trim_groups(groups, fields)
+    if not isinstance(result, dict):
+        return shaped_groups
+    shaped["data"] = shaped_groups
+    return shaped
@@ -0,0 +1,227 @@
+"""
+Search result cache and the background refresher that keeps hot entries warm.
+
+Results are cached per (normalized query, geo-cell) for SEARCH_CACHE_TTL
+seconds. Every search also bumps the query's popularity in its cell (an
+exponentially decaying count), and the trending_and_daily_needs items count
+as popular in every active cell (one searched within SEARCH_ACTIVE_CELL_WINDOW).
+
+Every SEARCH_REFRESH_INTERVAL seconds the refresher takes the top
+SEARCH_REFRESH_TOP_N queries of each active cell and re-runs those whose
+entry is missing or expires within SEARCH_REFRESH_AHEAD seconds, most popular
+first. Refreshes spend from a bucket of SEARCH_REFRESH_BUDGET searches per
+hour and stop altogether while the proxy budget is tight, so user searches
+always come first. The cache and counts are per process, and every worker
+refreshes its own; SEARCH_REFRESH_BUDGET is for the whole server, so each
+worker spends a 1/SEARCH_REFRESH_WORKERS share of it (serve.py passes its
+gunicorn worker count instead).
+
+    SEARCH_CACHE_TTL            seconds a result is served from cache (default 900)
+    SEARCH_REFRESH_ENABLED      0 disables the refresher (default 1)
+    SEARCH_REFRESH_INTERVAL     seconds between refresh passes (default 60)
+    SEARCH_REFRESH_AHEAD        refresh entries this close to expiry (default 180)
+    SEARCH_REFRESH_TOP_N        queries kept warm per cell (default 20)
+    SEARCH_REFRESH_BUDGET       background searches per hour, all workers together (default 120)
+    SEARCH_REFRESH_WORKERS      processes sharing that budget (default: WEB_CONCURRENCY, else 1)
+    SEARCH_ACTIVE_CELL_WINDOW   seconds a cell stays active after a search (default 3600)
+    SEARCH_POPULARITY_HALF_LIFE seconds for a search's weight to halve (default 3600)
+"""
+import os
+import re
+import time
+import threading
+from dotenv import load_dotenv
+
+from .cache_handler import TTLCache
+from .metrics import counter
+from .proxy_scheduler import proxy_scheduler
+from .supabase_handler import select_data
+from .universal_function import log_debug
+
+load_dotenv()
+
+SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', 900))
+SEARCH_REFRESH_ENABLED = os.getenv('SEARCH_REFRESH_ENABLED', '1') != '0'
+SEARCH_REFRESH_INTERVAL = float(os.getenv('SEARCH_REFRESH_INTERVAL', 60))
+SEARCH_REFRESH_AHEAD = float(os.getenv('SEARCH_REFRESH_AHEAD', 180))
+SEARCH_REFRESH_TOP_N = int(os.getenv('SEARCH_REFRESH_TOP_N', 20))
+SEARCH_REFRESH_BUDGET = float(os.getenv('SEARCH_REFRESH_BUDGET', 120))
+# uvicorn --workers defaults to WEB_CONCURRENCY, so that is the usual process count.
+SEARCH_REFRESH_WORKERS = int(os.getenv('SEARCH_REFRESH_WORKERS', os.getenv('WEB_CONCURRENCY', 1)))
+SEARCH_ACTIVE_CELL_WINDOW = float(os.getenv('SEARCH_ACTIVE_CELL_WINDOW', 3600))
+SEARCH_POPULARITY_HALF_LIFE = float(os.getenv('SEARCH_POPULARITY_HALF_LIFE', 3600))
+
+# Weight of a trending/daily-needs item in every active cell: about one recent search.
+SEED_SCORE = 1.0
+# Decayed scores below this are forgotten.
+MIN_SCORE = 0.05
+SEED_REFRESH_INTERVAL = 3600
+
+SEARCH_REFRESHES = counter("pricely_search_refreshes_total", "Background search cache refreshes", ["result"])
+
+# (normalized query, geo-cell) -> {"data", "fetched_at"}
+search_result_cache = TTLCache("search_results", SEARCH_CACHE_TTL, max_entries=20000)
+
+
+def normalize_query(query):
+    return re.sub(r"\s+", " ", str(query or "").strip().lower())
+
+
+def cache_fresh(entry, ahead=0):
+    """True while entry has more than `ahead` seconds to live."""
+    return entry is not None and time.time() - entry["fetched_at"] < SEARCH_CACHE_TTL - ahead
+
+
+class QueryPopularity:
+    def __init__(self, half_life=SEARCH_POPULARITY_HALF_LIFE):
+        self.half_life = half_life
+        # cell -> {query: (score, updated_at)}
+        self._scores = {}
+        # cell -> (lat, lon, last_seen)
+        self._cells = {}
+        self.seeds = []
+        self._lock = threading.Lock()
+
+    def _decayed(self, score, updated_at, now):
+        return score * 0.5 ** ((now - updated_at) / self.half_life)
+
+    def record(self, query, cell, lat, lon):
+        query = normalize_query(query)
+        if not query or cell is None:
+            return
+        now = time.time()
+        with self._lock:
+            queries = self._scores.setdefault(cell, {})
+            score, updated_at = queries.get(query, (0.0, now))
+            queries[query] = (self._decayed(score, updated_at, now) + 1, now)
+            self._cells[cell] = (lat, lon, now)
+
+    def active_cells(self, window=SEARCH_ACTIVE_CELL_WINDOW):
+        """{cell: (lat, lon)} for cells searched within the window."""
+        cutoff = time.time() - window
+        with self._lock:
+            return {cell: (lat, lon) for cell, (lat, lon, seen) in self._cells.items() if seen >= cutoff}
+
+    def top(self, cell, n=SEARCH_REFRESH_TOP_N):
+        """[(query, score)] for the cell, best first, trending seeds included."""
+        now = time.time()
+        with self._lock:
+            scores = {query: self._decayed(score, updated_at, now)
+                      for query, (score, updated_at) in self._scores.get(cell, {}).items()}
+            for seed in self.seeds:
+                scores[seed] = scores.get(seed, 0.0) + SEED_SCORE
+        return sorted(scores.items(), key=lambda item: -item[1])[:n]
+
+    def prune(self, window=SEARCH_ACTIVE_CELL_WINDOW):
+        now = time.time()
+        with self._lock:
+            for cell in list(self._cells):
+                if self._cells[cell][2] < now - window:
+                    del self._cells[cell]
+                    self._scores.pop(cell, None)
+                    continue
+                queries = self._scores.get(cell, {})
+                for query, (score, updated_at) in list(queries.items()):
+                    if self._decayed(score, updated_at, now) < MIN_SCORE:
+                        del queries[query]
+
+
+class SearchRefresher:
+    def __init__(self, popularity, budget_per_hour=SEARCH_REFRESH_BUDGET, interval=SEARCH_REFRESH_INTERVAL,
+                 ahead=SEARCH_REFRESH_AHEAD, top_n=SEARCH_REFRESH_TOP_N):
+        self.popularity = popularity
+        # Searches per hour for the whole server; budget_per_hour is this process's share.
+        self.server_budget = budget_per_hour
+        self.budget_per_hour = budget_per_hour
+        self.interval = interval
+        self.ahead = ahead
+        self.top_n = top_n
+        self._tokens = budget_per_hour * interval / 3600
+        self._tokens_at = time.monotonic()
+        self._seeded_at = None
+        self._search = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _refill(self):
+        now = time.monotonic()
+        # At most one pass worth of unused budget carries over.
+        cap = max(1.0, self.budget_per_hour * self.interval / 3600)
+        self._tokens = min(cap, self._tokens + (now - self._tokens_at) * self.budget_per_hour / 3600)
+        self._tokens_at = now
+
+    def load_seeds(self):
+        rows = select_data("trending_and_daily_needs")
+        self.popularity.seeds = sorted({normalize_query(row['name']) for row in rows if row.get('name')})
+        self._seeded_at = time.monotonic()
+
+    def candidates(self):
+        """[(score, query, cell, lat, lon)] whose cache entry is missing or about to expire, best first."""
+        due = []
+        for cell, (lat, lon) in self.popularity.active_cells().items():
+            for query, score in self.popularity.top(cell, self.top_n):
+                if not cache_fresh(search_result_cache.peek((query, cell)), self.ahead):
+                    due.append((score, query, cell, lat, lon))
+        due.sort(key=lambda item: -item[0])
+        return due
+
+    def refresh_once(self):
+        """One pass; returns the number of searches refreshed."""
+        if self._seeded_at is None or time.monotonic() - self._seeded_at > SEED_REFRESH_INTERVAL:
+            try:
+                self.load_seeds()
+            except Exception as e:
+                log_debug(f"Could not load trending seeds: {e}", "SearchRefresh", "WARNING")
+                self._seeded_at = time.monotonic()
+        self.popularity.prune()
+        self._refill()
+        refreshed = 0
+        for score, query, cell, lat, lon in self.candidates():
+            if self._stop.is_set():
+                break
+            if self._tokens < 1:
+                SEARCH_REFRESHES.inc(result="over_budget")
+                break
+            if proxy_scheduler.tight():
+                SEARCH_REFRESHES.inc(result="proxy_budget_tight")
+                break
+            self._tokens -= 1
+            try:
+                self._search(query, lat, lon)
+                SEARCH_REFRESHES.inc(result="refreshed")
+                refreshed += 1
+            except Exception as e:
+                SEARCH_REFRESHES.inc(result="failed")
+                log_debug(f"Refresh of '{query}' in {cell} failed: {e}", "SearchRefresh", "ERROR")
+        return refreshed
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                refreshed = self.refresh_once()
+                if refreshed:
+                    log_debug(f"Refreshed {refreshed} cached searches", "SearchRefresh", "INFO")
+            except Exception as e:
+                log_debug(f"Refresh pass failed: {e}", "SearchRefresh", "ERROR")
+
+    def start(self, search, workers=SEARCH_REFRESH_WORKERS):
+        """
+        Refresh in a daemon thread (one per process); search(query, lat, lon)
+        re-runs and caches a search. workers is the number of processes
+        refreshing side by side, which split the hourly budget between them.
+        """
+        self._search = search
+        self.budget_per_hour = self.server_budget / max(1, workers)
+        self._tokens = min(self._tokens, self.budget_per_hour * self.interval / 3600)
+        if not SEARCH_REFRESH_ENABLED or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name="search-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+search_popularity = QueryPopularity()
+search_refresher = SearchRefresher(search_popularity)
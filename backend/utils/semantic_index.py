@@ -0,0 +1,97 @@
+import os
+import sys
+import json
+import threading
+from functools import lru_cache
+import numpy as np
+from dotenv import load_dotenv
+
+# LOCAL IMPORTS
+from .universal_function import log_debug
+from .comparison_algorithm import get_embedding_model
+
+load_dotenv()
+
+SEMANTIC_INDEX_DIR = os.getenv(
+    'SEMANTIC_INDEX_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'semantic_index')
+)
+NAMES_FILE = 'names.json'
+EMBEDDINGS_FILE = 'embeddings.f16.npy'
+# Rows scored per matmul; keeps the float32 working copy of the mmap small.
+SCORE_CHUNK_ROWS = 4096
+
+
+def build_semantic_index(names, out_dir=SEMANTIC_INDEX_DIR, batch_size=256):
+    """Embed names offline and write them as a normalized float16 matrix plus a names file."""
+    names = list(dict.fromkeys(name for name in names if name))
+    model = get_embedding_model()
+    embeddings = model.encode(names, batch_size=batch_size, normalize_embeddings=True, show_progress_bar=True)
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, EMBEDDINGS_FILE), np.asarray(embeddings, dtype=np.float16))
+    with open(os.path.join(out_dir, NAMES_FILE), 'w', encoding='utf-8') as f:
+        json.dump(names, f, ensure_ascii=False)
+    log_debug(f"Semantic index built with {len(names)} names in {out_dir}", "SemanticIndex", "SUCCESS")
+    return len(names)
+
+
+@lru_cache(maxsize=4096)
+def _embed_query(query):
+    """Normalized float32 embedding of a lowercased query; repeated keystrokes hit the cache."""
+    return get_embedding_model().encode(query, normalize_embeddings=True, show_progress_bar=False).astype(np.float32)
+
+
+class SemanticIndex:
+    """Nearest-neighbour lookup over a memory-mapped float16 embedding matrix."""
+
+    def __init__(self, index_dir=SEMANTIC_INDEX_DIR):
+        self.index_dir = index_dir
+        self.names = None
+        self.matrix = None
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        # Both files or neither: without names the matrix is useless, and callers fall back to prefix mode.
+        return all(os.path.exists(os.path.join(self.index_dir, name)) for name in (EMBEDDINGS_FILE, NAMES_FILE))
+
+    def load(self):
+        with self._lock:
+            if self.matrix is not None:
+                return
+            with open(os.path.join(self.index_dir, NAMES_FILE), encoding='utf-8') as f:
+                self.names = json.load(f)
+            # mmap: pages are shared between workers and only touched rows are resident.
+            self.matrix = np.load(os.path.join(self.index_dir, EMBEDDINGS_FILE), mmap_mode='r')
+        log_debug(f"Semantic index mapped: {' x '.join(map(str, self.matrix.shape))}", "SemanticIndex", "INFO")
+
+    def search(self, query, limit=5):
+        if not query:
+            return []
+        if self.matrix is None:
+            self.load()
+        rows = self.matrix.shape[0]
+        if rows == 0 or limit <= 0:
+            return []
+        query_vector = _embed_query(query.lower())
+        scores = np.empty(rows, dtype=np.float32)
+        for start in range(0, rows, SCORE_CHUNK_ROWS):
+            chunk = np.asarray(self.matrix[start:start + SCORE_CHUNK_ROWS], dtype=np.float32)
+            scores[start:start + len(chunk)] = chunk @ query_vector
+        limit = min(limit, rows)
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [self.names[i] for i in top.tolist()]
+
+
+semantic_index = SemanticIndex()
+
+
+if __name__ == "__main__":
+    # python -m utils.semantic_index [extra_names.json ...]
+    from .supabase_handler import select_rows_paginated
+    names = [row['name'] for row in select_rows_paginated("autosuggest", "id, name")]
+    for path in sys.argv[1:]:
+        with open(path, encoding='utf-8') as f:
+            names.extend(json.load(f))
+    build_semantic_index(names)
@@ -4,6 +4,9 @@ from typing import Dict, Any, List, Optional
 import hashlib
 from dotenv import load_dotenv
 
+# LOCAL IMPORTS
+from .cache_handler import analytics_cache
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -27,6 +30,23 @@ def select_data(table: str, query_params: Optional[Dict[str, Any]] = None) -> Li
     except Exception as e:
         raise Exception(f"Error selecting data from {table}: {str(e)}")
 
+def select_rows_paginated(table: str, columns: str = "*", after_id: Optional[int] = None, page_size: int = 1000) -> List[Dict[str, Any]]:
+    # PostgREST caps a single response (1000 rows by default), so walk the table by id.
+    rows = []
+    try:
+        start = 0
+        while True:
+            query = supabase.table(table).select(columns).order("id")
+            if after_id is not None:
+                query = query.gt("id", after_id)
+            response = query.range(start, start + page_size - 1).execute()
+            rows.extend(response.data)
+            if len(response.data) < page_size:
+                return rows
+            start += page_size
+    except Exception as e:
+        raise Exception(f"Error selecting data from {table}: {str(e)}")
+
 def insert_data(table: str, data: Dict[str, Any]) -> Dict[str, Any]:
     try:
         response = supabase.table(table).insert(data).execute()
@@ -88,22 +108,52 @@ def login(number, password):
     else:
         return {"status": "success", "user": users[0]}
     
-def tanddn():
+def format_tanddn(data):
+    return {
+        "trending": [
+            {"url": i['image_url'], "name": i['name']} 
+            for i in data if i['column_type'] == "trending"
+        ], 
+        "daily_needs": [
+            {"url": i['image_url'], "name": i['name']} 
+            for i in data if i['column_type'] == "daily needs"
+        ]
+    }
+
+def tanddn(data=None):
     try:
-        data = select_data("trending_and_daily_needs")
-        print(data)
+        if data is None:
+            data = select_data("trending_and_daily_needs")
         return {
             "status": "success", 
-            "data": {
-                "trending": [
-                    {"url": i['image_url'], "name": i['name']} 
-                    for i in data if i['column_type'] == "trending"
-                ], 
-                "daily_needs": [
-                    {"url": i['image_url'], "name": i['name']} 
-                    for i in data if i['column_type'] == "daily needs"
-                ]
-            }
+            "data": format_tanddn(data)
         }
     except Exception as e:
-        return {"status": "error", "message": str(e)}
\ No newline at end of file
+        return {"status": "error", "message": str(e)}
+
+# ================================================ ADMIN FUNCTIONS ===================================================
+
+def get_customer_analytics_snapshot(months_back: int = 6) -> Dict[str, Any]:
+    # One RPC (see sql/customer_analytics_snapshot.sql) instead of a query per counter.
+    cached = analytics_cache.get(months_back)
+    if cached is not None:
+        return cached
+    try:
+        response = supabase.rpc("customer_analytics_snapshot", {"months_back": months_back}).execute()
+    except Exception as e:
+        raise Exception(f"Error fetching customer analytics snapshot: {str(e)}")
+    analytics_cache.set(months_back, response.data)
+    return response.data
+
+# ================================================ AUTH FUNCTIONS ===================================================
+
+def insert_revoked_token(jti: str, expires_at: int) -> Dict[str, Any]:
+    return insert_data("revoked_tokens", {"jti": jti, "expires_at": expires_at})
+
+def select_revoked_tokens(now: int) -> List[Dict[str, Any]]:
+    # Only revocations whose tokens have not expired yet still matter.
+    try:
+        response = supabase.table("revoked_tokens").select("jti, expires_at").gt("expires_at", now).execute()
+        return response.data
+    except Exception as e:
+        raise Exception(f"Error selecting data from revoked_tokens: {str(e)}")
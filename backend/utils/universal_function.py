@@ -8,75 +8,35 @@ import time
 import random
 import re
 
+from .cache_handler import geocode_cache
+from .log_handler import log
+
 load_dotenv()
 
 
-# Log level configurations
-DEBUG = True
-ERROR = True
-SUCCESS = True
-INFO = True
-WARNING = True
+def log_debug(data, name=None, level="DEBUG", *args):
+    """
+    Queue a log record; formatting and writing happen on the log writer thread.
+    Pass format args instead of an f-string for large values:
+        log_debug("Final compared data: %s", "Orchestrator", "DEBUG", data)
+    """
+    log(data, name, level, *args)
 
-def log_debug(data, name=None, level="DEBUG"):
-    # Check the appropriate flag based on the log level
-    level_upper = level.upper()
-    should_log = False
-    
-    if level_upper == "DEBUG" and DEBUG:
-        should_log = True
-    elif level_upper == "ERROR" and ERROR:
-        should_log = True
-    elif level_upper == "SUCCESS" and SUCCESS:
-        should_log = True
-    elif level_upper == "INFO" and INFO:
-        should_log = True
-    elif level_upper == "WARNING" and WARNING:
-        should_log = True
-    
-    if should_log:
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        if isinstance(data, (dict, list)):
-            data = json.dumps(data, indent=2)
-        
-        message = f"[{timestamp}] [{level}] {name}: {data}" if name else f"[{timestamp}] [{level}] {data}"
-        
-        # Colors for different log levels
-        colors = {
-            "DEBUG": ("yellow", "\033[33m"),     # Yellow
-            "ERROR": ("red", "\033[31m"),        # Red
-            "SUCCESS": ("green", "\033[32m"),    # Green
-            "INFO": ("cyan", "\033[36m"),        # Cyan
-            "WARNING": ("orange", "\033[33m"),   # Orange (using yellow ANSI)
-        }
-        
-        # Default to no color if level not found
-        html_color, ansi_color = colors.get(level_upper, ("black", ""))
-        reset_code = "\033[0m"
-        
-        # Check if running in Jupyter notebook
-        try:
-            # If get_ipython exists and is in notebook, we're in Jupyter
-            shell = get_ipython().__class__.__name__
-            if shell == 'ZMQInteractiveShell':  # Jupyter notebook or qtconsole
-                from IPython.display import display, HTML
-                colored_message = f"<span style='color:{html_color}'>{message}</span>"
-                display(HTML(colored_message))
-                return
-        except (NameError, ImportError):
-            # Not in Jupyter, use ANSI colors for terminal
-            pass
-            
-        # Standard terminal output with ANSI colors
-        colored_message = f"{ansi_color}{message}{reset_code}" if ansi_color else message
-        print(colored_message)
-
-def geocode_location(location_name, api_key=random.choice(os.getenv('Google_map_api_key', '').split())):
+def get_google_api_key():
+    # Read per call: a default argument would freeze one key (or crash) at import time.
+    api_keys = os.getenv('Google_map_api_key', '').split()
+    return random.choice(api_keys) if api_keys else None
+
+def geocode_location(location_name, api_key=None):
+    api_key = api_key or get_google_api_key()
     try:
         if not location_name:
             return {"error": "Location name is required"}
         if not api_key:
             return {"error": "API key is required"}
+        cached = geocode_cache.get(location_name)
+        if cached is not None:
+            return cached
         geocode_url = "https://maps.googleapis.com/maps/api/geocode/json"
         params = {
             'address': location_name,
@@ -88,6 +48,7 @@ def geocode_location(location_name, api_key=random.choice(os.getenv('Google_map_
         if data.get('status') != 'OK':
             error_message = data.get('error_message', 'Unknown error occurred')
             return {"error": error_message}
+        geocode_cache.set(location_name, data)
         return data
     except requests.exceptions.RequestException as e:
         error_message = f"Request failed: {str(e)}"
@@ -96,7 +57,8 @@ def geocode_location(location_name, api_key=random.choice(os.getenv('Google_map_
         error_message = f"Unexpected error: {str(e)}"
         return {"error": error_message}
 
-def get_place_autocomplete(input_query, api_key= random.choice(os.getenv('Google_map_api_key').split()), language='en', types='geocode'):
+def get_place_autocomplete(input_query, api_key=None, language='en', types='geocode'):
+    api_key = api_key or get_google_api_key()
     try:
         if not input_query:
             log_debug("Input query is required", "Error", "ERROR")
@@ -134,6 +96,17 @@ def get_place_autocomplete(input_query, api_key= random.choice(os.getenv('Google
         error_message = f"Unexpected error: {str(e)}"
         return {"error": error_message}
     
+def geo_cell_key(lat, lng, precision=3):
+    # ~110m cells at 3 decimals: close enough that platforms resolve the same store.
+    return f"{round(float(lat), precision)},{round(float(lng), precision)}"
+
+def get_geo_cell(location_data, precision=3):
+    try:
+        location = location_data['results'][0]['geometry']['location']
+        return geo_cell_key(location['lat'], location['lng'], precision)
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+
 def parse_cookies(cookie_string):
     cookie_dict = {}
     if not cookie_string: